@@ -3,7 +3,15 @@ from flask_cors import CORS
 import psycopg2
 import os
 from dotenv import load_dotenv
-from db import get_db_connection
+from db import get_db_connection, init_app as init_db
+from utils.auth import init_app as init_auth
+from utils.dispatch import init_app as init_dispatch
+from utils.outbox import init_app as init_outbox
+from utils.notification_retention import init_app as init_notification_retention
+from utils.stats import init_app as init_stats
+from utils.rollups import init_app as init_rollups
+from utils.exports import init_app as init_exports
+from utils.hashing import HashingBusy
 from routes.auth import auth_bp  # Add this import if register_routes is defined in routes.py
 from routes.orders import orders_bp
 from routes.deliveries import deliveries_bp
@@ -28,6 +36,14 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv("SECRET_KEY", "change_me")
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+init_db(app)
+init_auth(app)
+init_dispatch(app)
+init_outbox(app)
+init_notification_retention(app)
+init_stats(app)
+init_rollups(app)
+init_exports(app)
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(orders_bp)
@@ -50,6 +66,14 @@ app.register_blueprint(role_switch_bp)
 # Register health and db check routes
 register_routes(app)
 
+# Password hashing pool saturated: ask the client to back off
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    response = jsonify({"ok": False, "error": "Server is busy, please retry shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
 # Serve uploaded files
 @app.route('/uploads/<path:filename>')
 def serve_upload(filename):
@@ -0,0 +1,114 @@
+"""
+Benchmark: daily analytics series, ad hoc aggregate vs rollups.
+
+Inserts --orders synthetic orders (with payments) spread over --days days,
+then times a 30 day daily series split by service_type computed straight
+from app.orders and app.payments, against the same series read from
+app.order_rollups_daily through utils/rollups.series(). Also times the
+rollup refresh itself: the full build and an incremental refresh of the
+lookback window.
+
+Runs against the configured database inside one transaction that is rolled
+back.
+
+    python benchmarks/bench_analytics.py
+    python benchmarks/bench_analytics.py --orders 1000000 --days 365
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import datetime
+import time
+import psycopg2.extras
+from db import get_db_connection
+from utils import rollups
+
+AD_HOC_SQL = """
+    SELECT date_trunc('day', o.created_at)::date AS bucket, o.service_type,
+           COUNT(*) AS orders,
+           COUNT(*) FILTER (WHERE o.status = 'COMPLETED') AS completed,
+           COUNT(*) FILTER (WHERE o.status = 'CANCELED') AS canceled,
+           ROUND(COUNT(*) FILTER (WHERE o.status = 'COMPLETED')::numeric / COUNT(*), 4) AS completion_rate,
+           COALESCE(SUM(p.amount), 0) AS revenue,
+           ROUND(AVG(o.distance_km), 2) AS avg_distance_km,
+           ROUND(AVG(o.price_estimate), 2) AS avg_price
+      FROM app.orders o
+      LEFT JOIN (SELECT order_id, SUM(amount) AS amount FROM app.payments
+                  WHERE status = 'SUCCESS' GROUP BY order_id) p ON p.order_id = o.order_id
+     WHERE o.created_at >= %s AND o.created_at < %s
+     GROUP BY 1, 2
+     ORDER BY 1, 2;
+"""
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cur.execute("SELECT LOCALTIMESTAMP AS now;")
+        now = cur.fetchone()["now"]
+        oldest = now - datetime.timedelta(days=args.days)
+        print(f"Inserting {args.orders} orders over {args.days} days...")
+        cur.execute("""
+            WITH o AS (
+                INSERT INTO app.orders (pickup_address, delivery_address, status, service_type, package_size,
+                                        distance_km, price_estimate, created_at)
+                SELECT 'bench pickup', 'bench drop',
+                       (ARRAY['COMPLETED', 'COMPLETED', 'CANCELED', 'PENDING'])[1 + g %% 4],
+                       (ARRAY['bike', 'car', 'truck'])[1 + g %% 3],
+                       (ARRAY['small', 'medium', 'large'])[1 + g %% 5 %% 3],
+                       1 + g %% 20, 15000 + g %% 50000,
+                       %s + (%s - %s) * random()
+                  FROM generate_series(1, %s) g
+             RETURNING order_id, status, price_estimate
+            )
+            INSERT INTO app.payments (order_id, amount, method, status)
+            SELECT order_id, price_estimate, 'CASH', CASE WHEN status = 'COMPLETED' THEN 'SUCCESS' ELSE 'PENDING' END
+              FROM o;
+        """, (oldest, now, oldest, args.orders))
+        cur.execute("ANALYZE app.orders; ANALYZE app.payments;")
+
+        start = oldest.replace(minute=0, second=0, microsecond=0)
+        end = now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+
+        full_ms = timed(lambda: (rollups._refresh_hours(cur, start, end), rollups._refresh_days(cur, start, end)), 1)
+        lookback = end - datetime.timedelta(hours=rollups.ROLLUP_LOOKBACK_HOURS + 1)
+        incremental_ms = timed(lambda: (rollups._refresh_hours(cur, lookback, end),
+                                        rollups._refresh_days(cur, lookback, end)), args.repeat)
+
+        since = now - datetime.timedelta(days=30)
+        ad_hoc_ms = timed(lambda: (cur.execute(AD_HOC_SQL, (since, now)), cur.fetchall()), args.repeat)
+        rollup_ms = timed(lambda: rollups.series(cur, "day", since, now, ["service_type"]), args.repeat)
+
+        print(f"{'step':>28} {'ms':>9}")
+        print(f"{'full rollup build':>28} {full_ms:>9.1f}")
+        print(f"{'incremental refresh':>28} {incremental_ms:>9.1f}")
+        print(f"{'30 day series, ad hoc':>28} {ad_hoc_ms:>9.2f}")
+        print(f"{'30 day series, rollups':>28} {rollup_ms:>9.2f}")
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
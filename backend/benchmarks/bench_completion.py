@@ -0,0 +1,134 @@
+"""
+Benchmark: delivery completion cascade, per-order loop vs set-based.
+
+For deliveries of growing size, completes the delivery the old way (one
+UPDATE app.payments per order, then the wallet, ledger, tracking and one
+notification per customer) and the set-based way (routes/deliveries.py
+CASCADE_SQL plus one tracking insert and one multi-row notification insert).
+Reports statements sent to the database and elapsed time; --rtt-ms adds a
+simulated network round-trip per statement.
+
+Runs against the configured database inside one transaction that is rolled
+back, using an existing shipper and customer.
+
+    python benchmarks/bench_completion.py
+    python benchmarks/bench_completion.py --sizes 1,10,100,1000 --rtt-ms 1
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import psycopg2.extras
+from db import get_db_connection
+from routes.deliveries import CASCADE_SQL
+
+
+class CountingCursor(psycopg2.extras.RealDictCursor):
+    rtt = 0.0
+    statements = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.statements += 1
+        if CountingCursor.rtt:
+            time.sleep(CountingCursor.rtt)
+        return super().execute(query, vars)
+
+
+def setup(cur, shipper_id, customer_id, size):
+    cur.execute("INSERT INTO app.deliveries (shipper_id, status) VALUES (%s, 'ONGOING') RETURNING delivery_id;",
+                (shipper_id,))
+    delivery_id = cur.fetchone()["delivery_id"]
+    cur.execute("""
+        WITH o AS (
+            INSERT INTO app.orders (customer_id, pickup_address, delivery_address, status, price_estimate, delivery_id)
+            SELECT %s, 'bench pickup', 'bench drop', 'ONGOING', 20000 + g, %s FROM generate_series(1, %s) g
+         RETURNING order_id, price_estimate
+        )
+        INSERT INTO app.payments (order_id, amount, method, status)
+        SELECT order_id, price_estimate, 'CASH', 'PENDING' FROM o;
+    """, (customer_id, delivery_id, size))
+    return delivery_id
+
+
+def complete_loop(cur, delivery_id, shipper_id):
+    cur.execute("UPDATE app.orders SET status = 'COMPLETED' WHERE delivery_id = %s RETURNING order_id, price_estimate;",
+                (delivery_id,))
+    orders = cur.fetchall()
+    for o in orders:
+        cur.execute("""
+            UPDATE app.payments SET status = 'SUCCESS', paid_at = NOW()
+             WHERE order_id = %s AND method = 'CASH' AND status = 'PENDING';
+        """, (o["order_id"],))
+    total = sum(o["price_estimate"] or 0 for o in orders)
+    cur.execute("UPDATE app.shipper_wallets SET balance = balance + %s, updated_at = NOW() WHERE shipper_id = %s RETURNING balance;",
+                (total, shipper_id))
+    balance = cur.fetchone()["balance"]
+    cur.execute("""
+        INSERT INTO app.shipper_wallet_transactions (shipper_id, amount, type, ref_delivery_id, note, balance_after, created_at)
+        VALUES (%s, %s, 'CREDIT', %s, 'bench', %s, NOW());
+    """, (shipper_id, total, delivery_id, balance))
+    cur.execute("INSERT INTO app.tracking_events (delivery_id, event_type, status) VALUES (%s, 'STATUS', 'COMPLETED');",
+                (delivery_id,))
+    cur.execute("INSERT INTO app.notifications (user_id, title, body) VALUES (%s, 'bench', 'bench');", (shipper_id,))
+    cur.execute("SELECT DISTINCT customer_id FROM app.orders WHERE delivery_id = %s;", (delivery_id,))
+    for row in cur.fetchall():
+        cur.execute("INSERT INTO app.notifications (user_id, title, body) VALUES (%s, 'bench', 'bench');",
+                    (row["customer_id"],))
+
+
+def complete_set(cur, delivery_id, shipper_id):
+    cur.execute(CASCADE_SQL["COMPLETED"], {"delivery_id": delivery_id, "shipper_id": shipper_id, "note": "bench"})
+    cascade = cur.fetchone()
+    cur.execute("INSERT INTO app.tracking_events (delivery_id, event_type, status) VALUES (%s, 'STATUS', 'COMPLETED');",
+                (delivery_id,))
+    psycopg2.extras.execute_values(cur, "INSERT INTO app.notifications (user_id, title, body) VALUES %s;",
+                                   [(shipper_id, "bench", "bench")] + [(c, "bench", "bench") for c in cascade["customers"]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,10,100,1000", help="orders per delivery")
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="simulated network round-trip per statement")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor(cursor_factory=CountingCursor)
+    try:
+        cur.execute("""
+            SELECT (SELECT u.user_id FROM app.users u JOIN app.roles r ON r.role_id = u.role_id
+                     WHERE r.role_name = 'shipper' ORDER BY u.user_id LIMIT 1) AS shipper_id,
+                   (SELECT u.user_id FROM app.users u JOIN app.roles r ON r.role_id = u.role_id
+                     WHERE r.role_name = 'customer' ORDER BY u.user_id LIMIT 1) AS customer_id;
+        """)
+        ids = cur.fetchone()
+        if not ids["shipper_id"] or not ids["customer_id"]:
+            sys.exit("Needs at least one shipper and one customer (python seed_data.py)")
+
+        print(f"{'orders':>7} {'mode':>5} {'statements':>10} {'ms':>9}")
+        for size in sizes:
+            for name, complete in (("loop", complete_loop), ("set", complete_set)):
+                best, statements = None, 0
+                for _ in range(args.repeat):
+                    cur.execute("SAVEPOINT bench;")
+                    delivery_id = setup(cur, ids["shipper_id"], ids["customer_id"], size)
+                    CountingCursor.statements, CountingCursor.rtt = 0, args.rtt_ms / 1000
+                    started = time.perf_counter()
+                    complete(cur, delivery_id, ids["shipper_id"])
+                    elapsed = (time.perf_counter() - started) * 1000
+                    statements, CountingCursor.rtt = CountingCursor.statements, 0.0
+                    cur.execute("ROLLBACK TO SAVEPOINT bench;")
+                    best = elapsed if best is None else min(best, elapsed)
+                print(f"{size:>7} {name:>5} {statements:>10} {best:>9.2f}")
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
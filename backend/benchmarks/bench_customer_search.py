@@ -0,0 +1,107 @@
+"""
+Benchmark: merchant customer search, LIKE '%q%' scan vs indexed search.
+
+Inserts --users synthetic customers with Vietnamese names (accented),
+emails and phone numbers, then times typical typeahead queries (word
+prefixes, a fragment inside a word, typos, a query matching nothing, phone
+prefixes and endings, email prefixes) with the previous LOWER(...) LIKE
+'%q%' query and with utils/customer_search.search().
+
+Needs migrations/025_users_search.py (pg_trgm, unaccent). Runs against the
+configured database inside one transaction that is rolled back. With
+--users 0 nothing is inserted and the queries run against the customers
+already there: load a large set once (with the indexes built afterwards)
+rather than inserting millions of rows under every index on each run.
+
+    python benchmarks/bench_customer_search.py
+    python benchmarks/bench_customer_search.py --users 0
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import psycopg2.extras
+from db import get_db_connection
+from utils import customer_search
+from utils.roles import role_id_by_name
+
+FAMILY = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ", "Hồ", "Ngô", "Dương"]
+MIDDLE = ["Văn", "Thị", "Hữu", "Đức", "Minh", "Ngọc", "Thanh", "Quốc", "Gia", "Bảo"]
+GIVEN = ["An", "Bình", "Châu", "Dũng", "Đạt", "Giang", "Hà", "Hải", "Hạnh", "Hiếu", "Hoa", "Hùng", "Khánh", "Lan",
+         "Linh", "Long", "Mai", "Nam", "Nga", "Nhung", "Phong", "Phúc", "Quân", "Sơn", "Tâm", "Thảo", "Trang", "Tuấn",
+         "Uyên", "Vy", "Xuân", "Yến"]
+QUERIES = ["ng", "nguyen", "tuan", "Thảo", "dang duc", "nguyen van thao", "van th", "uyen", "tuann", "nguyenn", "xyzq",
+           "0912", "+84 90", "5678", "user123@", "user123"]
+
+OLD_SQL = """
+    SELECT user_id, full_name, email, phone, created_at
+    FROM app.users
+    WHERE role_id = %s
+      AND is_active = TRUE
+      AND (
+          LOWER(full_name) LIKE LOWER(%s) OR
+          LOWER(email) LIKE LOWER(%s) OR
+          phone LIKE %s
+      )
+    ORDER BY full_name
+    LIMIT 20;
+"""
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        elapsed = (time.perf_counter() - started) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _insert(cur, users, customer):
+    cur.execute("""
+        INSERT INTO app.users (username, password_hash, email, phone, full_name, role_id, is_active)
+        SELECT 'bench_user' || g, 'x', 'user' || g || '@bench.test',
+               '09' || lpad((g::bigint * 7919 %% 100000000)::text, 8, '0'),
+               (%(family)s::text[])[1 + g %% %(nf)s] || ' ' || (%(middle)s::text[])[1 + g / 7 %% %(nm)s]
+                   || ' ' || (%(given)s::text[])[1 + g / 11 %% %(ng)s],
+               %(role)s, TRUE
+          FROM generate_series(1, %(n)s) g;
+    """, {"family": FAMILY, "middle": MIDDLE, "given": GIVEN, "nf": len(FAMILY), "nm": len(MIDDLE),
+          "ng": len(GIVEN), "role": customer, "n": users})
+    cur.execute("ANALYZE app.users;")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    customer = role_id_by_name("customer")
+    try:
+        if args.users:
+            print(f"Inserting {args.users} customers...")
+            _insert(cur, args.users, customer)
+
+        print(f"{'query':>18} {'like ms':>9} {'indexed ms':>11} {'hits':>5}")
+        for q in QUERIES:
+            pattern = f"%{q}%"
+            like_ms = timed(lambda: (cur.execute(OLD_SQL, (customer, pattern, pattern, pattern)), cur.fetchall()),
+                            args.repeat)
+            rows = []
+            indexed_ms = timed(lambda: rows.__setitem__(slice(None), customer_search.search(cur, q)), args.repeat)
+            print(f"{q:>18} {like_ms:>9.2f} {indexed_ms:>11.2f} {len(rows):>5}")
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark: dispatch matching latency and pickup distance.
+
+Simulates ORDERS pending orders and SHIPPERS idle shippers scattered over a
+city-sized box and runs the dispatcher's matching (utils/dispatch.py) with
+each solver. Reports candidate-generation and assignment time, orders
+matched and the average pickup distance. "fcfs" is the baseline of orders
+taking the nearest free shipper in arrival order.
+
+    python benchmarks/bench_dispatch.py
+    python benchmarks/bench_dispatch.py --orders 10000 --shippers 2000 --radius 5 --size-km 30
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import numpy as np
+from utils import dispatch
+
+
+def fcfs(o, s, dist, cost):
+    order = np.lexsort((cost, o))   # by order (arrival), then cost
+    taken_o, taken_s, pairs = set(), set(), []
+    for e in order.tolist():
+        a, b = int(o[e]), int(s[e])
+        if a in taken_o or b in taken_s:
+            continue
+        taken_o.add(a)
+        taken_s.add(b)
+        pairs.append((a, b, float(dist[e])))
+    return pairs, {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--shippers", type=int, default=2000)
+    parser.add_argument("--radius", type=float, default=dispatch.DISPATCH_RADIUS_KM)
+    parser.add_argument("--candidates", type=int, default=dispatch.DISPATCH_CANDIDATES)
+    parser.add_argument("--size-km", type=float, default=30, help="side of the simulated city")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    lat0, lng0 = 10.78, 106.70   # Ho Chi Minh City
+    d_lat = args.size_km / 111.0
+    d_lng = args.size_km / (111.0 * np.cos(np.radians(lat0)))
+
+    def scatter(n):
+        # half uniform, half clustered around a few hot spots
+        u = rng.random((n, 2))
+        hot = rng.random((8, 2))
+        k = n // 2
+        u[:k] = np.clip(hot[rng.integers(0, 8, k)] + rng.normal(0, 0.05, (k, 2)), 0, 1)
+        return lat0 + (u[:, 0] - 0.5) * d_lat, lng0 + (u[:, 1] - 0.5) * d_lng
+
+    o_lat, o_lng = scatter(args.orders)
+    s_lat, s_lng = scatter(args.shippers)
+    o_rank = rng.choice([0, 1, 2], args.orders, p=[0.8, 0.15, 0.05])
+    s_rank = rng.choice([0, 1, 2], args.shippers, p=[0.7, 0.2, 0.1])
+
+    t = time.perf_counter()
+    o, s, dist, cost = dispatch.candidate_edges(o_lat, o_lng, o_rank, s_lat, s_lng, s_rank,
+                                                args.radius, args.candidates)
+    edges_ms = (time.perf_counter() - t) * 1000
+    print(f"Orders x shippers:  {args.orders} x {args.shippers} over {args.size_km:.0f} km, radius {args.radius} km")
+    print(f"Candidate edges:    {len(o)} in {edges_ms:.1f} ms")
+    print(f"Hungarian solver:   {'scipy' if dispatch.linear_sum_assignment else 'not installed (greedy only)'}")
+    print()
+    print(f"{'solver':<10} {'match ms':>10} {'matched':>9} {'avg pickup km':>14}")
+
+    solvers = [("fcfs", lambda: fcfs(o, s, dist, cost)),
+               ("greedy", lambda: dispatch.match(o, s, dist, cost, "greedy"))]
+    if dispatch.linear_sum_assignment is not None:
+        solvers.append(("auto", lambda: dispatch.match(o, s, dist, cost, "auto")))
+        solvers.append(("hungarian", lambda: dispatch.match(o, s, dist, cost, "hungarian")))
+    for name, solve in solvers:
+        t = time.perf_counter()
+        pairs, _ = solve()
+        ms = (time.perf_counter() - t) * 1000
+        avg = sum(p[2] for p in pairs) / len(pairs) if pairs else 0
+        print(f"{name:<10} {ms:>10.1f} {len(pairs):>9} {avg:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
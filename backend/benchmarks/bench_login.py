@@ -0,0 +1,97 @@
+"""
+Benchmark: password verification (login) throughput per core.
+
+Runs concurrent "logins" (bcrypt verification of a known password) either
+through the hashing process pool used by the API (utils/hashing.py) or
+inline on the calling threads, and reports logins/s and logins/s per core.
+With --url it instead drives POST /auth/login on a running server.
+
+    python benchmarks/bench_login.py --threads 32 --seconds 10
+    python benchmarks/bench_login.py --mode inline --rounds 10
+    python benchmarks/bench_login.py --url http://localhost:5000 --username customer1 --password customer123
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import threading
+import time
+import bcrypt
+
+
+def run(worker, threads, seconds):
+    counts = [0] * threads
+    errors = [0] * threads
+    deadline = time.perf_counter() + seconds
+
+    def loop(i):
+        while time.perf_counter() < deadline:
+            try:
+                worker()
+                counts[i] += 1
+            except Exception:
+                errors[i] += 1
+
+    pool = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return sum(counts), sum(errors), time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["pool", "inline"], default="pool")
+    parser.add_argument("--threads", type=int, default=16, help="concurrent request threads")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rounds", type=int, default=None, help="bcrypt cost (default BCRYPT_ROUNDS)")
+    parser.add_argument("--url", help="benchmark POST <url>/auth/login instead of hashing directly")
+    parser.add_argument("--username", default="customer1")
+    parser.add_argument("--password", default="customer123")
+    args = parser.parse_args()
+
+    if args.rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    from utils import hashing
+
+    cores = os.cpu_count() or 1
+    if args.url:
+        import requests
+        session = requests.Session()
+
+        def worker():
+            r = session.post(f"{args.url}/auth/login", json={"username": args.username, "password": args.password}, timeout=30)
+            if r.status_code != 200:
+                raise RuntimeError(r.status_code)
+        label = f"HTTP {args.url}/auth/login"
+    else:
+        password = "correct horse battery staple"
+        hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(hashing.BCRYPT_ROUNDS)).decode()
+        if args.mode == "pool":
+            hashing.check_password(password, hashed)   # start the worker processes before timing
+
+            def worker():
+                if not hashing.check_password(password, hashed):
+                    raise RuntimeError("mismatch")
+            label = f"process pool ({hashing.HASH_WORKERS} workers)"
+        else:
+            def worker():
+                if not bcrypt.checkpw(password.encode(), hashed.encode()):
+                    raise RuntimeError("mismatch")
+            label = "inline on request threads"
+
+    done, errors, elapsed = run(worker, args.threads, args.seconds)
+    rate = done / elapsed
+    print(f"Mode:             {label}")
+    print(f"bcrypt rounds:    {hashing.BCRYPT_ROUNDS}")
+    print(f"Threads:          {args.threads}")
+    print(f"Logins:           {done} in {elapsed:.1f}s ({errors} errors/rejections)")
+    print(f"Throughput:       {rate:.1f} logins/s")
+    print(f"Per core ({cores}):    {rate / cores:.1f} logins/s/core")
+
+
+if __name__ == "__main__":
+    main()
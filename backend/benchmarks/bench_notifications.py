@@ -0,0 +1,122 @@
+"""
+Benchmark: notification listing and retention cleanup, plain vs partitioned.
+
+Builds two copies of a synthetic notification history in a scratch schema:
+one plain table and one partitioned by month like app.notifications
+(migrations/021). It then compares:
+  - a user's first page, newest first, within the retention window
+  - removing everything older than the retention window: DELETE on the
+    plain table vs DROP TABLE of the expired partitions
+
+The schema is dropped afterwards unless --keep is given. Generating 100M
+rows takes a long time and roughly 20 GB on disk per copy:
+
+    python benchmarks/bench_notifications.py
+    python benchmarks/bench_notifications.py --rows 100000000 --users 1000000 --months 12
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import random
+import time
+from db import get_db_connection
+
+SCHEMA = "bench_notifications"
+COLUMNS = """
+    notification_id BIGINT NOT NULL,
+    user_id INTEGER NOT NULL,
+    title TEXT,
+    body TEXT,
+    is_read BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+"""
+
+
+def timed(cur, sql, params=None):
+    started = time.perf_counter()
+    cur.execute(sql, params)
+    return (time.perf_counter() - started) * 1000
+
+
+def build(cur, rows, users, months):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"CREATE TABLE {SCHEMA}.plain ({COLUMNS}, PRIMARY KEY (notification_id));")
+    cur.execute(f"CREATE TABLE {SCHEMA}.parted ({COLUMNS}, PRIMARY KEY (notification_id, created_at)) PARTITION BY RANGE (created_at);")
+    for i, m in enumerate(range(months, -2, -1)):
+        cur.execute(f"""
+            CREATE TABLE {SCHEMA}.parted_{i} PARTITION OF {SCHEMA}.parted
+            FOR VALUES FROM (date_trunc('month', LOCALTIMESTAMP) - make_interval(months => {m}))
+                         TO (date_trunc('month', LOCALTIMESTAMP) - make_interval(months => {m - 1}));
+        """)
+    # history spread evenly over the last `months` months
+    fill = f"""
+        SELECT g, 1 + (g::bigint * 7919) %% %s, 'Order Update', 'Your order is on its way', random() < 0.9,
+               LOCALTIMESTAMP - (g::float8 / %s) * make_interval(months => {months})
+          FROM generate_series(1, %s) g
+    """
+    print(f"loading {rows:,} rows into each table ...", flush=True)
+    load_plain = timed(cur, f"INSERT INTO {SCHEMA}.plain {fill};", (users, rows, rows))
+    load_parted = timed(cur, f"INSERT INTO {SCHEMA}.parted {fill};", (users, rows, rows))
+    for table in ("plain", "parted"):
+        cur.execute(f"CREATE INDEX ON {SCHEMA}.{table} (user_id, created_at DESC, notification_id DESC);")
+        cur.execute(f"ANALYZE {SCHEMA}.{table};")
+    return load_plain, load_parted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--months", type=int, default=12, help="history length")
+    parser.add_argument("--retention", type=int, default=6, help="months kept")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch schema")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        load_plain, load_parted = build(cur, args.rows, args.users, args.months)
+        print(f"load: plain {load_plain:.0f} ms, partitioned {load_parted:.0f} ms")
+
+        cur.execute(f"SELECT date_trunc('month', LOCALTIMESTAMP) - make_interval(months => {args.retention});")
+        since = cur.fetchone()[0]
+        rng = random.Random(7)
+        users = [rng.randint(1, args.users) for _ in range(args.queries)]
+        for table in ("plain", "parted"):
+            sql = f"""
+                SELECT notification_id, title, body, is_read, created_at FROM {SCHEMA}.{table}
+                 WHERE user_id = %s AND created_at >= %s
+                 ORDER BY created_at DESC, notification_id DESC LIMIT 21;
+            """
+            for u in users[:20]:
+                cur.execute(sql, (u, since))   # warm up
+            times = sorted(timed(cur, sql, (u, since)) for u in users)
+            print(f"first page {table:>6}: p50 {times[len(times) // 2]:.3f} ms  p99 {times[int(len(times) * 0.99)]:.3f} ms")
+
+        deleted = timed(cur, f"DELETE FROM {SCHEMA}.plain WHERE created_at < %s;", (since,))
+        count = cur.rowcount
+        vacuum = timed(cur, f"VACUUM {SCHEMA}.plain;")
+        cur.execute(f"""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+             WHERE i.inhparent = '{SCHEMA}.parted'::regclass
+               AND substring(pg_get_expr(c.relpartbound, c.oid) FROM 'TO \\(''([^'']+)''\\)')::timestamp
+                   <= %s;
+        """, (since,))
+        expired = [r[0] for r in cur.fetchall()]
+        dropped = sum(timed(cur, f"DROP TABLE {SCHEMA}.{name};") for name in expired)
+        print(f"cleanup plain : DELETE {count:,} rows {deleted:.0f} ms + VACUUM {vacuum:.0f} ms")
+        print(f"cleanup parted: DROP {len(expired)} partitions {dropped:.0f} ms")
+    finally:
+        if not args.keep:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark: merchant bulk order import vs one order per request.
+
+Builds --orders synthetic orders around Ho Chi Minh City as a CSV document,
+then imports them the bulk way (utils/order_import: parse, validate and price
+in one pass, one COPY) and the one-at-a-time way (what N calls of
+POST /merchant/orders cost the database: price with pricing.quote() and one
+INSERT per order). --rtt-ms adds a simulated network round-trip per
+statement. HTTP overhead of the single-order requests is not counted.
+
+Runs against the configured database inside one transaction that is rolled
+back, using an existing merchant and customer. Weather lookups are off (no
+provider), as without OPENWEATHER_API_KEY.
+
+    python benchmarks/bench_order_import.py
+    python benchmarks/bench_order_import.py --orders 10000 --rtt-ms 1
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import csv
+import io
+import random
+import time
+import psycopg2.extras
+from db import get_db_connection
+from utils import order_import, pricing
+from utils.geo import haversine
+
+
+class CountingCursor(psycopg2.extras.RealDictCursor):
+    rtt = 0.0
+    statements = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.statements += 1
+        if CountingCursor.rtt:
+            time.sleep(CountingCursor.rtt)
+        return super().execute(query, vars)
+
+    def copy_expert(self, sql, file, size=8192):
+        CountingCursor.statements += 1
+        if CountingCursor.rtt:
+            time.sleep(CountingCursor.rtt)
+        return super().copy_expert(sql, file, size)
+
+
+def make_csv(n, customer_id):
+    rnd = random.Random(42)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["customer_id", "pickup_address", "delivery_address", "pickup_lat", "pickup_lng",
+                     "delivery_lat", "delivery_lng", "service_type", "package_size",
+                     "delivery_contact_name", "delivery_contact_phone", "notes"])
+    for i in range(n):
+        writer.writerow([customer_id, f"{i} Nguyen Hue, Q1", f"{i} Le Van Sy, Q3",
+                         round(10.70 + rnd.random() * 0.15, 6), round(106.60 + rnd.random() * 0.15, 6),
+                         round(10.70 + rnd.random() * 0.15, 6), round(106.60 + rnd.random() * 0.15, 6),
+                         rnd.choice(["bike", "bike", "car", "truck"]), rnd.choice(["small", "medium", "large"]),
+                         f"Receiver {i}", f"09{i:08d}", "bench"])
+    return out.getvalue()
+
+
+def import_bulk(cur, text, merchant_id):
+    rows = order_import.parse_csv(text)
+    orders, _ = order_import.prepare(cur, rows)
+    order_import.insert(cur, merchant_id, orders)
+    return len(orders)
+
+
+def import_one_by_one(cur, text, merchant_id):
+    for row in csv.DictReader(io.StringIO(text)):
+        lat1, lng1 = float(row["pickup_lat"]), float(row["pickup_lng"])
+        lat2, lng2 = float(row["delivery_lat"]), float(row["delivery_lng"])
+        distance_km = round(haversine(lat1, lng1, lat2, lng2), 2)
+        price = pricing.quote(distance_km, "clear", row["service_type"], row["package_size"])[0]
+        cur.execute("""
+            INSERT INTO app.orders
+                (customer_id, merchant_id, pickup_address, delivery_address, status,
+                 pickup_lat, pickup_lng, delivery_lat, delivery_lng,
+                 distance_km, price_estimate, service_type, package_size,
+                 delivery_contact_name, delivery_contact_phone, notes)
+            VALUES (%s, %s, %s, %s, 'PENDING', %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING order_id;
+        """, (row["customer_id"], merchant_id, row["pickup_address"], row["delivery_address"],
+              lat1, lng1, lat2, lng2, distance_km, price, row["service_type"], row["package_size"],
+              row["delivery_contact_name"], row["delivery_contact_phone"], row["notes"]))
+        cur.fetchone()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--rtt-ms", type=float, default=0.0, help="simulated network round-trip per statement")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor(cursor_factory=CountingCursor)
+    try:
+        cur.execute("""
+            SELECT (SELECT u.user_id FROM app.users u JOIN app.roles r ON r.role_id = u.role_id
+                     WHERE r.role_name = 'merchant' ORDER BY u.user_id LIMIT 1) AS merchant_id,
+                   (SELECT u.user_id FROM app.users u JOIN app.roles r ON r.role_id = u.role_id
+                     WHERE r.role_name = 'customer' AND u.is_active ORDER BY u.user_id LIMIT 1) AS customer_id;
+        """)
+        ids = cur.fetchone()
+        if not ids["merchant_id"] or not ids["customer_id"]:
+            sys.exit("Needs at least one merchant and one active customer (python seed_data.py)")
+        text = make_csv(args.orders, ids["customer_id"])
+
+        print(f"{'orders':>7} {'mode':>12} {'statements':>10} {'ms':>9}")
+        for name, run in (("one-by-one", import_one_by_one), ("bulk", import_bulk)):
+            best, statements = None, 0
+            for _ in range(args.repeat):
+                cur.execute("SAVEPOINT bench;")
+                CountingCursor.statements, CountingCursor.rtt = 0, args.rtt_ms / 1000
+                started = time.perf_counter()
+                run(cur, text, ids["merchant_id"])
+                elapsed = (time.perf_counter() - started) * 1000
+                statements, CountingCursor.rtt = CountingCursor.statements, 0.0
+                cur.execute("ROLLBACK TO SAVEPOINT bench;")
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{args.orders:>7} {name:>12} {statements:>10} {best:>9.1f}")
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: GET /admin/summary cost as the tables grow.
+
+Adds synthetic payments and orders to the configured database in steps,
+inside one transaction that is rolled back at the end. After each step it
+times the five full-table aggregates the summary used to run and the
+maintained counters (utils/stats.py) that replace them. Insert times include
+the statement-level counter triggers.
+
+    python benchmarks/bench_summary.py
+    python benchmarks/bench_summary.py --steps 1000000,10000000,50000000
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse
+import time
+import psycopg2.extras
+from db import get_db_connection
+from utils import stats
+
+AGGREGATES = """
+    SELECT
+      (SELECT COUNT(*) FROM app.users) AS total_users,
+      (SELECT COUNT(*) FROM app.orders) AS total_orders,
+      (SELECT COUNT(*) FROM app.deliveries) AS total_deliveries,
+      (SELECT COUNT(*) FROM app.payments WHERE status='SUCCESS') AS total_payments,
+      (SELECT SUM(amount) FROM app.payments WHERE status='SUCCESS') AS revenue;
+"""
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", default="100000,1000000,3000000", help="payments (and orders) added so far at each step")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=1_000_000, help="rows per INSERT statement")
+    args = parser.parse_args()
+    steps = [int(s) for s in args.steps.split(",")]
+
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        added = 0
+        print(f"{'rows added':>11} {'insert ms':>10} {'aggregates ms':>14} {'counters ms':>12}")
+        for target in steps:
+            started = time.perf_counter()
+            while added < target:
+                n = min(args.batch, target - added)
+                cur.execute("""
+                    INSERT INTO app.payments (amount, method, status)
+                    SELECT 10000 + g %% 50000, 'CASH', CASE WHEN g %% 10 < 8 THEN 'SUCCESS' ELSE 'PENDING' END
+                      FROM generate_series(1, %s) g;
+                """, (n,))
+                cur.execute("""
+                    INSERT INTO app.orders (pickup_address, delivery_address, status)
+                    SELECT 'bench pickup', 'bench drop', 'COMPLETED' FROM generate_series(1, %s);
+                """, (n,))
+                added += n
+            inserted = (time.perf_counter() - started) * 1000
+            cur.execute("ANALYZE app.payments; ANALYZE app.orders;")
+
+            def aggregates():
+                cur.execute(AGGREGATES)
+                return cur.fetchone()
+
+            def counters():
+                return stats.summary(cur)
+
+            old, new = aggregates(), counters()
+            assert int(old["total_payments"]) == new["total_payments"] and old["revenue"] == new["revenue"], (old, new)
+            print(f"{added:>11,} {inserted:>10.0f} {best_of(aggregates, args.repeat):>14.2f} "
+                  f"{best_of(counters, args.repeat):>12.3f}")
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
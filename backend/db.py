@@ -1,11 +1,31 @@
 import psycopg2
 import psycopg2.extras
 import os
+import sys
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from flask import g, jsonify
 
 load_dotenv()
 
-def get_db_connection():
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))            # seconds to wait for a free connection
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # recycle connections older than this
+POOL_HEALTH_CHECK_IDLE = float(os.getenv("DB_POOL_HEALTH_CHECK_IDLE", "30"))  # ping if idle longer than this
+POOL_LEAK_SECONDS = float(os.getenv("DB_POOL_LEAK_SECONDS", "60"))   # report checkouts held longer than this
+RATE_WINDOW_SECONDS = 60
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """Raised when no connection became free within DB_POOL_TIMEOUT."""
+
+
+def _connect():
     conn = psycopg2.connect(
         host=os.getenv("DB_HOST"),
         port=os.getenv("DB_PORT"),
@@ -15,3 +35,417 @@ def get_db_connection():
     )
     conn.autocommit = True
     return conn
+
+
+class PooledConnection:
+    """
+    Borrowed connection handed out by the pool.
+    Behaves like a psycopg2 connection, but close() gives it back to the pool.
+    If the caller forgets to close it, the connection is reclaimed when this
+    wrapper is garbage collected and counted as a leak.
+    """
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_conn", conn)
+        finalizer = weakref.finalize(self, pool._reclaim, conn)
+        finalizer.atexit = False
+        object.__setattr__(self, "_finalizer", finalizer)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # same semantics as psycopg2: end the transaction, keep the connection
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+
+    @property
+    def closed(self):
+        return 1 if not self._finalizer.alive else self._conn.closed
+
+    def close(self):
+        if self._finalizer.detach() is not None:
+            self._pool._release(self._conn)
+
+
+class _Checkout:
+    __slots__ = ("conn", "created_at", "checked_out_at", "caller", "reported")
+
+    def __init__(self, conn, created_at, caller):
+        self.conn = conn
+        self.created_at = created_at
+        self.checked_out_at = time.monotonic()
+        self.caller = caller
+        self.reported = False
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of psycopg2 connections for one process."""
+
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, timeout=POOL_TIMEOUT,
+                 max_lifetime=POOL_MAX_LIFETIME, health_check_idle=POOL_HEALTH_CHECK_IDLE,
+                 leak_seconds=POOL_LEAK_SECONDS, connect=_connect):
+        self.min_size = max(0, min_size)
+        self.max_size = max(1, max_size, self.min_size)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+        self.leak_seconds = leak_seconds
+        self.pid = os.getpid()
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = deque()          # (conn, created_at, returned_at), most recently used on the right
+        self._in_use = {}             # id(conn) -> _Checkout
+        self._created_at = {}         # id(conn) -> monotonic creation time
+        self._reclaimed = deque()     # connections handed back by the GC finalizer
+        self._size = 0                # open + currently connecting
+        self._waiting = 0
+        self._rate = deque()          # [second, checkouts] buckets for checkouts/s
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "recycled": 0,
+            "health_check_failures": 0,
+            "leaks_reclaimed": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    # ---- borrow / return ----
+    def getconn(self):
+        caller = _caller()
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            self._drain_reclaimed()
+            if self._size < self.min_size:
+                self._fill_min()
+            while True:
+                conn, created_at, stale = self._take_idle()
+                if conn is not None:
+                    if stale and not self._ping_unlocked(conn):
+                        self._stats["health_check_failures"] += 1
+                        self._discard(conn)
+                        continue
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn, created_at = self._open_unlocked()
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    self._report_long_held()
+                    raise PoolTimeout(
+                        f"No database connection available within {self.timeout}s "
+                        f"(max_size={self.max_size}, in_use={len(self._in_use)})"
+                    )
+                self._waiting += 1
+                try:
+                    # short slices so connections reclaimed by the GC are picked up promptly
+                    self._cond.wait(min(remaining, 0.5))
+                finally:
+                    self._waiting -= 1
+                self._drain_reclaimed()
+
+            waited = time.monotonic() - started
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+            self._count_rate()
+            self._in_use[id(conn)] = _Checkout(conn, created_at, caller)
+        return PooledConnection(self, conn)
+
+    def _release(self, conn):
+        with self._cond:
+            self._in_use.pop(id(conn), None)
+            self._return_unlocked(conn)
+            self._cond.notify()
+
+    def _reclaim(self, conn):
+        # Called from a weakref finalizer, possibly in the middle of another pool
+        # operation on this thread, so only queue the connection here.
+        self._reclaimed.append(conn)
+
+    def _drain_reclaimed(self):
+        while self._reclaimed:
+            conn = self._reclaimed.popleft()
+            checkout = self._in_use.pop(id(conn), None)
+            self._stats["leaks_reclaimed"] += 1
+            where = checkout.caller if checkout else "unknown"
+            print(f"[DB Pool] Connection leaked (never closed), reclaimed. Borrowed at {where}")
+            self._return_unlocked(conn)
+            self._cond.notify()
+
+    def _return_unlocked(self, conn):
+        created_at = self._created_at.get(id(conn), 0)
+        if conn.closed or self._expired(created_at):
+            if not conn.closed:
+                self._stats["recycled"] += 1
+            self._discard(conn)
+            return
+        try:
+            status = conn.get_transaction_status()
+            if status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if not conn.autocommit:
+                conn.autocommit = True
+        except Exception:
+            self._discard(conn)
+            return
+        self._idle.append((conn, created_at, time.monotonic()))
+
+    def _take_idle(self):
+        """(conn, created_at, stale) of the most recently used idle connection;
+        stale ones have been idle long enough to need a health check."""
+        while self._idle:
+            conn, created_at, returned_at = self._idle.pop()
+            if conn.closed:
+                self._discard(conn)
+                continue
+            if self._expired(created_at):
+                self._stats["recycled"] += 1
+                self._discard(conn)
+                continue
+            return conn, created_at, time.monotonic() - returned_at > self.health_check_idle
+        return None, None, False
+
+    def _ping_unlocked(self, conn):
+        # conn is out of the idle list, so no one else can take it; ping
+        # without the lock so a slow connection does not hold up other borrowers
+        self._cond.release()
+        try:
+            return self._ping(conn)
+        finally:
+            self._cond.acquire()
+
+    def _open_unlocked(self):
+        # slot already reserved in self._size; connect without holding the lock
+        self._cond.release()
+        try:
+            conn = self._connect()
+        except Exception:
+            self._cond.acquire()
+            self._size -= 1
+            self._cond.notify()
+            raise
+        self._cond.acquire()
+        created_at = time.monotonic()
+        self._created_at[id(conn)] = created_at
+        self._stats["connections_created"] += 1
+        return conn, created_at
+
+    def _fill_min(self):
+        while self._size < self.min_size:
+            self._size += 1
+            try:
+                conn, created_at = self._open_unlocked()
+            except Exception as e:
+                print(f"[DB Pool] Could not pre-open connection: {e}")
+                return
+            self._idle.appendleft((conn, created_at, time.monotonic()))
+
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        self._size -= 1
+        self._stats["connections_closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, created_at):
+        return self.max_lifetime > 0 and time.monotonic() - created_at > self.max_lifetime
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1;")
+            cur.close()
+            if not conn.autocommit:
+                conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # ---- statistics ----
+    def _count_rate(self):
+        now = int(time.monotonic())
+        if self._rate and self._rate[-1][0] == now:
+            self._rate[-1][1] += 1
+        else:
+            self._rate.append([now, 1])
+        while self._rate and self._rate[0][0] <= now - RATE_WINDOW_SECONDS:
+            self._rate.popleft()
+
+    def _report_long_held(self, callers=True):
+        long_held = []
+        if self.leak_seconds <= 0:
+            return long_held
+        now = time.monotonic()
+        for checkout in self._in_use.values():
+            held = now - checkout.checked_out_at
+            if held > self.leak_seconds:
+                entry = {"held_seconds": round(held, 1)}
+                if callers:
+                    entry["borrowed_at"] = checkout.caller
+                long_held.append(entry)
+                if not checkout.reported:
+                    checkout.reported = True
+                    print(f"[DB Pool] Connection held for {held:.0f}s, possible leak. Borrowed at {checkout.caller}")
+        return long_held
+
+    def stats(self, callers=True):
+        """Pool statistics; callers=False leaves out where long-held connections were borrowed."""
+        with self._cond:
+            self._drain_reclaimed()
+            now = int(time.monotonic())
+            recent = sum(count for second, count in self._rate if second > now - RATE_WINDOW_SECONDS)
+            checkouts = self._stats["checkouts"]
+            return {
+                "pid": self.pid,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                "checkouts": checkouts,
+                "checkouts_per_sec": round(recent / RATE_WINDOW_SECONDS, 2),
+                "wait_time_avg_ms": round(self._stats["wait_time_total"] * 1000 / checkouts, 3) if checkouts else 0.0,
+                "wait_time_max_ms": round(self._stats["wait_time_max"] * 1000, 3),
+                "timeouts": self._stats["timeouts"],
+                "connections_created": self._stats["connections_created"],
+                "connections_closed": self._stats["connections_closed"],
+                "recycled": self._stats["recycled"],
+                "health_check_failures": self._stats["health_check_failures"],
+                "leaks_reclaimed": self._stats["leaks_reclaimed"],
+                "long_held": self._report_long_held(callers),
+            }
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                conn, _, _ = self._idle.pop()
+                self._discard(conn)
+
+
+def _caller():
+    # first frame outside this module, for leak reports
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}"
+
+
+# ---- per-process pool ----
+_pool = None
+_pool_lock = threading.Lock()
+_inherited = []   # parent's pools after fork: kept referenced so their sockets are never closed by the child
+
+
+def get_pool():
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is not None and _pool.pid != os.getpid():
+            _inherited.append(_pool)
+            _pool = None
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def _after_fork_in_child():
+    global _pool, _pool_lock
+    if _pool is not None:
+        _inherited.append(_pool)
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def get_dedicated_connection():
+    """Unpooled autocommit connection for long-lived background work (LISTEN/NOTIFY, exports)."""
+    return _connect()
+
+
+def get_db_connection():
+    """Borrow a connection from this process' pool. conn.close() returns it."""
+    return get_pool().getconn()
+
+
+@contextmanager
+def db_connection():
+    """with db_connection() as conn: ... - the connection goes back to the pool on exit."""
+    conn = get_db_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def pool_stats(callers=True):
+    return get_pool().stats(callers)
+
+
+# ---- request-scoped unit of work ----
+def get_request_connection():
+    """
+    Connection shared by every helper running inside the current Flask request.
+    All statements run in one transaction, committed once when the request
+    finishes (rolled back if the handler fails or returns an error status).
+    Do not commit or close it in handlers.
+    """
+    conn = g.get("_db_conn")
+    if conn is None:
+        conn = get_db_connection()
+        conn.autocommit = False
+        g._db_conn = conn
+    return conn
+
+
+def init_app(app):
+    @app.after_request
+    def _commit_request_connection(response):
+        conn = g.get("_db_conn")
+        if conn is None:
+            return response
+        try:
+            if response.status_code >= 400:
+                conn.rollback()
+            elif conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INERROR:
+                # a statement failed and was swallowed by the handler; COMMIT would silently roll back
+                conn.rollback()
+                return jsonify({"ok": False, "error": "Transaction aborted"}), 500
+            else:
+                conn.commit()
+        except Exception as e:
+            print(f"[DB] Request commit failed: {e}")
+            return jsonify({"ok": False, "error": f"Database error: {e}"}), 500
+        return response
+
+    @app.teardown_request
+    def _release_request_connection(exc):
+        conn = g.pop("_db_conn", None)
+        if conn is not None:
+            conn.close()   # the pool rolls back anything left uncommitted
@@ -0,0 +1,65 @@
+"""
+Migration: Notify application workers when app.roles changes
+Workers cache the role catalog in memory (utils/roles.py) and drop it on this notification
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+def up():
+    """Add roles_changed trigger"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.notify_roles_changed() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('roles_changed', TG_OP);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        cur.execute("DROP TRIGGER IF EXISTS trg_roles_changed ON app.roles;")
+        cur.execute("""
+            CREATE TRIGGER trg_roles_changed
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON app.roles
+            FOR EACH STATEMENT EXECUTE FUNCTION app.notify_roles_changed();
+        """)
+
+        conn.commit()
+        print("✅ Migration 011: roles_changed notification trigger created")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 011 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop roles_changed trigger"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("DROP TRIGGER IF EXISTS trg_roles_changed ON app.roles;")
+        cur.execute("DROP FUNCTION IF EXISTS app.notify_roles_changed();")
+
+        conn.commit()
+        print("✅ Migration 011 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 011 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
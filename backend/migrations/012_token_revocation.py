@@ -0,0 +1,102 @@
+"""
+Migration: Track when API tokens are revoked
+Adds revoked_at (stamped by trigger), notifies workers on revocation and
+indexes api_tokens for the revocation poll, logout and the expiry sweeper
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+def up():
+    """Add revoked_at, revocation trigger and indexes"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            ALTER TABLE app.api_tokens
+            ADD COLUMN IF NOT EXISTS revoked_at TIMESTAMPTZ;
+        """)
+
+        cur.execute("""
+            UPDATE app.api_tokens
+               SET revoked_at = NOW()
+             WHERE revoked = TRUE AND revoked_at IS NULL;
+        """)
+
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.stamp_token_revoked() RETURNS trigger AS $$
+            BEGIN
+                IF NEW.revoked AND NOT COALESCE(OLD.revoked, FALSE) THEN
+                    NEW.revoked_at := NOW();
+                    PERFORM pg_notify('tokens_revoked', NEW.token_id::text);
+                END IF;
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        cur.execute("DROP TRIGGER IF EXISTS trg_token_revoked ON app.api_tokens;")
+        cur.execute("""
+            CREATE TRIGGER trg_token_revoked
+            BEFORE UPDATE OF revoked ON app.api_tokens
+            FOR EACH ROW EXECUTE FUNCTION app.stamp_token_revoked();
+        """)
+
+        # delta poll: revoked tokens by revocation time
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_api_tokens_revoked_at
+            ON app.api_tokens(revoked_at) WHERE revoked = TRUE;
+        """)
+
+        # expiry sweeper
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_api_tokens_expires_at
+            ON app.api_tokens(expires_at);
+        """)
+
+        # logout looks tokens up by value
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_api_tokens_token
+            ON app.api_tokens USING hash (token);
+        """)
+
+        conn.commit()
+        print("✅ Migration 012: token revocation tracking added")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 012 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Remove token revocation tracking"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("DROP TRIGGER IF EXISTS trg_token_revoked ON app.api_tokens;")
+        cur.execute("DROP FUNCTION IF EXISTS app.stamp_token_revoked();")
+        cur.execute("DROP INDEX IF EXISTS app.idx_api_tokens_revoked_at;")
+        cur.execute("DROP INDEX IF EXISTS app.idx_api_tokens_expires_at;")
+        cur.execute("DROP INDEX IF EXISTS app.idx_api_tokens_token;")
+        cur.execute("ALTER TABLE app.api_tokens DROP COLUMN IF EXISTS revoked_at;")
+
+        conn.commit()
+        print("✅ Migration 012 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 012 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
@@ -0,0 +1,60 @@
+"""
+Migration: Composite indexes for keyset-paginated order listings
+GET /orders walks (created_at, order_id) newest first per customer, merchant,
+shipper (through deliveries) or, for admins, over the whole table
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+INDEXES = [
+    ("idx_orders_created", "app.orders(created_at DESC, order_id DESC)"),
+    ("idx_orders_customer_created", "app.orders(customer_id, created_at DESC, order_id DESC)"),
+    ("idx_orders_merchant_created", "app.orders(merchant_id, created_at DESC, order_id DESC)"),
+    ("idx_orders_delivery_created", "app.orders(delivery_id, created_at DESC, order_id DESC)"),
+    ("idx_deliveries_shipper", "app.deliveries(shipper_id, delivery_id)"),
+]
+
+def up():
+    """Create keyset pagination indexes"""
+    conn = get_db_connection()
+    # CONCURRENTLY cannot run inside a transaction block and keeps the tables writable
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        for name, target in INDEXES:
+            cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target};")
+        cur.execute("ANALYZE app.orders;")
+        cur.execute("ANALYZE app.deliveries;")
+        print("✅ Migration 013: order keyset pagination indexes created")
+
+    except Exception as e:
+        print(f"❌ Migration 013 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop keyset pagination indexes"""
+    conn = get_db_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        for name, _ in INDEXES:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS app.{name};")
+        print("✅ Migration 013 rolled back")
+
+    except Exception as e:
+        print(f"❌ Rollback 013 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
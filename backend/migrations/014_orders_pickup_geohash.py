@@ -0,0 +1,102 @@
+"""
+Migration: Geohash of the pickup point on orders
+Adds app.geohash_encode() (same encoding as utils/geo.py), a generated
+pickup_geohash column (precision 7, ~150 m cells) and a prefix index over
+pending, unassigned orders for the shipper available-orders feed
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+def up():
+    """Add pickup_geohash column and index"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.geohash_encode(lat double precision, lng double precision, prec integer)
+            RETURNS text LANGUAGE plpgsql IMMUTABLE STRICT PARALLEL SAFE AS $$
+            DECLARE
+                base32 CONSTANT text := '0123456789bcdefghjkmnpqrstuvwxyz';
+                lat_lo double precision := -90;
+                lat_hi double precision := 90;
+                lng_lo double precision := -180;
+                lng_hi double precision := 180;
+                mid double precision;
+                result text := '';
+                ch integer := 0;
+                nbits integer := 0;
+                even boolean := TRUE;
+            BEGIN
+                WHILE length(result) < prec LOOP
+                    IF even THEN
+                        mid := (lng_lo + lng_hi) / 2;
+                        IF lng >= mid THEN ch := ch * 2 + 1; lng_lo := mid; ELSE ch := ch * 2; lng_hi := mid; END IF;
+                    ELSE
+                        mid := (lat_lo + lat_hi) / 2;
+                        IF lat >= mid THEN ch := ch * 2 + 1; lat_lo := mid; ELSE ch := ch * 2; lat_hi := mid; END IF;
+                    END IF;
+                    even := NOT even;
+                    nbits := nbits + 1;
+                    IF nbits = 5 THEN
+                        result := result || substr(base32, ch + 1, 1);
+                        nbits := 0;
+                        ch := 0;
+                    END IF;
+                END LOOP;
+                RETURN result;
+            END;
+            $$;
+        """)
+
+        # rewrites app.orders once to fill the stored column
+        cur.execute("""
+            ALTER TABLE app.orders
+            ADD COLUMN IF NOT EXISTS pickup_geohash TEXT
+            GENERATED ALWAYS AS (app.geohash_encode(pickup_lat, pickup_lng, 7)) STORED;
+        """)
+
+        # prefix searches (LIKE 'w3gv%') over the available-orders backlog only
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_orders_pending_pickup_geohash
+            ON app.orders(pickup_geohash text_pattern_ops)
+            WHERE status = 'PENDING' AND delivery_id IS NULL;
+        """)
+
+        conn.commit()
+        print("✅ Migration 014: pickup_geohash column and index added")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 014 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Remove pickup_geohash column and index"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("DROP INDEX IF EXISTS app.idx_orders_pending_pickup_geohash;")
+        cur.execute("ALTER TABLE app.orders DROP COLUMN IF EXISTS pickup_geohash;")
+        cur.execute("DROP FUNCTION IF EXISTS app.geohash_encode(double precision, double precision, integer);")
+
+        conn.commit()
+        print("✅ Migration 014 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 014 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
@@ -0,0 +1,53 @@
+"""
+Migration: Store the planned stop sequence on deliveries
+route_plan is computed by utils/routing.py when a delivery is created
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+def up():
+    """Add route_plan column to deliveries"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            ALTER TABLE app.deliveries
+            ADD COLUMN IF NOT EXISTS route_plan JSONB;
+        """)
+
+        conn.commit()
+        print("✅ Migration 015: route_plan added to deliveries")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 015 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Remove route_plan column"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("ALTER TABLE app.deliveries DROP COLUMN IF EXISTS route_plan;")
+
+        conn.commit()
+        print("✅ Migration 015 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 015 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
@@ -0,0 +1,78 @@
+"""
+Migration: Notify application workers of new tracking events
+Each worker LISTENs on 'tracking_events' once and pushes the rows to the
+Server-Sent Events subscribers of the delivery (utils/tracking_stream.py)
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+def up():
+    """Add tracking_events notification trigger"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        # NOTIFY payloads are limited to 8000 bytes: oversized rows are sent
+        # as a reference and read back by the listener
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.notify_tracking_event() RETURNS trigger AS $$
+            DECLARE
+                payload text;
+            BEGIN
+                payload := json_build_object(
+                    'id', NEW.id, 'delivery_id', NEW.delivery_id, 'event_type', NEW.event_type,
+                    'status', NEW.status, 'description', NEW.description,
+                    'lat', NEW.lat, 'lng', NEW.lng, 'created_at', NEW.created_at
+                )::text;
+                IF octet_length(payload) > 7900 THEN
+                    payload := json_build_object('id', NEW.id, 'delivery_id', NEW.delivery_id, 'truncated', TRUE)::text;
+                END IF;
+                PERFORM pg_notify('tracking_events', payload);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        cur.execute("DROP TRIGGER IF EXISTS trg_tracking_event_notify ON app.tracking_events;")
+        cur.execute("""
+            CREATE TRIGGER trg_tracking_event_notify
+            AFTER INSERT ON app.tracking_events
+            FOR EACH ROW EXECUTE FUNCTION app.notify_tracking_event();
+        """)
+
+        conn.commit()
+        print("✅ Migration 016: tracking_events notification trigger created")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 016 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop tracking_events notification trigger"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("DROP TRIGGER IF EXISTS trg_tracking_event_notify ON app.tracking_events;")
+        cur.execute("DROP FUNCTION IF EXISTS app.notify_tracking_event();")
+
+        conn.commit()
+        print("✅ Migration 016 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 016 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
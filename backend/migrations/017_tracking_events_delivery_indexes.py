@@ -0,0 +1,57 @@
+"""
+Migration: Per-delivery indexes on app.tracking_events
+(delivery_id, created_at, id) serves ordered history and ?since= reads;
+(delivery_id, id) serves ?after_id=, the last event id behind the tracking
+ETag and the Last-Event-ID resume of the live stream
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+INDEXES = [
+    ("idx_tracking_events_delivery_created", "app.tracking_events(delivery_id, created_at, id)"),
+    ("idx_tracking_events_delivery_id", "app.tracking_events(delivery_id, id)"),
+]
+
+def up():
+    """Create tracking_events delivery indexes"""
+    conn = get_db_connection()
+    # CONCURRENTLY cannot run inside a transaction block and keeps the table writable
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        for name, target in INDEXES:
+            cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target};")
+        cur.execute("ANALYZE app.tracking_events;")
+        print("✅ Migration 017: tracking_events delivery indexes created")
+
+    except Exception as e:
+        print(f"❌ Migration 017 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop tracking_events delivery indexes"""
+    conn = get_db_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        for name, _ in INDEXES:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS app.{name};")
+        print("✅ Migration 017 rolled back")
+
+    except Exception as e:
+        print(f"❌ Rollback 017 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
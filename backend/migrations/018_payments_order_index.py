@@ -0,0 +1,50 @@
+"""
+Migration: Index app.payments by order
+The completion and cancellation cascades update the payments of all orders
+of a delivery in one joined UPDATE; without an index on order_id every
+cascade (and every per-order payment lookup) scans the whole table
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+def up():
+    """Create payments order_id index"""
+    conn = get_db_connection()
+    # CONCURRENTLY cannot run inside a transaction block and keeps the table writable
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        cur.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_payments_order ON app.payments(order_id);")
+        cur.execute("ANALYZE app.payments;")
+        print("✅ Migration 018: payments order_id index created")
+
+    except Exception as e:
+        print(f"❌ Migration 018 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop payments order_id index"""
+    conn = get_db_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        cur.execute("DROP INDEX CONCURRENTLY IF EXISTS app.idx_payments_order;")
+        print("✅ Migration 018 rolled back")
+
+    except Exception as e:
+        print(f"❌ Rollback 018 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
@@ -0,0 +1,91 @@
+"""
+Migration: Notification outbox
+Handlers enqueue notification intents in their own transaction; background
+workers (utils/outbox.py) deliver them in batches, retry failures with
+backoff and keep rows that exhausted their attempts as dead letters
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+def up():
+    """Create notification_outbox table and wake-up trigger"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS app.notification_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                title TEXT,
+                body TEXT,
+                created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+                last_error TEXT,
+                dead_at TIMESTAMP WITHOUT TIME ZONE
+            );
+        """)
+
+        # workers claim due rows oldest first; dead letters stay out of the way
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+            ON app.notification_outbox(next_attempt_at, id) WHERE dead_at IS NULL;
+        """)
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_notification_outbox_dead
+            ON app.notification_outbox(dead_at) WHERE dead_at IS NOT NULL;
+        """)
+
+        # one wake-up per enqueuing statement, delivered when it commits
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.notify_outbox() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('notification_outbox', '');
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("DROP TRIGGER IF EXISTS trg_notification_outbox ON app.notification_outbox;")
+        cur.execute("""
+            CREATE TRIGGER trg_notification_outbox
+            AFTER INSERT ON app.notification_outbox
+            FOR EACH STATEMENT EXECUTE FUNCTION app.notify_outbox();
+        """)
+
+        conn.commit()
+        print("✅ Migration 019: notification outbox created")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 019 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop notification_outbox (undelivered intents are lost)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("DROP TABLE IF EXISTS app.notification_outbox;")
+        cur.execute("DROP FUNCTION IF EXISTS app.notify_outbox();")
+
+        conn.commit()
+        print("✅ Migration 019 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 019 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
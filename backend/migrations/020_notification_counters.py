@@ -0,0 +1,136 @@
+"""
+Migration: Maintained unread notification counters
+app.notification_counters holds each user's unread count, kept current by
+statement-level triggers on app.notifications (one counter update per user
+per statement, however many rows it touched), so the unread badge is a
+primary key lookup. Also indexes notifications for keyset pagination
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+def up():
+    """Create notification_counters, its triggers and the pagination index"""
+    conn = get_db_connection()
+    conn.autocommit = False   # triggers and backfill under one table lock
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS app.notification_counters (
+                user_id INTEGER PRIMARY KEY,
+                unread INTEGER NOT NULL DEFAULT 0
+            );
+        """)
+
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.count_notifications_inserted() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO app.notification_counters AS c (user_id, unread)
+                SELECT user_id, COUNT(*) FROM new_rows
+                 WHERE user_id IS NOT NULL AND NOT COALESCE(is_read, FALSE)
+                 GROUP BY user_id
+                ON CONFLICT (user_id) DO UPDATE SET unread = c.unread + EXCLUDED.unread;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.count_notifications_updated() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO app.notification_counters AS c (user_id, unread)
+                SELECT user_id, SUM(delta) FROM (
+                    SELECT user_id, -1 AS delta FROM old_rows WHERE NOT COALESCE(is_read, FALSE)
+                    UNION ALL
+                    SELECT user_id, 1 FROM new_rows WHERE NOT COALESCE(is_read, FALSE)
+                ) d
+                 WHERE user_id IS NOT NULL
+                 GROUP BY user_id
+                HAVING SUM(delta) <> 0
+                ON CONFLICT (user_id) DO UPDATE SET unread = GREATEST(c.unread + EXCLUDED.unread, 0);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.count_notifications_deleted() RETURNS trigger AS $$
+            BEGIN
+                UPDATE app.notification_counters c
+                   SET unread = GREATEST(c.unread - d.n, 0)
+                  FROM (SELECT user_id, COUNT(*) AS n FROM old_rows
+                         WHERE NOT COALESCE(is_read, FALSE) GROUP BY user_id) d
+                 WHERE c.user_id = d.user_id;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        # no concurrent writes between creating the triggers and the backfill
+        cur.execute("LOCK TABLE app.notifications IN SHARE ROW EXCLUSIVE MODE;")
+        for name, event, referencing, function in (
+            ("trg_notifications_count_insert", "INSERT", "NEW TABLE AS new_rows", "count_notifications_inserted"),
+            ("trg_notifications_count_update", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows", "count_notifications_updated"),
+            ("trg_notifications_count_delete", "DELETE", "OLD TABLE AS old_rows", "count_notifications_deleted"),
+        ):
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON app.notifications;")
+            cur.execute(f"""
+                CREATE TRIGGER {name}
+                AFTER {event} ON app.notifications
+                REFERENCING {referencing}
+                FOR EACH STATEMENT EXECUTE FUNCTION app.{function}();
+            """)
+
+        cur.execute("""
+            INSERT INTO app.notification_counters (user_id, unread)
+            SELECT user_id, COUNT(*) FILTER (WHERE NOT COALESCE(is_read, FALSE))
+              FROM app.notifications
+             WHERE user_id IS NOT NULL
+             GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE SET unread = EXCLUDED.unread;
+        """)
+
+        # GET /notifications walks (created_at, notification_id) newest first per user
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_notifications_user_created
+            ON app.notifications(user_id, created_at DESC, notification_id DESC);
+        """)
+
+        conn.commit()
+        print("✅ Migration 020: notification counters created")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 020 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop notification counters and their triggers"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        for name in ("trg_notifications_count_insert", "trg_notifications_count_update", "trg_notifications_count_delete"):
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON app.notifications;")
+        for function in ("count_notifications_inserted", "count_notifications_updated", "count_notifications_deleted"):
+            cur.execute(f"DROP FUNCTION IF EXISTS app.{function}();")
+        cur.execute("DROP TABLE IF EXISTS app.notification_counters;")
+        cur.execute("DROP INDEX IF EXISTS app.idx_notifications_user_created;")
+
+        conn.commit()
+        print("✅ Migration 020 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 020 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
@@ -0,0 +1,134 @@
+"""
+Migration: Partition app.notifications by month
+Rebuilds app.notifications as a table range partitioned on created_at, one
+partition per month (utils/notification_retention.py creates upcoming months
+and drops expired ones) plus a DEFAULT partition for rows of months without
+one. Rows are copied under an exclusive lock, so run it in a maintenance
+window on large tables. notification_id keeps its sequence; the primary key
+becomes (notification_id, created_at) as partition keys must be part of it
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+from utils.notification_retention import ensure_partitions
+
+COUNTER_TRIGGERS = (
+    ("trg_notifications_count_insert", "INSERT", "NEW TABLE AS new_rows", "count_notifications_inserted"),
+    ("trg_notifications_count_update", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows", "count_notifications_updated"),
+    ("trg_notifications_count_delete", "DELETE", "OLD TABLE AS old_rows", "count_notifications_deleted"),
+)
+
+def _relkind(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'app.notifications'::regclass;")
+    return cur.fetchone()[0]
+
+def _finish(cur, new_table):
+    """Swap new_table in for app.notifications, keeping the id sequence, index and counter triggers"""
+    cur.execute("ALTER SEQUENCE app.notifications_notification_id_seq OWNED BY NONE;")
+    cur.execute("DROP TABLE app.notifications;")
+    cur.execute(f"ALTER TABLE app.{new_table} RENAME TO notifications;")
+    cur.execute(f"ALTER TABLE app.notifications RENAME CONSTRAINT {new_table}_pkey TO notifications_pkey;")
+    cur.execute("ALTER SEQUENCE app.notifications_notification_id_seq OWNED BY app.notifications.notification_id;")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_notifications_user_created
+        ON app.notifications(user_id, created_at DESC, notification_id DESC);
+    """)
+    for name, event, referencing, function in COUNTER_TRIGGERS:
+        cur.execute(f"""
+            CREATE TRIGGER {name}
+            AFTER {event} ON app.notifications
+            REFERENCING {referencing}
+            FOR EACH STATEMENT EXECUTE FUNCTION app.{function}();
+        """)
+
+def up():
+    """Rebuild app.notifications as monthly partitions"""
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    try:
+        if _relkind(cur) == "p":
+            print("✅ Migration 021: app.notifications already partitioned")
+            conn.rollback()
+            return
+
+        cur.execute("LOCK TABLE app.notifications IN ACCESS EXCLUSIVE MODE;")
+        cur.execute("""
+            CREATE TABLE app.notifications_partitioned (
+                notification_id INTEGER NOT NULL DEFAULT nextval('app.notifications_notification_id_seq'),
+                user_id INTEGER REFERENCES app.users(user_id),
+                title TEXT,
+                body TEXT,
+                is_read BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT NOW(),
+                PRIMARY KEY (notification_id, created_at)
+            ) PARTITION BY RANGE (created_at);
+        """)
+        cur.execute("SELECT date_trunc('month', MIN(created_at))::date FROM app.notifications;")
+        ensure_partitions(cur, since=cur.fetchone()[0], parent="notifications_partitioned")
+
+        # counter triggers are created after the copy: the counts are already right
+        cur.execute("""
+            INSERT INTO app.notifications_partitioned (notification_id, user_id, title, body, is_read, created_at)
+            SELECT notification_id, user_id, title, body, is_read, COALESCE(created_at, NOW())
+              FROM app.notifications;
+        """)
+        copied = cur.rowcount
+        _finish(cur, "notifications_partitioned")
+
+        conn.commit()
+        print(f"✅ Migration 021: app.notifications partitioned by month ({copied} rows)")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 021 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Rebuild app.notifications as a single table"""
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    try:
+        if _relkind(cur) != "p":
+            print("✅ Migration 021: app.notifications is not partitioned")
+            conn.rollback()
+            return
+
+        cur.execute("LOCK TABLE app.notifications IN ACCESS EXCLUSIVE MODE;")
+        cur.execute("""
+            CREATE TABLE app.notifications_plain (
+                notification_id INTEGER NOT NULL DEFAULT nextval('app.notifications_notification_id_seq') PRIMARY KEY,
+                user_id INTEGER REFERENCES app.users(user_id),
+                title TEXT,
+                body TEXT,
+                is_read BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT NOW()
+            );
+        """)
+        cur.execute("""
+            INSERT INTO app.notifications_plain (notification_id, user_id, title, body, is_read, created_at)
+            SELECT notification_id, user_id, title, body, is_read, created_at FROM app.notifications;
+        """)
+        _finish(cur, "notifications_plain")
+
+        conn.commit()
+        print("✅ Migration 021 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 021 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
@@ -0,0 +1,157 @@
+"""
+Migration: Incrementally maintained admin summary counters
+app.stats_counters holds the GET /admin/summary totals, kept by
+statement-level triggers on users, orders, deliveries and payments: one
+counter update per counter per statement, however many rows it touched.
+Each counter is split over STATS_SHARDS rows picked by backend pid, so
+concurrent writers rarely wait on the same row; a total is the sum of its
+shards. utils/stats.py reads and reconciles them
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+STATS_SHARDS = 16
+
+# table -> trigger function: deltas from the statement's transition tables
+TRIGGERS = {
+    "users": "count_rows_changed",
+    "orders": "count_rows_changed",
+    "deliveries": "count_rows_changed",
+    "payments": "count_payments_changed",
+}
+
+def up():
+    """Create stats_counters, its triggers, and load the current totals"""
+    conn = get_db_connection()
+    conn.autocommit = False   # triggers and initial totals under one set of locks
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS app.stats_counters (
+                name TEXT NOT NULL,
+                shard SMALLINT NOT NULL,
+                value NUMERIC NOT NULL DEFAULT 0,
+                PRIMARY KEY (name, shard)
+            );
+        """)
+
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION app.bump_stat(counter TEXT, delta NUMERIC) RETURNS void AS $$
+            BEGIN
+                IF delta IS NULL OR delta = 0 THEN
+                    RETURN;
+                END IF;
+                INSERT INTO app.stats_counters AS s (name, shard, value)
+                VALUES (counter, pg_backend_pid() % {STATS_SHARDS}, delta)
+                ON CONFLICT (name, shard) DO UPDATE SET value = s.value + EXCLUDED.value;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        # counter '<table>' = number of rows; TG_ARGV[0] names it
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.count_rows_changed() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    PERFORM app.bump_stat(TG_ARGV[0], (SELECT COUNT(*) FROM new_rows));
+                ELSIF TG_OP = 'DELETE' THEN
+                    PERFORM app.bump_stat(TG_ARGV[0], -(SELECT COUNT(*) FROM old_rows));
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        # successful payments: count and amount, following status transitions
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.count_payments_changed() RETURNS trigger AS $$
+            DECLARE
+                n_delta NUMERIC := 0;
+                amount_delta NUMERIC := 0;
+            BEGIN
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    SELECT n_delta + COUNT(*), amount_delta + COALESCE(SUM(r.amount), 0) INTO n_delta, amount_delta
+                      FROM new_rows r WHERE r.status = 'SUCCESS';
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    SELECT n_delta - COUNT(*), amount_delta - COALESCE(SUM(r.amount), 0) INTO n_delta, amount_delta
+                      FROM old_rows r WHERE r.status = 'SUCCESS';
+                END IF;
+                PERFORM app.bump_stat('payments_success', n_delta);
+                PERFORM app.bump_stat('revenue', amount_delta);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+
+        for table, function in TRIGGERS.items():
+            cur.execute(f"LOCK TABLE app.{table} IN SHARE ROW EXCLUSIVE MODE;")
+            for event, referencing in (("INSERT", "NEW TABLE AS new_rows"),
+                                       ("UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+                                       ("DELETE", "OLD TABLE AS old_rows")):
+                if event == "UPDATE" and function == "count_rows_changed":
+                    continue   # updates do not change row counts
+                name = f"trg_{table}_stats_{event.lower()}"
+                cur.execute(f"DROP TRIGGER IF EXISTS {name} ON app.{table};")
+                cur.execute(f"""
+                    CREATE TRIGGER {name}
+                    AFTER {event} ON app.{table}
+                    REFERENCING {referencing}
+                    FOR EACH STATEMENT EXECUTE FUNCTION app.{function}('{table}');
+                """)
+
+        # writes are blocked by the locks above, so these totals are exact
+        cur.execute("DELETE FROM app.stats_counters;")
+        cur.execute("""
+            INSERT INTO app.stats_counters (name, shard, value)
+            SELECT name, 0, value FROM (VALUES
+                ('users', (SELECT COUNT(*) FROM app.users)),
+                ('orders', (SELECT COUNT(*) FROM app.orders)),
+                ('deliveries', (SELECT COUNT(*) FROM app.deliveries)),
+                ('payments_success', (SELECT COUNT(*) FROM app.payments WHERE status = 'SUCCESS')),
+                ('revenue', (SELECT COALESCE(SUM(amount), 0) FROM app.payments WHERE status = 'SUCCESS'))
+            ) AS totals (name, value);
+        """)
+
+        conn.commit()
+        print("✅ Migration 022: stats counters created")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 022 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop stats counters and their triggers"""
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    try:
+        for table in TRIGGERS:
+            for event in ("insert", "update", "delete"):
+                cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_stats_{event} ON app.{table};")
+        for function in ("count_rows_changed()", "count_payments_changed()", "bump_stat(TEXT, NUMERIC)"):
+            cur.execute(f"DROP FUNCTION IF EXISTS app.{function};")
+        cur.execute("DROP TABLE IF EXISTS app.stats_counters;")
+
+        conn.commit()
+        print("✅ Migration 022 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 022 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
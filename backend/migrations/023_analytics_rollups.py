@@ -0,0 +1,97 @@
+"""
+Migration: Hourly and daily order rollups for the analytics dashboards
+app.order_rollups_hourly / app.order_rollups_daily hold, per time bucket
+(by order created_at) and per merchant_id, service_type and package_size,
+the order count, completed and canceled counts, successful payment revenue
+and the sums behind average distance and price. Missing dimensions are
+stored as 0 / '' so they can be part of the primary key. Averages are
+kept as sum + count so buckets and groups can be added up exactly.
+app.rollup_watermarks records how far each rollup has been refreshed.
+utils/rollups.py fills them
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+# table -> bucket column type
+ROLLUPS = {
+    "order_rollups_hourly": "TIMESTAMP",
+    "order_rollups_daily": "DATE",
+}
+
+def up():
+    """Create the rollup tables and the watermark table"""
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    try:
+        for table, bucket_type in ROLLUPS.items():
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS app.{table} (
+                    bucket {bucket_type} NOT NULL,
+                    merchant_id INTEGER NOT NULL DEFAULT 0,
+                    service_type VARCHAR(20) NOT NULL DEFAULT '',
+                    package_size VARCHAR(20) NOT NULL DEFAULT '',
+                    orders INTEGER NOT NULL DEFAULT 0,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    canceled INTEGER NOT NULL DEFAULT 0,
+                    revenue NUMERIC NOT NULL DEFAULT 0,
+                    distance_sum NUMERIC NOT NULL DEFAULT 0,
+                    distance_n INTEGER NOT NULL DEFAULT 0,
+                    price_sum NUMERIC NOT NULL DEFAULT 0,
+                    price_n INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (bucket, merchant_id, service_type, package_size)
+                );
+            """)
+            # merchant dashboards read one merchant over a time range
+            cur.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_{table}_merchant
+                ON app.{table}(merchant_id, bucket);
+            """)
+
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS app.rollup_watermarks (
+                name TEXT PRIMARY KEY,
+                watermark TIMESTAMP NOT NULL,
+                refreshed_at TIMESTAMP NOT NULL DEFAULT NOW()
+            );
+        """)
+
+        conn.commit()
+        print("✅ Migration 023: analytics rollup tables created")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 023 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop the rollup tables"""
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    try:
+        for table in ROLLUPS:
+            cur.execute(f"DROP TABLE IF EXISTS app.{table};")
+        cur.execute("DROP TABLE IF EXISTS app.rollup_watermarks;")
+
+        conn.commit()
+        print("✅ Migration 023 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 023 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
@@ -0,0 +1,78 @@
+"""
+Migration: Background export jobs
+app.export_jobs tracks admin data exports (utils/exports.py): what was
+requested, which worker runs it (heartbeat), progress in rows and bytes,
+and where the finished file is
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+def up():
+    """Create app.export_jobs"""
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS app.export_jobs (
+                job_id BIGSERIAL PRIMARY KEY,
+                dataset VARCHAR(30) NOT NULL,
+                format VARCHAR(10) NOT NULL CHECK (format IN ('csv', 'parquet')),
+                status VARCHAR(10) NOT NULL DEFAULT 'QUEUED'
+                    CHECK (status IN ('QUEUED', 'RUNNING', 'DONE', 'FAILED')),
+                requested_by INTEGER REFERENCES app.users(user_id) ON DELETE SET NULL,
+                rows_estimated BIGINT,
+                rows_written BIGINT NOT NULL DEFAULT 0,
+                bytes_written BIGINT NOT NULL DEFAULT 0,
+                file_path TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                started_at TIMESTAMP,
+                heartbeat_at TIMESTAMP,
+                finished_at TIMESTAMP
+            );
+        """)
+        # workers claim queued (or abandoned running) jobs oldest first
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS idx_export_jobs_pending
+            ON app.export_jobs(created_at) WHERE status IN ('QUEUED', 'RUNNING');
+        """)
+
+        conn.commit()
+        print("✅ Migration 024: export_jobs created")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Migration 024 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop app.export_jobs (export files are left on disk)"""
+    conn = get_db_connection()
+    conn.autocommit = False
+    cur = conn.cursor()
+
+    try:
+        cur.execute("DROP TABLE IF EXISTS app.export_jobs;")
+
+        conn.commit()
+        print("✅ Migration 024 rolled back")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Rollback 024 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
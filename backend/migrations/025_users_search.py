@@ -0,0 +1,172 @@
+"""
+Migration: Indexed customer search on app.users
+Enables pg_trgm and unaccent and adds two generated columns:
+search_name, full_name lowercased without accents (Vietnamese diacritics and
+đ included) and with whitespace collapsed, and phone_digits, the phone
+number as digits only with a +84 prefix written as 0. Indexes are
+text_pattern_ops btrees for prefix matches read in order: on search_name,
+on search_name from its 2nd, 3rd and 4th word (app.search_tail), on
+phone_digits and its reverse (numbers ending with given digits) and on
+lower(email). app.search_words holds the distinct words of all names, added
+by statement-level triggers on app.users, with a trigram GIN index to
+correct typos and complete fragments inside words.
+utils/customer_search.py queries them
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import get_db_connection
+
+INDEXES = [
+    ("idx_users_search_name_prefix", "app.users (search_name text_pattern_ops)"),
+    ("idx_users_search_name_word2", "app.users (app.search_tail(search_name, 1) text_pattern_ops) "
+                                    "WHERE app.search_tail(search_name, 1) IS NOT NULL"),
+    ("idx_users_search_name_word3", "app.users (app.search_tail(search_name, 2) text_pattern_ops) "
+                                    "WHERE app.search_tail(search_name, 2) IS NOT NULL"),
+    ("idx_users_search_name_word4", "app.users (app.search_tail(search_name, 3) text_pattern_ops) "
+                                    "WHERE app.search_tail(search_name, 3) IS NOT NULL"),
+    ("idx_users_phone_digits", "app.users (phone_digits text_pattern_ops)"),
+    ("idx_users_phone_digits_reverse", "app.users (reverse(phone_digits) text_pattern_ops)"),
+    ("idx_users_email_prefix", "app.users (lower(email) text_pattern_ops)"),
+    ("idx_search_words_trgm", "app.search_words USING gin (word gin_trgm_ops)"),
+]
+
+def up():
+    """Add search columns and indexes to app.users"""
+    conn = get_db_connection()
+    # CONCURRENTLY cannot run inside a transaction block and keeps the table writable
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        cur.execute("CREATE EXTENSION IF NOT EXISTS unaccent;")
+        cur.execute("""
+            SELECT n.nspname FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+             WHERE e.extname = 'unaccent';
+        """)
+        schema = cur.fetchone()[0]
+
+        # unaccent() is only STABLE (its dictionary could change); pinning the
+        # dictionary makes this safe to declare IMMUTABLE for generated columns
+        cur.execute(f"""
+            CREATE OR REPLACE FUNCTION app.search_normalize(value text)
+            RETURNS text LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+                SELECT btrim(regexp_replace(lower({schema}.unaccent('{schema}.unaccent'::regdictionary, value)),
+                                            '\\s+', ' ', 'g'))
+            $$;
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.phone_digits(value text)
+            RETURNS text LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+                SELECT CASE WHEN d LIKE '84%' THEN '0' || substr(d, 3) ELSE d END
+                  FROM (SELECT regexp_replace(value, '\\D', '', 'g') AS d) s
+            $$;
+        """)
+        # the name without its first n words (NULL if none are left): one prefix
+        # index per word position finds "thao" in "nguyen van thao"
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.search_tail(value text, n integer)
+            RETURNS text LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+                SELECT NULLIF(array_to_string((string_to_array(value, ' '))[n + 1:], ' '), '')
+            $$;
+        """)
+
+        # rewrites app.users once to fill the stored columns
+        cur.execute("""
+            ALTER TABLE app.users
+            ADD COLUMN IF NOT EXISTS search_name TEXT
+            GENERATED ALWAYS AS (app.search_normalize(full_name)) STORED;
+        """)
+        cur.execute("""
+            ALTER TABLE app.users
+            ADD COLUMN IF NOT EXISTS phone_digits TEXT
+            GENERATED ALWAYS AS (app.phone_digits(phone)) STORED;
+        """)
+
+        # words are only ever added: one left over from a renamed user costs a
+        # lookup that finds nobody. C collation lets the primary key serve
+        # LIKE 'prefix%'
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS app.search_words (
+                word TEXT COLLATE "C" PRIMARY KEY
+            );
+        """)
+        cur.execute("""
+            CREATE OR REPLACE FUNCTION app.add_search_words() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'UPDATE' THEN
+                    INSERT INTO app.search_words (word)
+                    SELECT DISTINCT unnest(string_to_array(n.search_name, ' '))
+                      FROM new_rows n JOIN old_rows o USING (user_id)
+                     WHERE n.search_name IS DISTINCT FROM o.search_name
+                    ON CONFLICT (word) DO NOTHING;
+                ELSE
+                    INSERT INTO app.search_words (word)
+                    SELECT DISTINCT unnest(string_to_array(search_name, ' ')) FROM new_rows
+                    ON CONFLICT (word) DO NOTHING;
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        for name, event, referencing in (
+            ("trg_users_search_words_insert", "INSERT", "NEW TABLE AS new_rows"),
+            ("trg_users_search_words_update", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ):
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON app.users;")
+            cur.execute(f"""
+                CREATE TRIGGER {name}
+                AFTER {event} ON app.users
+                REFERENCING {referencing}
+                FOR EACH STATEMENT EXECUTE FUNCTION app.add_search_words();
+            """)
+        # after the triggers: names written meanwhile are added by them
+        cur.execute("""
+            INSERT INTO app.search_words (word)
+            SELECT DISTINCT unnest(string_to_array(search_name, ' ')) FROM app.users
+            ON CONFLICT (word) DO NOTHING;
+        """)
+
+        for name, target in INDEXES:
+            cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target};")
+        cur.execute("ANALYZE app.users;")
+        cur.execute("ANALYZE app.search_words;")
+        print("✅ Migration 025: users search columns and indexes created")
+
+    except Exception as e:
+        print(f"❌ Migration 025 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+def down():
+    """Drop users search indexes and columns (the extensions are left installed)"""
+    conn = get_db_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    try:
+        for name, _ in INDEXES:
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS app.{name};")
+        for name in ("trg_users_search_words_insert", "trg_users_search_words_update"):
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON app.users;")
+        cur.execute("DROP FUNCTION IF EXISTS app.add_search_words();")
+        cur.execute("DROP TABLE IF EXISTS app.search_words;")
+        cur.execute("ALTER TABLE app.users DROP COLUMN IF EXISTS search_name, DROP COLUMN IF EXISTS phone_digits;")
+        cur.execute("DROP FUNCTION IF EXISTS app.search_normalize(text);")
+        cur.execute("DROP FUNCTION IF EXISTS app.phone_digits(text);")
+        cur.execute("DROP FUNCTION IF EXISTS app.search_tail(text, integer);")
+        print("✅ Migration 025 rolled back")
+
+    except Exception as e:
+        print(f"❌ Rollback 025 failed: {e}")
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == "__main__":
+    up()
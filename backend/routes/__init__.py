@@ -1,6 +1,11 @@
 from flask import jsonify
-from db import get_db_connection
+from db import db_connection, pool_stats
 import psycopg2.extras
+from utils import roles
+from utils.auth import auth_stats
+from utils import revocation, hashing
+from utils import weather
+from utils import locations, tracking_stream, outbox
 
 from .auth import auth_bp
 
@@ -13,28 +18,53 @@ def register_routes(app):
     @app.route("/healthz/db")
     def healthz_db():
         try:
-            conn = get_db_connection()
-            cur = conn.cursor(cursor_factory=__import__("psycopg2.extras").extras.RealDictCursor)
-            cur.execute("SELECT current_database() AS db, current_schema() AS schema, NOW() AS now;")
-            row = cur.fetchone()
-            cur.close()
-            conn.close()
+            with db_connection() as conn:
+                cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+                cur.execute("SELECT current_database() AS db, current_schema() AS schema, NOW() AS now;")
+                row = cur.fetchone()
+                cur.close()
             return jsonify({"ok": True, "db": row["db"], "schema": row["schema"], "now": row["now"]})
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
-    
+
+    @app.route("/healthz/db/pool")
+    def healthz_db_pool():
+        # per-process pool statistics (each gunicorn worker has its own pool);
+        # where long-held connections were borrowed is only shown on /admin/db/pool
+        return jsonify({"ok": True, "pool": pool_stats(callers=False)})
+
+    @app.route("/healthz/auth")
+    def healthz_auth():
+        # per-process authentication latency, token cache and password hashing statistics
+        return jsonify({"ok": True, "auth": auth_stats(), "revocation": revocation.stats(),
+                        "hashing": hashing.stats()})
+
+    @app.route("/healthz/weather")
+    def healthz_weather():
+        # per-process weather cache statistics
+        return jsonify({"ok": True, "weather": weather.stats()})
+
+    @app.route("/healthz/locations")
+    def healthz_locations():
+        # per-process GPS ingestion buffer statistics
+        return jsonify({"ok": True, "locations": locations.stats()})
+
+    @app.route("/healthz/tracking")
+    def healthz_tracking():
+        # per-process live tracking stream subscribers
+        return jsonify({"ok": True, "tracking_stream": tracking_stream.stats()})
+
+    @app.route("/healthz/outbox")
+    def healthz_outbox():
+        # per-process notification outbox worker statistics
+        return jsonify({"ok": True, "outbox": outbox.stats()})
 
     # roles test route (from earlier, optional)
 
     @app.route("/roles")
     def get_roles():
         try:
-            conn = get_db_connection()
-            cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-            cur.execute("SELECT * FROM app.roles;")
-            rows = cur.fetchall()
-            cur.close(); conn.close()
-            return jsonify(rows)
+            return jsonify(roles.all_roles())
         except Exception as e:
             return jsonify({"ok": False, "error": str(e)}), 500
 
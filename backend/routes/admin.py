@@ -1,32 +1,14 @@
-from flask import Blueprint, request, jsonify
-from db import get_db_connection
+from flask import Blueprint, request, jsonify, send_file
+from db import get_db_connection, get_request_connection, pool_stats
 import psycopg2.extras
-from utils.auth import decode_jwt
+from utils.auth import current_session, hash_password
+from utils.roles import is_admin, role_id_by_name
 from routes.notifications import push_notification
+from utils.streaming import stream_rows
+from utils import dispatch, outbox, notification_retention, stats, rollups, exports
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
 
-# ---- helpers ----
-def current_session(req):
-    auth = req.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
-        return None, "Missing Bearer token"
-    token = auth.split(" ", 1)[1]
-    try:
-        payload = decode_jwt(token)
-        return {"user_id": int(payload["sub"]), "role_id": int(payload["role_id"])}, None
-    except Exception as e:
-        return None, f"Invalid token: {e}"
-
-def is_admin(session):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT role_name FROM app.roles WHERE role_id = %s;", (session["role_id"],))
-    r = cur.fetchone()
-    cur.close(); conn.close()
-    return r and r[0] == "admin"
-
-
 # ---- Endpoints ----
 
 # KYC Management
@@ -93,7 +75,7 @@ def approve_kyc(user_id):
     if err or not is_admin(session):
         return jsonify({"ok": False, "error": "Admin only"}), 403
     
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor()
     
     # Update verification status
@@ -108,11 +90,9 @@ def approve_kyc(user_id):
     # Get user email for notification
     cur.execute("SELECT email, full_name FROM app.users WHERE user_id = %s;", (user_id,))
     user = cur.fetchone()
+    cur.close()
     
-    conn.commit()
-    cur.close(); conn.close()
-    
-    # Send notification
+    # Send notification, committed with the status change
     if user:
         push_notification(user_id, "KYC Approved", f"Congratulations {user[1]}! Your KYC verification has been approved.")
     
@@ -127,7 +107,7 @@ def reject_kyc(user_id):
     data = request.get_json()
     reason = data.get('reason', 'Document verification failed')
     
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor()
     
     # Update verification status
@@ -142,11 +122,9 @@ def reject_kyc(user_id):
     # Get user email
     cur.execute("SELECT email, full_name FROM app.users WHERE user_id = %s;", (user_id,))
     user = cur.fetchone()
+    cur.close()
     
-    conn.commit()
-    cur.close(); conn.close()
-    
-    # Send notification
+    # Send notification, committed with the status change
     if user:
         push_notification(user_id, "KYC Rejected", f"Sorry {user[1]}, your KYC verification was rejected. Reason: {reason}")
     
@@ -159,20 +137,54 @@ def dashboard_summary():
     if err or not is_admin(session):
         return jsonify({"ok": False, "error": "Admin only"}), 403
 
-    conn = get_db_connection()
+    # totals maintained by triggers (utils/stats.py), a few rows whatever the table sizes
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
-        SELECT
-          (SELECT COUNT(*) FROM app.users) AS total_users,
-          (SELECT COUNT(*) FROM app.orders) AS total_orders,
-          (SELECT COUNT(*) FROM app.deliveries) AS total_deliveries,
-          (SELECT COUNT(*) FROM app.payments WHERE status='SUCCESS') AS total_payments,
-          (SELECT SUM(amount) FROM app.payments WHERE status='SUCCESS') AS revenue;
-    """)
-    stats = cur.fetchone()
-    cur.close(); conn.close()
+    summary = stats.summary(cur)
+    cur.close()
+
+    return jsonify({"ok": True, "summary": summary})
+
+
+# recompute the summary totals and correct any counter drift
+@admin_bp.post("/summary/reconcile")
+def reconcile_summary():
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+
+    drift = stats.reconcile()
+    return jsonify({"ok": True, "drift": {name: str(delta) for name, delta in drift.items()}})
+
+
+# time series of orders, revenue, completion rate and averages, read from the rollups
+@admin_bp.get("/analytics")
+def analytics():
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+
+    query, err = rollups.parse_query(request.args)
+    if err:
+        return jsonify({"ok": False, "error": err}), 400
+    merchant_id = request.args.get("merchant_id", type=int)
+
+    conn = get_request_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    body = rollups.analytics(cur, query, merchant_id)
+    cur.close()
+
+    return jsonify({"ok": True, **body})
 
-    return jsonify({"ok": True, "summary": stats})
+
+# refresh the analytics rollups now (?full=1 rebuilds them from the first order)
+@admin_bp.post("/analytics/refresh")
+def refresh_analytics():
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+    full = request.args.get("full") == "1"
+    return jsonify({"ok": True, "refresh": rollups.refresh(full=full), "stats": rollups.stats()})
 
 
 # list all users
@@ -182,18 +194,12 @@ def list_users():
     if err or not is_admin(session):
         return jsonify({"ok": False, "error": "Admin only"}), 403
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
+    return stream_rows("""
         SELECT u.user_id, u.full_name, u.email, u.phone, r.role_name, u.is_active, u.created_at
           FROM app.users u
           JOIN app.roles r ON u.role_id = r.role_id
          ORDER BY u.created_at DESC;
-    """)
-    users = cur.fetchall()
-    cur.close(); conn.close()
-
-    return jsonify({"ok": True, "users": users})
+    """, key="users")
 
 
 # create new user
@@ -220,20 +226,20 @@ def create_user():
         print(f"[Admin Create User] Validation failed: {error_msg}")
         return jsonify({"ok": False, "error": error_msg}), 400
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
     # Get role_id
-    cur.execute("SELECT role_id FROM app.roles WHERE role_name = %s;", (role_name,))
-    r = cur.fetchone()
-    if not r:
-        cur.close(); conn.close()
+    role_id = role_id_by_name(role_name)
+    if role_id is None:
         error_msg = f"Role '{role_name}' not found"
         print(f"[Admin Create User] Role validation failed: {error_msg}")
         return jsonify({"ok": False, "error": error_msg}), 400
-    role_id = r["role_id"]
     print(f"[Admin Create User] Found role_id: {role_id} for role: {role_name}")
 
+    # hash before borrowing a connection; may raise HashingBusy (503)
+    pwd_hash = hash_password(password)
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
     # Check if email already exists
     cur.execute("SELECT user_id FROM app.users WHERE email = %s;", (email,))
     if cur.fetchone():
@@ -242,10 +248,6 @@ def create_user():
         print(f"[Admin Create User] Duplicate email: {email}")
         return jsonify({"ok": False, "error": error_msg}), 400
 
-    # Hash password
-    from utils.auth import hash_password
-    pwd_hash = hash_password(password)
-
     # Generate username from email
     username = email.split('@')[0]
     
@@ -305,10 +307,8 @@ def create_user():
         conn.commit()
         print(f"[Admin Create User] User created successfully - ID: {user_id}")
 
-        # Get role name for response
-        cur.execute("SELECT role_name FROM app.roles WHERE role_id = %s;", (user["role_id"],))
-        role = cur.fetchone()
-        user["role_name"] = role["role_name"] if role else role_name
+        # Role name for response
+        user["role_name"] = role_name
 
         cur.close(); conn.close()
         return jsonify({"ok": True, "user": user, "message": "User created successfully"})
@@ -327,18 +327,12 @@ def list_orders():
     if err or not is_admin(session):
         return jsonify({"ok": False, "error": "Admin only"}), 403
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
+    return stream_rows("""
         SELECT o.*, u.full_name AS customer_name
           FROM app.orders o
           JOIN app.users u ON o.customer_id = u.user_id
          ORDER BY o.created_at DESC;
-    """)
-    orders = cur.fetchall()
-    cur.close(); conn.close()
-
-    return jsonify({"ok": True, "orders": orders})
+    """, key="orders")
 
 
 # list all deliveries
@@ -348,18 +342,84 @@ def list_deliveries():
     if err or not is_admin(session):
         return jsonify({"ok": False, "error": "Admin only"}), 403
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
+    return stream_rows("""
         SELECT d.*, u.full_name AS shipper_name
           FROM app.deliveries d
           JOIN app.users u ON d.shipper_id = u.user_id
          ORDER BY d.updated_at DESC;
-    """)
-    rows = cur.fetchall()
-    cur.close(); conn.close()
+    """, key="deliveries")
+
+
+# export a whole table as a background job (gzip CSV or Parquet), instead of the list endpoints
+@admin_bp.post("/exports")
+def create_export():
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+
+    data = request.get_json(silent=True) or {}
+    dataset = data.get("dataset")
+    fmt = data.get("format", "csv")
+    if dataset not in exports.DATASETS:
+        return jsonify({"ok": False, "error": f"dataset must be one of {', '.join(exports.DATASETS)}"}), 400
+    if fmt not in exports.FORMATS:
+        return jsonify({"ok": False, "error": "format must be csv or parquet"}), 400
+    if fmt == "parquet" and not exports.parquet_available():
+        return jsonify({"ok": False, "error": "Parquet export is not available on this server"}), 400
 
-    return jsonify({"ok": True, "deliveries": rows})
+    job = exports.create(dataset, fmt, session["user_id"])
+    return jsonify({"ok": True, "job": job}), 202
+
+
+# recent export jobs with their progress
+@admin_bp.get("/exports")
+def list_exports():
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+
+    conn = get_request_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    jobs = exports.recent(cur)
+    cur.close()
+    return jsonify({"ok": True, "jobs": jobs, "stats": exports.stats()})
+
+
+@admin_bp.get("/exports/<int:job_id>")
+def export_status(job_id):
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+
+    conn = get_request_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    job = exports.get(cur, job_id)
+    cur.close()
+    if not job:
+        return jsonify({"ok": False, "error": "Export not found"}), 404
+    return jsonify({"ok": True, "job": exports.describe(job)})
+
+
+# the finished file; supports Range requests so large downloads can resume
+@admin_bp.get("/exports/<int:job_id>/download")
+def download_export(job_id):
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+
+    conn = get_request_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    job = exports.get(cur, job_id)
+    cur.close()
+    if not job:
+        return jsonify({"ok": False, "error": "Export not found"}), 404
+    if job["status"] != "DONE":
+        return jsonify({"ok": False, "error": f"Export is {job['status']}", "job": exports.describe(job)}), 409
+    try:
+        return send_file(job["file_path"], mimetype=exports.mimetype(job), as_attachment=True,
+                         download_name=exports.download_name(job), conditional=True, max_age=0)
+    except FileNotFoundError:
+        return jsonify({"ok": False, "error": "Export file no longer exists"}), 410
 
 
 # force refund for an order
@@ -369,7 +429,7 @@ def admin_refund(order_id):
     if err or not is_admin(session):
         return jsonify({"ok": False, "error": "Admin only"}), 403
 
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
     cur.execute("""
@@ -379,16 +439,91 @@ def admin_refund(order_id):
      RETURNING *;
     """, (order_id,))
     payment = cur.fetchone()
-    conn.commit()
+    cur.close()
 
     if payment:
         push_notification(payment["order_id"], "Payment Refunded",
                           f"Admin refunded payment for order #{order_id}.")
-    cur.close(); conn.close()
 
     return jsonify({"ok": True, "payment": payment})
 
 
+# run a dispatch round now (matches pending orders to idle shippers)
+@admin_bp.post("/dispatch/run")
+def run_dispatch():
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+
+    method = (request.get_json(silent=True) or {}).get("method", dispatch.DISPATCH_METHOD)
+    if method not in ("auto", "hungarian", "greedy"):
+        return jsonify({"ok": False, "error": "method must be auto, hungarian or greedy"}), 400
+    return jsonify({"ok": True, "dispatch": dispatch.run_once(method)})
+
+
+@admin_bp.get("/dispatch")
+def dispatch_status():
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+    return jsonify({"ok": True, "dispatch": dispatch.stats()})
+
+
+# connection pool of this process
+@admin_bp.get("/db/pool")
+def db_pool():
+    """/healthz/db/pool with the code locations that borrowed long-held connections"""
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+    return jsonify({"ok": True, "pool": pool_stats()})
+
+
+# notification outbox: queue depth and dead letters
+@admin_bp.get("/notifications/outbox")
+def notification_outbox():
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+
+    conn = get_request_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    backlog = outbox.backlog(cur)
+    cur.execute("""
+        SELECT id, user_id, title, attempts, last_error, created_at, dead_at
+          FROM app.notification_outbox
+         WHERE dead_at IS NOT NULL
+         ORDER BY dead_at DESC
+         LIMIT 100;
+    """)
+    dead = cur.fetchall()
+    cur.close()
+    return jsonify({"ok": True, "backlog": backlog, "worker": outbox.stats(), "dead_letters": dead})
+
+
+@admin_bp.post("/notifications/outbox/retry")
+def retry_notification_outbox():
+    """Requeue dead letters: {"ids": [...]} or every dead letter when ids is omitted"""
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+
+    ids = (request.get_json(silent=True) or {}).get("ids")
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return jsonify({"ok": False, "error": "ids must be a list of integers"}), 400
+    return jsonify({"ok": True, "requeued": outbox.retry_dead(ids)})
+
+
+# notification partitions: create upcoming months, drop or archive expired ones now
+@admin_bp.post("/notifications/retention/run")
+def run_notification_retention():
+    session, err = current_session(request)
+    if err or not is_admin(session):
+        return jsonify({"ok": False, "error": "Admin only"}), 403
+    return jsonify({"ok": True, "retention": notification_retention.run_once(),
+                    "stats": notification_retention.stats()})
+
+
 # Role Registration Approvals
 @admin_bp.get("/role-registrations/pending")
 def get_pending_role_registrations():
@@ -465,7 +600,7 @@ def approve_role_registration(user_role_id):
     if err or not is_admin(session):
         return jsonify({"ok": False, "error": "Admin only"}), 403
     
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor()
     
     try:
@@ -498,9 +633,7 @@ def approve_role_registration(user_role_id):
         # Note: shipper_profiles doesn't have user_id column, skip update
         # Shipper verification handled separately through KYC process
         
-        conn.commit()
-        
-        # Send notification
+        # Send notification, committed with the registration change
         role_names = {2: 'Merchant', 3: 'Shipper'}
         role_name = role_names.get(role_id, 'Role')
         push_notification(
@@ -508,16 +641,13 @@ def approve_role_registration(user_role_id):
             f"{role_name} Registration Approved",
             f"Congratulations! Your {role_name.lower()} registration has been approved."
         )
-        
         cur.close()
-        conn.close()
         
         return jsonify({"ok": True, "message": "Registration approved"})
         
     except Exception as e:
-        conn.rollback()
+        # the error status rolls the request transaction back
         cur.close()
-        conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
 @admin_bp.put("/role-registrations/<int:user_role_id>/reject")
@@ -530,7 +660,7 @@ def reject_role_registration(user_role_id):
     data = request.get_json()
     reason = data.get('reason', 'Not specified')
     
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor()
     
     try:
@@ -558,9 +688,7 @@ def reject_role_registration(user_role_id):
         elif role_id == 3:  # Shipper
             cur.execute("DELETE FROM app.shipper_profiles WHERE user_id = %s", (user_id,))
         
-        conn.commit()
-        
-        # Send notification
+        # Send notification, committed with the registration change
         role_names = {2: 'Merchant', 3: 'Shipper'}
         role_name = role_names.get(role_id, 'Role')
         push_notification(
@@ -568,15 +696,12 @@ def reject_role_registration(user_role_id):
             f"{role_name} Registration Rejected",
             f"Your {role_name.lower()} registration was rejected. Reason: {reason}"
         )
-        
         cur.close()
-        conn.close()
         
         return jsonify({"ok": True, "message": "Registration rejected"})
         
     except Exception as e:
-        conn.rollback()
+        # the error status rolls the request transaction back
         cur.close()
-        conn.close()
         return jsonify({"ok": False, "error": str(e)}), 500
 
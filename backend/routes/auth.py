@@ -1,10 +1,12 @@
 # routes/auth.py
 from flask import Blueprint, request, jsonify
-from db import get_db_connection
+from db import get_db_connection, db_connection
 from firebase_admin import auth as firebase_auth
 import psycopg2.extras
-from utils.auth import hash_password, check_password, create_jwt, decode_jwt
-from datetime import datetime, timedelta
+from utils.auth import hash_password, check_password, needs_rehash, create_jwt, verify_token, forget_token, bearer_token
+from utils import revocation
+from utils.hashing import HashingBusy
+from utils.roles import role_id_by_name, role_name
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
@@ -29,41 +31,47 @@ def save_token(user_id: int, token: str, minutes: int = 1440):
 def revoke_token(token: str):
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("UPDATE app.api_tokens SET revoked = TRUE WHERE token = %s;", (token,))
+    cur.execute("""
+        UPDATE app.api_tokens SET revoked = TRUE
+         WHERE token = %s
+     RETURNING EXTRACT(EPOCH FROM expires_at)::float8;
+    """, (token,))
+    row = cur.fetchone()
     conn.commit()
     cur.close(); conn.close()
+    forget_token(token)
+    if row:
+        # other workers pick this up from the tokens_revoked notification
+        revocation.revoke(token, row[0])
 
 # Middleware-like helper: verify token is valid & not revoked/expired
 def get_user_from_token(token: str):
     try:
-        payload = decode_jwt(token)
+        key = revocation.token_key(token)
+        claims = verify_token(token, key)
     except Exception as e:
         return None, f"Invalid token: {e}"
 
+    if revocation.is_revoked(key):
+        return None, "Token revoked"
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute(
         """
-        SELECT t.user_id, t.expires_at, t.revoked, u.username, u.email, u.role_id, u.full_name, r.role_name
-        FROM app.api_tokens t
-        JOIN app.users u ON u.user_id = t.user_id
-        JOIN app.roles r ON u.role_id = r.role_id
-        WHERE t.token = %s
+        SELECT user_id, username, email, role_id, full_name
+        FROM app.users
+        WHERE user_id = %s
         """,
-        (token,)
+        (int(claims["sub"]),)
     )
     row = cur.fetchone()
     cur.close(); conn.close()
 
     if not row:
-        return None, "Token not found"
-
-    if row["revoked"]:
-        return None, "Token revoked"
-
-    if row["expires_at"] < datetime.utcnow():
-        return None, "Token expired"
+        return None, "User not found"
 
+    row["role_name"] = role_name(row["role_id"])
     return row, None
 
 # --------- ROUTES ---------
@@ -82,18 +90,17 @@ def register():
         return jsonify({"ok": False, "error": "username, email, password are required"}), 400
 
     # find role_id
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT role_id FROM app.roles WHERE role_name = %s;", (role,))
-    r = cur.fetchone()
-    if not r:
-        cur.close(); conn.close()
+    role_id = role_id_by_name(role)
+    if role_id is None:
         return jsonify({"ok": False, "error": f"role '{role}' not found"}), 400
-    role_id = r["role_id"]
+
+    # hash before borrowing a connection; may raise HashingBusy (503)
+    pwd_hash = hash_password(password)
 
     # insert user
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     try:
-        pwd_hash = hash_password(password)
         cur.execute(
             """
             INSERT INTO app.users (username, password_hash, email, phone, full_name, role_id)
@@ -152,32 +159,46 @@ def login():
     if not username_or_email or not password:
         return jsonify({"ok": False, "error": "username/email and password are required"}), 400
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    # the connection is released before bcrypt runs: verification can wait for
+    # a hashing slot and must not hold a pooled connection meanwhile
+    with db_connection() as conn:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        # allow login by username or email
+        cur.execute(
+            """
+            SELECT u.user_id, u.username, u.email, u.password_hash, u.role_id, u.is_active, u.current_role_id, u.full_name, r.role_name
+            FROM app.users u
+            JOIN app.roles r ON u.role_id = r.role_id
+            WHERE u.username = %s OR u.email = %s
+            """,
+            (username_or_email, username_or_email)
+        )
+        user = cur.fetchone()
+        cur.close()
 
-    # allow login by username or email
-    cur.execute(
-        """
-        SELECT u.user_id, u.username, u.email, u.password_hash, u.role_id, u.is_active, u.current_role_id, u.full_name, r.role_name
-        FROM app.users u
-        JOIN app.roles r ON u.role_id = r.role_id
-        WHERE u.username = %s OR u.email = %s
-        """,
-        (username_or_email, username_or_email)
-    )
-    user = cur.fetchone()
     if not user:
-        cur.close(); conn.close()
         return jsonify({"ok": False, "error": "User not found"}), 404
 
     if not user["is_active"]:
-        cur.close(); conn.close()
         return jsonify({"ok": False, "error": "User is inactive"}), 403
 
     if not check_password(password, user["password_hash"]):
-        cur.close(); conn.close()
         return jsonify({"ok": False, "error": "Invalid credentials"}), 401
 
+    # upgrade hashes made with a different BCRYPT_ROUNDS while we have the plain password
+    new_hash = None
+    if needs_rehash(user["password_hash"]):
+        try:
+            new_hash = hash_password(password)
+        except HashingBusy:
+            pass   # retried on a later login
+    if new_hash:
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("UPDATE app.users SET password_hash = %s WHERE user_id = %s;", (new_hash, user["user_id"]))
+            conn.commit()
+            cur.close()
+
     # Get current role or default to role_id
     current_role_id = user.get("current_role_id") or user["role_id"]
 
@@ -185,8 +206,6 @@ def login():
     token = create_jwt({"sub": str(user["user_id"]), "username": user["username"], "role_id": user["role_id"]})
     save_token(user["user_id"], token)
 
-    cur.close(); conn.close()
-
     return jsonify({
         "ok": True,
         "token": token,
@@ -204,19 +223,17 @@ def login():
 @auth_bp.post("/logout")
 def logout():
 
-    auth = request.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
+    token = bearer_token(request)
+    if token is None:
         return jsonify({"ok": False, "error": "Missing Bearer token"}), 401
-    token = auth.split(" ", 1)[1]
     revoke_token(token)
     return jsonify({"ok": True, "message": "Logged out"}), 200
 
 @auth_bp.get("/me")
 def me():
-    auth = request.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
+    token = bearer_token(request)
+    if token is None:
         return jsonify({"ok": False, "error": "Missing Bearer token"}), 401
-    token = auth.split(" ", 1)[1]
 
     user_row, err = get_user_from_token(token)
     if err:
@@ -1,63 +1,282 @@
-from flask import Blueprint, request, jsonify
-from db import get_db_connection
+from flask import Blueprint, request, jsonify, Response
+from db import get_request_connection
 import psycopg2.extras
-from utils.auth import decode_jwt
-from routes.notifications import push_notification
+from utils.auth import current_session, create_stream_token, stream_session, STREAM_TOKEN_SECONDS
+from utils.roles import role_name
+from routes.notifications import push_notifications
+from utils.streaming import stream_rows, to_json
+from utils import geo, routing, locations, tracking_stream
+from werkzeug.http import parse_date
+import os, math, time, queue, datetime, threading
+from collections import OrderedDict
 
 deliveries_bp = Blueprint("deliveries", __name__, url_prefix="/deliveries")
 
-# ---------------- Helpers ----------------
-def current_session(req):
-    auth = req.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
-        return None, "Missing Bearer token"
-    token = auth.split(" ", 1)[1]
-    try:
-        payload = decode_jwt(token)
-        return {"user_id": int(payload["sub"]), "role_id": int(payload["role_id"])}, None
-    except Exception as e:
-        return None, f"Invalid token: {e}"
+AVAILABLE_DEFAULT_K = int(os.getenv("AVAILABLE_DEFAULT_K", "20"))
+AVAILABLE_MAX_K = int(os.getenv("AVAILABLE_MAX_K", "100"))
+AVAILABLE_DEFAULT_RADIUS_KM = float(os.getenv("AVAILABLE_DEFAULT_RADIUS_KM", "5"))
+AVAILABLE_MAX_RADIUS_KM = float(os.getenv("AVAILABLE_MAX_RADIUS_KM", "50"))
+
+# great-circle distance (km) from (%s lat, %s lat, %s lng) to the order's pickup point
+PICKUP_DISTANCE_SQL = """
+    2 * 6371 * ASIN(SQRT(LEAST(1,
+        POWER(SIN(RADIANS(o.pickup_lat - %s) / 2), 2)
+        + COS(RADIANS(%s)) * COS(RADIANS(o.pickup_lat)) * POWER(SIN(RADIANS(o.pickup_lng - %s) / 2), 2)
+    )))
+"""
+
+_geohash_column = None
+
+LOCATION_MAX_POINTS = int(os.getenv("LOCATION_MAX_POINTS", "500"))
+LOCATION_OWNER_TTL = float(os.getenv("LOCATION_OWNER_TTL", "30"))
+LOCATION_OWNER_CACHE_SIZE = int(os.getenv("LOCATION_OWNER_CACHE_SIZE", "10000"))
+_owners = OrderedDict()   # delivery_id -> (shipper_id or None, expires_at monotonic), least recently used first
+_owners_lock = threading.Lock()
+
+TRACKING_STREAM_HISTORY = int(os.getenv("TRACKING_STREAM_HISTORY", "100"))
+TRACKING_STREAM_HEARTBEAT = float(os.getenv("TRACKING_STREAM_HEARTBEAT", "15"))
+# streams end after this long; EventSource reconnects on its own with Last-Event-ID
+TRACKING_STREAM_MAX_SECONDS = float(os.getenv("TRACKING_STREAM_MAX_SECONDS", "600"))
+
+# order/payment/wallet cascade of a delivery status change, one statement each;
+# data-modifying CTEs all run, and see the orders as they were before the statement
+CASCADE_SQL = {
+    "ONGOING": """
+        WITH moved AS (
+            UPDATE app.orders SET status = 'ONGOING'
+             WHERE delivery_id = %(delivery_id)s
+         RETURNING customer_id
+        )
+        SELECT COUNT(*) AS orders, ARRAY(SELECT DISTINCT customer_id FROM moved) AS customers FROM moved;
+    """,
+    "COMPLETED": """
+        WITH done AS (
+            UPDATE app.orders SET status = 'COMPLETED'
+             WHERE delivery_id = %(delivery_id)s
+         RETURNING order_id, customer_id, price_estimate
+        ), paid AS (
+            -- CASH payments still pending are collected on delivery
+            UPDATE app.payments p
+               SET status = 'SUCCESS', paid_at = NOW()
+              FROM done
+             WHERE p.order_id = done.order_id AND p.method = 'CASH' AND p.status = 'PENDING'
+         RETURNING p.payment_id
+        ), earning AS (
+            SELECT COALESCE(SUM(price_estimate), 0) AS amount FROM done
+        ), wallet AS (
+            INSERT INTO app.shipper_wallets (shipper_id, balance, updated_at)
+            SELECT %(shipper_id)s, amount, NOW() FROM earning
+            ON CONFLICT (shipper_id) DO UPDATE
+               SET balance = app.shipper_wallets.balance + EXCLUDED.balance, updated_at = NOW()
+         RETURNING balance
+        ), ledger AS (
+            INSERT INTO app.shipper_wallet_transactions
+                (shipper_id, amount, type, ref_delivery_id, note, balance_after, created_at)
+            SELECT %(shipper_id)s, earning.amount, 'CREDIT', %(delivery_id)s, %(note)s, wallet.balance, NOW()
+              FROM earning, wallet
+        )
+        SELECT (SELECT COUNT(*) FROM done) AS orders,
+               (SELECT COUNT(*) FROM paid) AS payments,
+               (SELECT amount FROM earning) AS earning,
+               (SELECT balance FROM wallet) AS balance,
+               ARRAY(SELECT DISTINCT customer_id FROM done) AS customers;
+    """,
+    "CANCELED": """
+        WITH canceled AS (
+            UPDATE app.orders SET status = 'CANCELED'
+             WHERE delivery_id = %(delivery_id)s
+         RETURNING order_id, customer_id
+        ), refunded AS (
+            UPDATE app.payments p
+               SET refunded = true, status = 'FAILED'
+              FROM canceled
+             WHERE p.order_id = canceled.order_id
+         RETURNING p.payment_id
+        )
+        SELECT (SELECT COUNT(*) FROM canceled) AS orders,
+               (SELECT COUNT(*) FROM refunded) AS payments,
+               ARRAY(SELECT DISTINCT customer_id FROM canceled) AS customers;
+    """,
+}
 
-def role_name(role_id:int):
-    conn = get_db_connection()
+# ---------------- Helpers ----------------
+def _active_delivery_owner(delivery_id:int):
+    """Shipper of an ASSIGNED/ONGOING delivery, cached briefly so GPS reports skip the lookup."""
+    now = time.monotonic()
+    with _owners_lock:
+        cached = _owners.get(delivery_id)
+        if cached and cached[1] > now:
+            _owners.move_to_end(delivery_id)
+            return cached[0]
+    conn = get_request_connection()
     cur = conn.cursor()
-    cur.execute("SELECT role_name FROM app.roles WHERE role_id = %s;", (role_id,))
-    r = cur.fetchone()
-    cur.close(); conn.close()
-    return r[0] if r else None
+    cur.execute("SELECT shipper_id FROM app.deliveries WHERE delivery_id = %s AND status IN ('ASSIGNED', 'ONGOING');",
+                (delivery_id,))
+    row = cur.fetchone()
+    cur.close()
+    owner = row[0] if row else None
+    with _owners_lock:
+        _owners[delivery_id] = (owner, now + LOCATION_OWNER_TTL)
+        _owners.move_to_end(delivery_id)
+        while len(_owners) > LOCATION_OWNER_CACHE_SIZE:
+            _owners.popitem(last=False)
+    return owner
+
+def _can_track(session, delivery_id:int):
+    """Admins, the delivery's shipper and customers with an order on it may see its tracking."""
+    if role_name(session["role_id"]) == "admin":
+        return True
+    conn = get_request_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM app.deliveries WHERE delivery_id = %(d)s AND shipper_id = %(u)s)
+            OR EXISTS (SELECT 1 FROM app.orders WHERE delivery_id = %(d)s AND customer_id = %(u)s);
+    """, {"d": delivery_id, "u": session["user_id"]})
+    allowed = cur.fetchone()[0]
+    cur.close()
+    return allowed
+
+def _has_pickup_geohash(cur):
+    """Whether migration 014 (orders.pickup_geohash) has been applied; checked once per process."""
+    global _geohash_column
+    if _geohash_column is None:
+        cur.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = 'app' AND table_name = 'orders' AND column_name = 'pickup_geohash';
+        """)
+        _geohash_column = cur.fetchone() is not None
+    return _geohash_column
+
+def _parse_since(value:str):
+    """Naive UTC datetime from an ISO 8601 or HTTP date (as returned in created_at), or None."""
+    parsed = parse_date(value)
+    if parsed is None:
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
 
 def append_tracking(delivery_id:int, event_type:str, status:str=None, note:str=None, lat=None, lng=None):
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor()
     cur.execute("""
         INSERT INTO app.tracking_events (delivery_id, event_type, status, description, lat, lng)
         VALUES (%s, %s, %s, %s, %s, %s);
     """, (delivery_id, event_type, status, note, lat, lng))
-    conn.commit()
-    cur.close(); conn.close()
+    cur.close()
+
+
+def assign_orders(cur, shipper_id:int, order_ids:list, max_capacity=None, start=None, note:str=None):
+    """
+    Create an ASSIGNED delivery for shipper_id carrying order_ids, with its
+    planned route. Returns the delivery row, or None (nothing written) if any
+    order is no longer pending. Used by POST /deliveries and the dispatcher
+    (utils/dispatch.py); runs on the caller's cursor and transaction.
+    """
+    # lock the orders so a concurrent assignment waits and then sees them taken
+    cur.execute("""
+        SELECT order_id, pickup_lat, pickup_lng, delivery_lat, delivery_lng
+          FROM app.orders
+         WHERE order_id = ANY(%s) AND status = 'PENDING' AND delivery_id IS NULL
+         FOR UPDATE;
+    """, (order_ids,))
+    stops = cur.fetchall()
+    if len(stops) != len(set(order_ids)):
+        return None
+    stops.sort(key=lambda o: order_ids.index(o["order_id"]))
 
+    # create delivery
+    cur.execute("""
+        INSERT INTO app.deliveries (shipper_id, max_capacity, status, assigned_at, updated_at, route_plan)
+        VALUES (%s, %s, 'ASSIGNED', NOW(), NOW(), %s)
+        RETURNING *;
+    """, (shipper_id, max_capacity or len(order_ids), psycopg2.extras.Json(routing.plan_route(stops, start))))
+    delivery = cur.fetchone()
+
+    # link orders to this delivery
+    cur.execute("""
+        UPDATE app.orders
+           SET delivery_id = %s, status = 'ASSIGNED'
+         WHERE order_id = ANY(%s);
+    """, (delivery["delivery_id"], order_ids))
+
+    cur.execute("""
+        INSERT INTO app.tracking_events (delivery_id, event_type, status, description)
+        VALUES (%s, 'STATUS', 'ASSIGNED', %s);
+    """, (delivery["delivery_id"], note))
+    return delivery
 
 # ---------------- Endpoints ----------------
 
 # list all available orders (for shippers)
 @deliveries_bp.get("/available")
 def available_orders():
+    """
+    GET /deliveries/available?lat=..&lng=..&radius_km=5&k=20
+    Nearest K pending orders around the shipper (newest K without a location).
+    """
     session, err = current_session(request)
     if err:
         return jsonify({"ok": False, "error": err}), 401
     if role_name(session["role_id"]) != "shipper":
         return jsonify({"ok": False, "error": "Only shippers can view available orders"}), 403
 
-    conn = get_db_connection()
+    try:
+        k = min(int(request.args.get("k", AVAILABLE_DEFAULT_K)), AVAILABLE_MAX_K)
+        radius_km = min(float(request.args.get("radius_km", AVAILABLE_DEFAULT_RADIUS_KM)), AVAILABLE_MAX_RADIUS_KM)
+        lat, lng = request.args.get("lat"), request.args.get("lng")
+        lat, lng = (float(lat), float(lng)) if lat is not None and lng is not None else (None, None)
+    except ValueError:
+        return jsonify({"ok": False, "error": "lat, lng, radius_km and k must be numbers"}), 400
+    if k < 1 or radius_km <= 0:
+        return jsonify({"ok": False, "error": "k and radius_km must be positive"}), 400
+
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     # Get only PENDING orders that shippers can accept
-    cur.execute("""
-        SELECT * FROM app.orders 
-        WHERE status = 'PENDING' AND delivery_id IS NULL
-        ORDER BY created_at DESC;
-    """)
-    rows = cur.fetchall()
-    cur.close(); conn.close()
+    if lat is None:
+        cur.execute("""
+            SELECT * FROM app.orders
+            WHERE status = 'PENDING' AND delivery_id IS NULL
+            ORDER BY created_at DESC
+            LIMIT %s;
+        """, (k,))
+        rows = cur.fetchall()
+    elif _has_pickup_geohash(cur):
+        # only the index ranges of the cells around the shipper are read
+        prefixes = geo.covering_cells(lat, lng, radius_km)
+        cur.execute(f"""
+            SELECT * FROM (
+                SELECT o.*, {PICKUP_DISTANCE_SQL} AS distance_to_pickup_km
+                FROM app.orders o
+                WHERE o.status = 'PENDING' AND o.delivery_id IS NULL
+                  AND ({" OR ".join(["o.pickup_geohash LIKE %s"] * len(prefixes))})
+            ) nearby
+            WHERE distance_to_pickup_km <= %s
+            ORDER BY distance_to_pickup_km, order_id
+            LIMIT %s;
+        """, [lat, lat, lng] + [p + "%" for p in prefixes] + [radius_km, k])
+        rows = cur.fetchall()
+    else:
+        # pickup_geohash not migrated yet: bounding box in SQL, rank in-process
+        d_lat = radius_km / 111.0
+        d_lng = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        cur.execute("""
+            SELECT * FROM app.orders
+            WHERE status = 'PENDING' AND delivery_id IS NULL
+              AND pickup_lat BETWEEN %s AND %s AND pickup_lng BETWEEN %s AND %s;
+        """, (lat - d_lat, lat + d_lat, lng - d_lng, lng + d_lng))
+        by_id = {row["order_id"]: row for row in cur.fetchall()}
+        grid = geo.GridIndex()
+        for row in by_id.values():
+            grid.insert(row["order_id"], row["pickup_lat"], row["pickup_lng"])
+        rows = []
+        for distance, order_id in grid.nearest(lat, lng, radius_km, k):
+            rows.append({**by_id[order_id], "distance_to_pickup_km": distance})
+    cur.close()
 
     return jsonify({"ok": True, "orders": rows})
 
@@ -72,40 +291,28 @@ def create_delivery():
 
     data = request.get_json(force=True)
     order_ids = data.get("order_ids")  # list of order IDs to pick up
-    max_capacity = data.get("max_capacity", len(order_ids))
 
     if not order_ids or not isinstance(order_ids, list):
         return jsonify({"ok": False, "error": "order_ids (list) required"}), 400
+    max_capacity = data.get("max_capacity", len(order_ids))
 
-    conn = get_db_connection()
+    # plan the stop sequence from the shipper's position if given
+    start = None
+    if data.get("lat") is not None and data.get("lng") is not None:
+        try:
+            start = (float(data["lat"]), float(data["lng"]))
+            if not (-90 <= start[0] <= 90 and -180 <= start[1] <= 180):
+                raise ValueError
+        except (ValueError, TypeError):
+            return jsonify({"ok": False, "error": "lat and lng must be valid coordinates"}), 400
+
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-
-    # ensure all orders are pending
-    cur.execute("SELECT order_id FROM app.orders WHERE order_id = ANY(%s) AND status = 'PENDING';", (order_ids,))
-    valid = cur.fetchall()
-    if len(valid) != len(order_ids):
+    delivery = assign_orders(cur, session["user_id"], order_ids, max_capacity, start, "Delivery created by shipper")
+    cur.close()
+    if delivery is None:
         return jsonify({"ok": False, "error": "Some orders are not available"}), 409
 
-    # create delivery
-    cur.execute("""
-        INSERT INTO app.deliveries (shipper_id, max_capacity, status, assigned_at, updated_at)
-        VALUES (%s, %s, 'ASSIGNED', NOW(), NOW())
-        RETURNING *;
-    """, (session["user_id"], max_capacity))
-    delivery = cur.fetchone()
-
-    # link orders to this delivery
-    cur.execute("""
-        UPDATE app.orders
-           SET delivery_id = %s, status = 'ASSIGNED'
-         WHERE order_id = ANY(%s);
-    """, (delivery["delivery_id"], order_ids))
-
-    conn.commit()
-    cur.close(); conn.close()
-
-    append_tracking(delivery["delivery_id"], "STATUS", "ASSIGNED", "Delivery created by shipper")
-
     return jsonify({"ok": True, "delivery": delivery})
 
 
@@ -127,118 +334,84 @@ def update_delivery_status(delivery_id):
     if new_status not in ["ONGOING", "COMPLETED", "CANCELED"]:
         return jsonify({"ok": False, "error": "Invalid status"}), 400
 
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-    # ensure delivery belongs to this shipper
-    cur.execute("SELECT * FROM app.deliveries WHERE delivery_id = %s AND shipper_id = %s;",
-                (delivery_id, session["user_id"]))
-    delivery = cur.fetchone()
-    if not delivery:
-        return jsonify({"ok": False, "error": "Delivery not found or not owned"}), 404
-
-    # update delivery
+    # update delivery (only if it belongs to this shipper)
     cur.execute("""
         UPDATE app.deliveries
            SET status = %s, updated_at = NOW(),
                delivered_at = CASE WHEN %s = 'COMPLETED' THEN NOW() ELSE delivered_at END
-         WHERE delivery_id = %s
+         WHERE delivery_id = %s AND shipper_id = %s
      RETURNING *;
-    """, (new_status, new_status, delivery_id))
+    """, (new_status, new_status, delivery_id, session["user_id"]))
     updated = cur.fetchone()
+    if not updated:
+        return jsonify({"ok": False, "error": "Delivery not found or not owned"}), 404
 
     # -------- cascade logic --------
-    if new_status == "ONGOING":
-        # mark all orders in this delivery as ONGOING
-        cur.execute("""
-            UPDATE app.orders
-               SET status = 'ONGOING'
-             WHERE delivery_id = %s;
-        """, (delivery_id,))
-        print(f"[INFO] Updated orders to ONGOING for delivery_id={delivery_id}")
-    
-    elif new_status == "COMPLETED":
-        # mark all orders in this delivery as COMPLETED
-        cur.execute("""
-            UPDATE app.orders
-               SET status = 'COMPLETED'
-             WHERE delivery_id = %s
-         RETURNING order_id, price_estimate;
-        """, (delivery_id,))
-        orders = cur.fetchall()
-        print(f"[INFO] Updated {len(orders)} orders to COMPLETED for delivery_id={delivery_id}")
-
-        # update payments (CASH → SUCCESS if still pending)
-        for o in orders:
-            cur.execute("""
-                UPDATE app.payments
-                   SET status = 'SUCCESS', paid_at = NOW()
-                 WHERE order_id = %s AND method = 'CASH' AND status = 'PENDING';
-            """, (o["order_id"],))
-
-        # credit shipper wallet
-        total_earning = sum([o["price_estimate"] or 0 for o in orders])
-        cur.execute("""
-            UPDATE app.shipper_wallets
-               SET balance = balance + %s, updated_at = NOW()
-             WHERE shipper_id = %s
-         RETURNING balance;
-        """, (total_earning, session["user_id"]))
-        wallet = cur.fetchone()
-
-        # log wallet transaction
-        cur.execute("""
-            INSERT INTO app.shipper_wallet_transactions
-                (shipper_id, amount, type, ref_delivery_id, note, balance_after, created_at)
-            VALUES (%s, %s, 'CREDIT', %s, %s, %s, NOW());
-        """, (session["user_id"], total_earning, delivery_id,
-              "Earnings from completed delivery", wallet["balance"]))
+    # one statement per status whatever the number of orders; everything
+    # below commits or rolls back with the request transaction
+    cur.execute(CASCADE_SQL[new_status], {"delivery_id": delivery_id, "shipper_id": session["user_id"],
+                                          "note": "Earnings from completed delivery"})
+    cascade = cur.fetchone()
+    cur.close()
+    print(f"[INFO] Updated {cascade['orders']} orders to {new_status} for delivery_id={delivery_id}")
 
-    elif new_status == "CANCELED":
-        # Cancel all linked orders
-        cur.execute("""
-            UPDATE app.orders
-               SET status = 'CANCELED'
-             WHERE delivery_id = %s;
-        """, (delivery_id,))
-        # Refund payments
-        cur.execute("""
-            UPDATE app.payments
-               SET refunded = true, status = 'FAILED'
-             WHERE order_id IN (SELECT order_id FROM app.orders WHERE delivery_id = %s);
-        """, (delivery_id,))
+    append_tracking(delivery_id, "STATUS", new_status, note, lat, lng)
 
-    conn.commit()
-    cur.close(); conn.close()
+    # notify the shipper and every customer with an order in this delivery
+    messages = {
+        "ONGOING": f"Your delivery #{delivery_id} is now in progress.",
+        "COMPLETED": f"Your delivery #{delivery_id} has been completed. Thank you!",
+        "CANCELED": f"Your delivery #{delivery_id} was canceled.",
+    }
+    push_notifications(
+        [(session["user_id"], "Delivery Update", f"Your delivery #{delivery_id} status changed to {new_status}.")]
+        + [(cid, "Delivery Update", messages[new_status]) for cid in cascade["customers"]])
 
-    append_tracking(delivery_id, "STATUS", new_status, note, lat, lng)
+    return jsonify({"ok": True, "delivery": updated})
 
-    try:
-    # Notify the shipper about the status change
-        push_notification(session["user_id"],
-                        "Delivery Update",
-                        f"Your delivery #{delivery_id} status changed to {new_status}.")
-
-        # Notify all customers whose orders are in this delivery
-        cur = conn.cursor()
-        cur.execute("SELECT DISTINCT customer_id FROM app.orders WHERE delivery_id = %s;", (delivery_id,))
-        customers = [r[0] for r in cur.fetchall()]
-        cur.close()
 
-        for cid in customers:
-            msg = ""
-            if new_status == "ONGOING":
-                msg = f"Your delivery #{delivery_id} is now in progress."
-            elif new_status == "COMPLETED":
-                msg = f"Your delivery #{delivery_id} has been completed. Thank you!"
-            elif new_status == "CANCELED":
-                msg = f"Your delivery #{delivery_id} was canceled."
+# shipper reports GPS points (batched, written asynchronously)
+@deliveries_bp.post("/<int:delivery_id>/locations")
+def report_locations(delivery_id):
+    """
+    POST /deliveries/<id>/locations
+    {"points": [{"lat": .., "lng": .., "ts": <epoch seconds, optional>}, ...]} or a single {"lat", "lng"}
+    Answers 202 once the points are buffered; see utils/locations.py.
+    """
+    session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+    if role_name(session["role_id"]) != "shipper":
+        return jsonify({"ok": False, "error": "Only shippers can report locations"}), 403
 
-            push_notification(cid, "Delivery Update", msg)
-    except Exception as e:
-        print("Notification error:", e)
+    data = request.get_json(force=True) or {}
+    raw = data.get("points") if "points" in data else [data]
+    if not isinstance(raw, list) or not raw:
+        return jsonify({"ok": False, "error": "points (list) required"}), 400
+    if len(raw) > LOCATION_MAX_POINTS:
+        return jsonify({"ok": False, "error": f"At most {LOCATION_MAX_POINTS} points per request"}), 400
 
-    return jsonify({"ok": True, "delivery": updated})
+    now = time.time()
+    try:
+        points = []
+        for p in raw:
+            lat, lng = float(p["lat"]), float(p["lng"])
+            ts = float(p["ts"]) if p.get("ts") is not None else now
+            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+                raise ValueError
+            # device clocks drift: keep timestamps within a sane window
+            points.append((delivery_id, lat, lng, min(max(ts, now - 86400), now + 60)))
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return jsonify({"ok": False, "error": "Each point needs numeric lat and lng (ts optional)"}), 400
+
+    if _active_delivery_owner(delivery_id) != session["user_id"]:
+        return jsonify({"ok": False, "error": "Delivery not found, not owned or not active"}), 404
+
+    accepted = locations.enqueue(points)
+    return jsonify({"ok": True, "accepted": accepted, "dropped": len(points) - accepted}), 202
 
 
 #shipper views their deliveries
@@ -250,11 +423,11 @@ def my_deliveries():
     if role_name(session["role_id"]) != "shipper":
         return jsonify({"ok": False, "error": "Only shippers can view their deliveries"}), 403
 
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("SELECT * FROM app.deliveries WHERE shipper_id = %s ORDER BY updated_at DESC;", (session["user_id"],))
     rows = cur.fetchall()
-    cur.close(); conn.close()
+    cur.close()
 
     return jsonify({"ok": True, "deliveries": rows})
 
@@ -262,14 +435,135 @@ def my_deliveries():
 # get tracking events for a delivery
 @deliveries_bp.get("/<int:delivery_id>/tracking")
 def delivery_tracking(delivery_id):
+    """
+    GET /deliveries/<id>/tracking?after_id=&since=
+    after_id: only events with a larger id (poll with the last id received).
+    since: only events created after this ISO 8601 or HTTP date.
+    Answers 304 to If-None-Match while no event was added since the ETag.
+    """
     session, err = current_session(request)
     if err:
         return jsonify({"ok": False, "error": err}), 401
+    if not _can_track(session, delivery_id):
+        return jsonify({"ok": False, "error": "Not allowed to track this delivery"}), 403
+
+    where, params = ["delivery_id = %s"], [delivery_id]
+    if request.args.get("after_id"):
+        try:
+            after_id = int(request.args["after_id"])
+        except ValueError:
+            return jsonify({"ok": False, "error": "after_id must be an integer"}), 400
+        where.append("id > %s")
+        params.append(after_id)
+    if request.args.get("since"):
+        since = _parse_since(request.args["since"])
+        if since is None:
+            return jsonify({"ok": False, "error": "since must be an ISO 8601 or HTTP date"}), 400
+        where.append("created_at > %s")
+        params.append(since)
+
+    # events are never updated or deleted: the newest id identifies the history
+    conn = get_request_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT MAX(id) FROM app.tracking_events WHERE delivery_id = %s;", (delivery_id,))
+    last_id = cur.fetchone()[0]
+    cur.close()
+    etag = f"{delivery_id}.{last_id or 0}"
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = stream_rows(f"SELECT * FROM app.tracking_events WHERE {' AND '.join(where)} ORDER BY created_at ASC, id ASC;",
+                               params, key="tracking")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# live tracking events (Server-Sent Events)
+@deliveries_bp.post("/<int:delivery_id>/tracking/stream-token")
+def delivery_tracking_stream_token(delivery_id):
+    """
+    POST /deliveries/<id>/tracking/stream-token
+    A token for ?stream_token= of the tracking stream of this delivery only,
+    valid for STREAM_TOKEN_SECONDS; EventSource cannot send the Bearer token.
+    """
+    session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+    if not _can_track(session, delivery_id):
+        return jsonify({"ok": False, "error": "Not allowed to track this delivery"}), 403
+    return jsonify({"ok": True, "stream_token": create_stream_token(session, f"tracking:{delivery_id}"),
+                    "expires_in": STREAM_TOKEN_SECONDS})
+
+
+@deliveries_bp.get("/<int:delivery_id>/tracking/stream")
+def delivery_tracking_stream(delivery_id):
+    """
+    GET /deliveries/<id>/tracking/stream  (text/event-stream)
+    Sends the last TRACKING_STREAM_HISTORY events (or everything after the
+    Last-Event-ID header / ?last_event_id=), then each new event as it is
+    inserted; see utils/tracking_stream.py. Authenticated by the Bearer token
+    or by ?stream_token= from POST /deliveries/<id>/tracking/stream-token.
+    """
+    if request.args.get("stream_token") and not request.headers.get("Authorization"):
+        session, err = stream_session(request.args["stream_token"], f"tracking:{delivery_id}")
+    else:
+        session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+    if not _can_track(session, delivery_id):
+        return jsonify({"ok": False, "error": "Not allowed to track this delivery"}), 403
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT * FROM app.tracking_events WHERE delivery_id = %s ORDER BY created_at ASC;", (delivery_id,))
-    events = cur.fetchall()
-    cur.close(); conn.close()
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_id = int(last_id) if last_id else None
+    except ValueError:
+        return jsonify({"ok": False, "error": "Last-Event-ID must be an integer"}), 400
+
+    try:
+        # subscribe before reading history so nothing falls in between
+        sub = tracking_stream.subscribe(delivery_id)
+    except tracking_stream.TooManySubscribers:
+        return jsonify({"ok": False, "error": "Too many open streams, retry later"}), 503, {"Retry-After": "5"}
 
-    return jsonify({"ok": True, "tracking": events})
+    try:
+        conn = get_request_connection()
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        if last_id is not None:
+            cur.execute("SELECT * FROM app.tracking_events WHERE delivery_id = %s AND id > %s ORDER BY id ASC;",
+                        (delivery_id, last_id))
+            history = cur.fetchall()
+        else:
+            cur.execute("SELECT * FROM app.tracking_events WHERE delivery_id = %s ORDER BY id DESC LIMIT %s;",
+                        (delivery_id, TRACKING_STREAM_HISTORY))
+            history = cur.fetchall()[::-1]
+        cur.close()
+    except Exception:
+        tracking_stream.unsubscribe(sub)
+        raise
+
+    def message(event):
+        return f"id: {event['id']}\nevent: tracking\ndata: {to_json(event)}\n\n"
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            sent = set()
+            for event in history:
+                sent.add(event["id"])
+                yield message(event)
+            deadline = time.monotonic() + TRACKING_STREAM_MAX_SECONDS
+            while not sub.lost and time.monotonic() < deadline:
+                try:
+                    event = sub.queue.get(timeout=TRACKING_STREAM_HEARTBEAT)
+                except queue.Empty:
+                    yield ": keepalive\n\n"   # also detects clients that went away
+                    continue
+                if event["id"] in sent:
+                    continue
+                yield message(event)
+        finally:
+            tracking_stream.unsubscribe(sub)
+
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,32 +1,15 @@
 from flask import Blueprint, request, jsonify
-from db import get_db_connection
+from collections import Counter
+from db import get_db_connection, get_request_connection
 import psycopg2.extras
-from utils.auth import decode_jwt
-from routes.notifications import push_notification
+from utils.auth import current_session
+from utils.roles import role_name
+from routes.notifications import push_notification, push_notifications
+from utils.streaming import stream_rows
+from utils import rollups, customer_search, order_import
 
 merchant_bp = Blueprint("merchant", __name__, url_prefix="/merchant")
 
-# ---- helpers ----
-def current_session(req):
-    auth = req.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
-        return None, "Missing Bearer token"
-    token = auth.split(" ", 1)[1]
-    try:
-        payload = decode_jwt(token)
-        return {"user_id": int(payload["sub"]), "role_id": int(payload["role_id"])}, None
-    except Exception as e:
-        return None, f"Invalid token: {e}"
-
-def role_name(role_id:int):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT role_name FROM app.roles WHERE role_id = %s;", (role_id,))
-    r = cur.fetchone()
-    cur.close(); conn.close()
-    return r[0] if r else None
-
-
 # ---- ENDPOINTS ----
 
 # merchant creates an order
@@ -55,7 +38,7 @@ def create_order_for_customer():
     if not all([customer_id, pickup_address, delivery_address]):
         return jsonify({"ok": False, "error": "Missing required fields"}), 400
 
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("""
         INSERT INTO app.orders
@@ -70,18 +53,64 @@ def create_order_for_customer():
           service_type, package_size, pickup_contact_name, pickup_contact_phone,
           delivery_contact_name, delivery_contact_phone, notes))
     order = cur.fetchone()
-    conn.commit()
-    cur.close(); conn.close()
+    cur.close()
 
-    try:
-        push_notification(customer_id, "New Order from Merchant",
-                          f"Your order #{order['order_id']} has been placed by a merchant.")
-    except Exception as e:
-        print("Notification error:", e)
+    # queued in the same transaction as the order
+    push_notification(customer_id, "New Order from Merchant",
+                      f"Your order #{order['order_id']} has been placed by a merchant.")
 
     return jsonify({"ok": True, "order": order}), 201
 
 
+# merchant imports many orders at once: JSON array or CSV, priced server-side, one report line per row
+@merchant_bp.post("/orders/import")
+def import_orders():
+    session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+    if role_name(session["role_id"]) != "merchant":
+        return jsonify({"ok": False, "error": "Only merchants can import orders"}), 403
+
+    try:
+        if "file" in request.files:
+            rows = order_import.parse_csv(request.files["file"].read().decode("utf-8-sig"))
+        elif request.mimetype == "text/csv":
+            rows = order_import.parse_csv(request.get_data().decode("utf-8-sig"))
+        else:
+            rows = order_import.parse_json(request.get_json(silent=True))
+    except order_import.ImportRejected as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    except UnicodeDecodeError:
+        return jsonify({"ok": False, "error": "CSV must be UTF-8 encoded"}), 400
+    if not rows:
+        return jsonify({"ok": False, "error": "No orders to import"}), 400
+    if len(rows) > order_import.IMPORT_MAX_ROWS:
+        return jsonify({"ok": False, "error": f"At most {order_import.IMPORT_MAX_ROWS} orders per import"}), 400
+    # ?all_or_nothing=1: import nothing if any row is invalid
+    all_or_nothing = request.args.get("all_or_nothing") == "1"
+
+    conn = get_request_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    orders, report = order_import.prepare(cur, rows)
+    failed = len(rows) - len(orders)
+    if failed and all_or_nothing:
+        cur.close()
+        return jsonify({"ok": False, "error": f"{failed} rows are invalid, nothing was imported",
+                        "created": 0, "failed": failed, "results": report}), 400
+    order_import.insert(cur, session["user_id"], orders)
+    cur.close()
+
+    # one notification per customer, in the same transaction
+    push_notifications([
+        (customer_id, "New Order from Merchant",
+         f"{count} orders have been placed for you by a merchant." if count > 1
+         else "An order has been placed for you by a merchant.")
+        for customer_id, count in Counter(o["customer_id"] for o in orders).items()
+    ])
+
+    return jsonify({"ok": True, "created": len(orders), "failed": failed, "results": report}), 201 if orders else 200
+
+
 #views all their created orders
 @merchant_bp.get("/orders")
 def list_merchant_orders():
@@ -91,19 +120,13 @@ def list_merchant_orders():
     if role_name(session["role_id"]) != "merchant":
         return jsonify({"ok": False, "error": "Only merchants can view their orders"}), 403
 
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
+    return stream_rows("""
         SELECT o.*, u.full_name AS customer_name
           FROM app.orders o
           JOIN app.users u ON o.customer_id = u.user_id
          WHERE o.merchant_id = %s
          ORDER BY o.created_at DESC;
-    """, (session["user_id"],))
-    rows = cur.fetchall()
-    cur.close(); conn.close()
-
-    return jsonify({"ok": True, "orders": rows})
+    """, (session["user_id"],), key="orders")
 
 
 # merchant views deliveries
@@ -156,6 +179,27 @@ def merchant_payments():
     return jsonify({"ok": True, "payments": rows})
 
 
+# merchant's own order time series, read from the analytics rollups
+@merchant_bp.get("/analytics")
+def merchant_analytics():
+    session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+    if role_name(session["role_id"]) != "merchant":
+        return jsonify({"ok": False, "error": "Only merchants can view analytics"}), 403
+
+    query, err = rollups.parse_query(request.args)
+    if err:
+        return jsonify({"ok": False, "error": err}), 400
+
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    body = rollups.analytics(cur, query, merchant_id=session["user_id"])
+    cur.close(); conn.close()
+
+    return jsonify({"ok": True, **body})
+
+
 # merchant accepts an order (assigns themselves to it)
 @merchant_bp.post("/orders/<int:order_id>/accept")
 def accept_order(order_id):
@@ -165,7 +209,7 @@ def accept_order(order_id):
     if role_name(session["role_id"]) != "merchant":
         return jsonify({"ok": False, "error": "Only merchants can accept orders"}), 403
 
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     # Check if order exists and is not already assigned
@@ -177,11 +221,11 @@ def accept_order(order_id):
     order = cur.fetchone()
     
     if not order:
-        cur.close(); conn.close()
+        cur.close()
         return jsonify({"ok": False, "error": "Order not found"}), 404
     
     if order["merchant_id"] is not None:
-        cur.close(); conn.close()
+        cur.close()
         return jsonify({"ok": False, "error": "Order already assigned to a merchant"}), 400
     
     # Assign merchant to order
@@ -193,19 +237,14 @@ def accept_order(order_id):
                   delivery_address, status, created_at;
     """, (session["user_id"], order_id))
     updated_order = cur.fetchone()
-    conn.commit()
-    
-    # Send notification to customer
-    try:
-        push_notification(
-            updated_order["customer_id"], 
-            "Order Accepted by Merchant",
-            f"Your order #{order_id} has been accepted and is being processed."
-        )
-    except Exception as e:
-        print("Notification error:", e)
+    cur.close()
     
-    cur.close(); conn.close()
+    # Send notification to customer, committed with the assignment
+    push_notification(
+        updated_order["customer_id"], 
+        "Order Accepted by Merchant",
+        f"Your order #{order_id} has been accepted and is being processed."
+    )
     return jsonify({"ok": True, "order": updated_order})
 
 
@@ -242,30 +281,10 @@ def search_customers():
     if role_name(session["role_id"]) != "merchant":
         return jsonify({"ok": False, "error": "Only merchants can search customers"}), 403
 
-    query = request.args.get("q", "").strip()
-    
-    if not query or len(query) < 2:
-        return jsonify({"ok": True, "customers": []})
-
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    
-    # Search by name, email, or phone for customers only (role_id = 4)
-    cur.execute("""
-        SELECT user_id, full_name, email, phone, created_at
-        FROM app.users
-        WHERE role_id = 4 
-          AND is_active = TRUE
-          AND (
-              LOWER(full_name) LIKE LOWER(%s) OR
-              LOWER(email) LIKE LOWER(%s) OR
-              phone LIKE %s
-          )
-        ORDER BY full_name
-        LIMIT 20;
-    """, (f"%{query}%", f"%{query}%", f"%{query}%"))
-    
-    customers = cur.fetchall()
+    # indexed phone / email prefix or name similarity search (utils/customer_search.py)
+    customers = customer_search.search(cur, request.args.get("q", ""))
     cur.close(); conn.close()
 
     return jsonify({"ok": True, "customers": customers})
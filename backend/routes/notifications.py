@@ -1,55 +1,91 @@
 from flask import Blueprint, request, jsonify
-from db import get_db_connection
+from db import get_request_connection
 import psycopg2.extras
-from utils.auth import decode_jwt
+from utils.auth import current_session
+from utils import outbox, notification_retention
+from utils.pagination import PaginationError, decode_cursor, page, page_size
+import os
 
 notifications_bp = Blueprint("notifications", __name__, url_prefix="/notifications")
 
-# ---- helpers ----
-def current_session(req):
-    auth = req.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
-        return None, "Missing Bearer token"
-    token = auth.split(" ", 1)[1]
-    try:
-        payload = decode_jwt(token)
-        return {"user_id": int(payload["sub"]), "role_id": int(payload["role_id"])}, None
-    except Exception as e:
-        return None, f"Invalid token: {e}"
+NOTIFICATIONS_PAGE_SIZE = int(os.getenv("NOTIFICATIONS_PAGE_SIZE", "20"))
+NOTIFICATIONS_MAX_PAGE_SIZE = int(os.getenv("NOTIFICATIONS_MAX_PAGE_SIZE", "100"))
 
+# ---- helpers ----
+# notifications are queued in the request transaction and delivered in
+# batches by the outbox worker (utils/outbox.py)
 def push_notification(user_id, title, body):
-    """Insert a notification row for a specific user"""
-    conn = get_db_connection()
+    """Queue a notification for a specific user"""
+    push_notifications([(user_id, title, body)])
+
+
+def push_notifications(rows):
+    """Queue [(user_id, title, body), ...] with one multi-row INSERT"""
+    conn = get_request_connection()
     cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO app.notifications (user_id, title, body, is_read, created_at)
-        VALUES (%s, %s, %s, false, NOW());
-    """, (user_id, title, body))
-    conn.commit()
-    cur.close(); conn.close()
+    outbox.enqueue(cur, rows)
+    cur.close()
 
 
 # ---- endpoints ----
 
-# get all notifications 
+# get notifications, newest first
 @notifications_bp.get("")
 def list_notifications():
+    """
+    GET /notifications?limit=20&cursor=...&unread=1
+    Keyset paginated: pass next_cursor back as cursor for the next page.
+    """
     session, err = current_session(request)
     if err:
         return jsonify({"ok": False, "error": err}), 401
 
-    conn = get_db_connection()
+    try:
+        limit = page_size(request.args, NOTIFICATIONS_PAGE_SIZE, NOTIFICATIONS_MAX_PAGE_SIZE)
+        cursor = request.args.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+    except PaginationError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
+
+    # only the partitions inside the retention window are scanned
+    where, params = "user_id = %s AND created_at >= %s", [session["user_id"], notification_retention.visible_since(cur)]
+    if request.args.get("unread") in ("1", "true"):
+        where += " AND is_read = false"
+    if after:
+        # the plain bound lets the planner skip newer partitions too
+        where += " AND created_at <= %s AND (created_at, notification_id) < (%s, %s)"
+        params += [after[0], *after]
+
+    cur.execute(f"""
         SELECT notification_id, title, body, is_read, created_at
           FROM app.notifications
-         WHERE user_id = %s
-         ORDER BY created_at DESC;
-    """, (session["user_id"],))
-    rows = cur.fetchall()
-    cur.close(); conn.close()
+         WHERE {where}
+         ORDER BY created_at DESC, notification_id DESC
+         LIMIT %s;
+    """, params + [limit + 1])
+    rows, next_cursor = page(cur.fetchall(), limit, key=("created_at", "notification_id"))
+    cur.close()
+
+    return jsonify({"ok": True, "notifications": rows, "next_cursor": next_cursor})
+
+
+# unread badge, from the counter maintained by triggers (migrations/020)
+@notifications_bp.get("/unread-count")
+def unread_count():
+    session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+
+    conn = get_request_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT unread FROM app.notification_counters WHERE user_id = %s;", (session["user_id"],))
+    row = cur.fetchone()
+    cur.close()
 
-    return jsonify({"ok": True, "notifications": rows})
+    return jsonify({"ok": True, "unread": row[0] if row else 0})
 
 
 # mark a notification as read
@@ -59,19 +95,38 @@ def mark_as_read(notification_id):
     if err:
         return jsonify({"ok": False, "error": err}), 401
 
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor()
     cur.execute("""
         UPDATE app.notifications
            SET is_read = true
-         WHERE notification_id = %s AND user_id = %s;
+         WHERE notification_id = %s AND user_id = %s AND is_read = false;
     """, (notification_id, session["user_id"]))
-    conn.commit()
-    cur.close(); conn.close()
+    cur.close()
 
     return jsonify({"ok": True, "message": "Notification marked as read"})
 
 
+# mark every unread notification as read
+@notifications_bp.put("/read-all")
+def mark_all_as_read():
+    session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+
+    conn = get_request_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        UPDATE app.notifications
+           SET is_read = true
+         WHERE user_id = %s AND is_read = false;
+    """, (session["user_id"],))
+    updated = cur.rowcount
+    cur.close()
+
+    return jsonify({"ok": True, "updated": updated})
+
+
 # clear all read notifications 
 @notifications_bp.delete("/clear-read")
 def clear_read_notifications():
@@ -79,14 +134,13 @@ def clear_read_notifications():
     if err:
         return jsonify({"ok": False, "error": err}), 401
 
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor()
     cur.execute("""
         DELETE FROM app.notifications
          WHERE user_id = %s AND is_read = true;
     """, (session["user_id"],))
     deleted = cur.rowcount
-    conn.commit()
-    cur.close(); conn.close()
+    cur.close()
 
     return jsonify({"ok": True, "deleted": deleted})
@@ -1,82 +1,59 @@
 from flask import Blueprint, request, jsonify
-from db import get_db_connection
+from db import get_request_connection
 import psycopg2.extras
-from utils.auth import decode_jwt
-import os, requests, math
+from utils.auth import current_session
+from utils.roles import role_name
+import os
+from utils import weather as weather_service, pricing, dispatch
+from utils.geo import haversine
+from utils.pagination import PaginationError, decode_cursor, page, page_size, select_fields
 from routes.notifications import push_notification
 
 orders_bp = Blueprint("orders", __name__, url_prefix="/orders")
 
-# ---- helpers ----
-def current_session(req):
-    auth = req.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
-        return None, "Missing Bearer token"
-    token = auth.split(" ", 1)[1]
-    try:
-        payload = decode_jwt(token)
-        return {"user_id": int(payload["sub"]), "role_id": int(payload["role_id"])}, None
-    except Exception as e:
-        return None, f"Invalid token: {e}"
+QUOTE_MAX_ITEMS = int(os.getenv("QUOTE_MAX_ITEMS", "500"))
+ORDERS_PAGE_SIZE = int(os.getenv("ORDERS_PAGE_SIZE", "50"))
+ORDERS_MAX_PAGE_SIZE = int(os.getenv("ORDERS_MAX_PAGE_SIZE", "200"))
 
-def role_name(role_id:int):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT role_name FROM app.roles WHERE role_id = %s;", (role_id,))
-    r = cur.fetchone()
-    cur.close(); conn.close()
-    return r[0] if r else None
+# selectable order columns for GET /orders?fields=
+ORDER_FIELDS = {name: f"o.{name}" for name in (
+    "order_id", "customer_id", "merchant_id", "delivery_id",
+    "pickup_address", "delivery_address", "pickup_lat", "pickup_lng", "delivery_lat", "delivery_lng",
+    "status", "distance_km", "price_estimate", "payment_method", "service_type", "package_size",
+    "package_weight", "package_length", "package_width", "package_height",
+    "pickup_contact_name", "pickup_contact_phone", "delivery_contact_name", "delivery_contact_phone",
+    "notes", "created_at",
+)}
 
+# ---- helpers ----
 def get_order(order_id:int):
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("SELECT * FROM app.orders WHERE order_id = %s;", (order_id,))
     row = cur.fetchone()
-    cur.close(); conn.close()
+    cur.close()
     return row
 
 def get_delivery(delivery_id:int):
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("SELECT * FROM app.deliveries WHERE delivery_id = %s;", (delivery_id,))
     row = cur.fetchone()
-    cur.close(); conn.close()
+    cur.close()
     return row
 
 def append_tracking_event(delivery_id:int, event_type:str, status:str=None, note:str=None, lat=None, lng=None):
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor()
     cur.execute("""
         INSERT INTO app.tracking_events (delivery_id, event_type, status, description, lat, lng)
         VALUES (%s, %s, %s, %s, %s, %s);
     """, (delivery_id, event_type, status, note, lat, lng))
-    conn.commit()
-    cur.close(); conn.close()
-
-def haversine(lat1, lon1, lat2, lon2):
-    """Return distance (km) between two points (lat, lon)."""
-    R = 6371  # Earth radius (km)
-    phi1, phi2 = math.radians(lat1), math.radians(lat2)
-    d_phi = math.radians(lat2 - lat1)
-    d_lambda = math.radians(lon2 - lon1)
-    a = math.sin(d_phi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(d_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+    cur.close()
 
 def get_weather_by_coords(lat, lon):
-    api_key = os.getenv("OPENWEATHER_API_KEY")
-    if not api_key:
-        return None, "Missing weather API key"
-    try:
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-        res = requests.get(url)
-        data = res.json()
-        if res.status_code != 200:
-            return None, data.get("message", "Weather API error")
-        weather = data["weather"][0]["main"].lower()
-        return weather, None
-    except Exception as e:
-        return None, str(e)
+    # cached per ~5 km cell with coalesced, time-limited fetches (utils/weather.py)
+    return weather_service.get_weather(lat, lon)
 
 def calculate_price(distance_km, weather, service_type='bike', package_size='small'):
     """
@@ -84,42 +61,7 @@ def calculate_price(distance_km, weather, service_type='bike', package_size='sma
     Service types: bike, car, truck
     Package sizes: small, medium, large
     """
-    # Base fare by service type
-    base_fares = {
-        'bike': 10000,
-        'car': 20000,
-        'truck': 50000
-    }
-    
-    # Rate per km by service type
-    km_rates = {
-        'bike': 5000,
-        'car': 8000,
-        'truck': 15000
-    }
-    
-    # Package size surcharge
-    package_surcharges = {
-        'small': 0,
-        'medium': 5000,
-        'large': 10000
-    }
-    
-    # Weather surcharge
-    weather_surcharge = 0
-    if weather in ["rain", "drizzle"]:
-        weather_surcharge = 5000
-    elif weather in ["thunderstorm"]:
-        weather_surcharge = 10000
-    elif weather in ["snow"]:
-        weather_surcharge = 8000
-
-    base_fare = base_fares.get(service_type, base_fares['bike'])
-    rate_per_km = km_rates.get(service_type, km_rates['bike'])
-    package_charge = package_surcharges.get(package_size, 0)
-
-    total = base_fare + (distance_km * rate_per_km) + weather_surcharge + package_charge
-    return round(total)
+    return pricing.quote(distance_km, weather, service_type, package_size)[0]
 
 # ---- endpoints ----
 
@@ -127,12 +69,10 @@ def calculate_price(distance_km, weather, service_type='bike', package_size='sma
 @orders_bp.post("")
 def create_order():
     #authentication
-    auth = request.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
-        return jsonify({"ok": False, "error": "Missing Bearer token"}), 401
-    token = auth.split(" ", 1)[1]
-    payload = decode_jwt(token)
-    customer_id = int(payload["sub"])
+    session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+    customer_id = session["user_id"]
 
     #parse request
     data = request.get_json(force=True)
@@ -174,10 +114,10 @@ def create_order():
     if err:
         weather = "clear"
 
-    price_estimate = calculate_price(distance_km, weather, service_type, package_size)
+    price_estimate, price_breakdown = pricing.quote(distance_km, weather, service_type, package_size)
 
     #Save
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     
     # If payment method is wallet, check balance and deduct
@@ -188,12 +128,10 @@ def create_order():
         
         if not wallet:
             cur.close()
-            conn.close()
             return jsonify({"ok": False, "error": "Wallet not found. Please create a wallet first."}), 400
         
         if float(wallet['balance']) < price_estimate:
             cur.close()
-            conn.close()
             return jsonify({
                 "ok": False, 
                 "error": f"Insufficient balance. You need {price_estimate:,.0f}₫ but only have {float(wallet['balance']):,.0f}₫"
@@ -234,23 +172,66 @@ def create_order():
           pickup_contact_name, pickup_contact_phone,
           delivery_contact_name, delivery_contact_phone, notes, payment_method))
     order = cur.fetchone()
-    conn.commit()
-    cur.close(); conn.close()
+    cur.close()
+
+    # wake the dispatcher (if enabled); it batches orders arriving together
+    dispatch.trigger()
 
     return jsonify({
         "ok": True,
         "order": order,
         "weather": weather,
-        "price_breakdown": {
-            "base_fare": {"bike": 10000, "car": 20000, "truck": 50000}.get(service_type, 10000),
-            "distance_cost": distance_km * {"bike": 5000, "car": 8000, "truck": 15000}.get(service_type, 5000),
-            "package_surcharge": {"small": 0, "medium": 5000, "large": 10000}.get(package_size, 0),
-            "weather_surcharge": 5000 if weather in ["rain", "drizzle"] else 10000 if weather == "thunderstorm" else 0,
-            "total": price_estimate
-        }
+        "price_breakdown": price_breakdown
     }), 201
 
 
+# Price many candidate pickup/drop pairs in one call (cart preview)
+@orders_bp.post("/quote")
+def quote_orders():
+    session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+
+    data = request.get_json(force=True) or {}
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return jsonify({"ok": False, "error": "items must be a non-empty list"}), 400
+    if len(items) > QUOTE_MAX_ITEMS:
+        return jsonify({"ok": False, "error": f"At most {QUOTE_MAX_ITEMS} items per quote"}), 400
+
+    try:
+        coords = [(float(it["pickup_lat"]), float(it["pickup_lng"]),
+                   float(it["delivery_lat"]), float(it["delivery_lng"])) for it in items]
+    except (KeyError, ValueError, TypeError):
+        return jsonify({"ok": False, "error": "Each item needs numeric pickup_lat, pickup_lng, delivery_lat, delivery_lng"}), 400
+    pickup_lat, pickup_lng, delivery_lat, delivery_lng = zip(*coords)
+
+    # defaults for the whole cart, overridable per item
+    service_type = data.get("service_type", "bike")
+    package_size = data.get("package_size", "small")
+    weather = [w or "clear" for w, _ in weather_service.get_weather_many(list(zip(pickup_lat, pickup_lng)))]
+
+    q = pricing.quote_many(
+        pickup_lat, pickup_lng, delivery_lat, delivery_lng,
+        service_type=[it.get("service_type", service_type) for it in items],
+        package_size=[it.get("package_size", package_size) for it in items],
+        weather=weather,
+    )
+    quotes = [{
+        "distance_km": float(q["distance_km"][i]),
+        "weather": weather[i],
+        "price_estimate": int(q["total"][i]),
+        "price_breakdown": {
+            "base_fare": float(q["base_fare"][i]),
+            "distance_cost": float(q["distance_cost"][i]),
+            "package_surcharge": float(q["package_surcharge"][i]),
+            "weather_surcharge": float(q["weather_surcharge"][i]),
+            "total": int(q["total"][i]),
+        },
+    } for i in range(len(items))]
+    return jsonify({"ok": True, "quotes": quotes, "total": int(q["total"].sum())})
+
+
 # List orders for current user
 
 
@@ -274,7 +255,7 @@ def cancel_order(order_id):
     if rn == "customer" and session["user_id"] != order["customer_id"]:
         return jsonify({"ok": False, "error": "Forbidden"}), 403
 
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     cur.execute("""
         UPDATE app.orders
@@ -292,85 +273,73 @@ def cancel_order(order_id):
         """, (updated["delivery_id"],))
         append_tracking_event(updated["delivery_id"], "STATUS", "CANCELED", "Order canceled")
 
-    conn.commit()
     try:
         push_notification(order["customer_id"], "Order Created",
                                 f"Your order #{order['order_id']} is created.")
     except Exception as e:
         print("Notification error:", e)
-    cur.close(); conn.close()
+    cur.close()
     return jsonify({"ok": True, "order": updated})
 
 @orders_bp.get("")
 def list_orders():
     """
-    GET /orders
+    GET /orders?limit=50&cursor=...&fields=order_id,status,...
     - Admin: see all orders
     - Merchant: see orders that belong to their merchant_id
     - Customer: see only their own orders
+    Newest first, keyset paginated: pass next_cursor back as cursor for the next page.
     """
-    auth = request.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
-        return jsonify({"ok": False, "error": "Missing Bearer token"}), 401
-    token = auth.split(" ", 1)[1]
-
-    try:
-        payload = decode_jwt(token)
-        user_id = int(payload["sub"])
-        role_id = int(payload["role_id"])
-    except Exception as e:
-        return jsonify({"ok": False, "error": str(e)}), 401
-
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("SELECT role_name FROM app.roles WHERE role_id = %s;", (role_id,))
-    role_row = cur.fetchone()
-    role_name = role_row["role_name"] if role_row else None
+    session, err = current_session(request)
+    if err:
+        return jsonify({"ok": False, "error": err}), 401
+    user_id = session["user_id"]
 
-    if not role_name:
-        cur.close(); conn.close()
+    rn = session["role_name"]
+    if not rn:
         return jsonify({"ok": False, "error": "Invalid role"}), 403
 
-    if role_name == "admin":
-        # merchants are stored as users (role 'merchant'), join to users to get merchant name
-        cur.execute("""
-            SELECT o.*, c.full_name AS customer_name, m.full_name AS merchant_name
-            FROM app.orders o
-            LEFT JOIN app.users c ON o.customer_id = c.user_id
-            LEFT JOIN app.users m ON o.merchant_id = m.user_id
-            ORDER BY o.created_at DESC;
-        """)
-    elif role_name == "merchant":
+    # merchants are stored as users (role 'merchant'), join to users to get names
+    allowed = {**ORDER_FIELDS, "customer_name": "c.full_name", "merchant_name": "m.full_name"}
+    default = list(ORDER_FIELDS) + {
+        "admin": ["customer_name", "merchant_name"],
+        "merchant": ["customer_name"],
+        "shipper": ["customer_name", "merchant_name"],
+    }.get(rn, ["merchant_name"])
+    try:
+        limit = page_size(request.args, ORDERS_PAGE_SIZE, ORDERS_MAX_PAGE_SIZE)
+        fields = select_fields(request.args, allowed, default, required=("order_id", "created_at"))
+        cursor = request.args.get("cursor")
+        after = decode_cursor(cursor) if cursor else None
+    except PaginationError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    if rn == "admin":
+        where, params = "TRUE", []
+    elif rn == "merchant":
         # merchant users show orders where merchant_id equals their user_id
-        cur.execute("""
-            SELECT o.*, c.full_name AS customer_name
-            FROM app.orders o
-            LEFT JOIN app.users c ON o.customer_id = c.user_id
-            WHERE o.merchant_id = %s
-            ORDER BY o.created_at DESC;
-        """, (user_id,))
-    elif role_name == "shipper":
+        where, params = "o.merchant_id = %s", [user_id]
+    elif rn == "shipper":
         # shipper: get orders from their assigned deliveries
-        cur.execute("""
-            SELECT o.*, c.full_name AS customer_name, m.full_name AS merchant_name
-            FROM app.orders o
-            LEFT JOIN app.users c ON o.customer_id = c.user_id
-            LEFT JOIN app.users m ON o.merchant_id = m.user_id
-            INNER JOIN app.deliveries d ON o.delivery_id = d.delivery_id
-            WHERE d.shipper_id = %s
-            ORDER BY o.created_at DESC;
-        """, (user_id,))
+        where, params = "o.delivery_id IN (SELECT delivery_id FROM app.deliveries WHERE shipper_id = %s)", [user_id]
     else:
-        # customer: include merchant name from users table
-        cur.execute("""
-            SELECT o.*, m.full_name AS merchant_name
-            FROM app.orders o
-            LEFT JOIN app.users m ON o.merchant_id = m.user_id
-            WHERE o.customer_id = %s
-            ORDER BY o.created_at DESC;
-        """, (user_id,))
+        where, params = "o.customer_id = %s", [user_id]
+    if after:
+        where += " AND (o.created_at, o.order_id) < (%s, %s)"
+        params += list(after)
 
-    orders = cur.fetchall()
-    cur.close(); conn.close()
-
-    return jsonify({"ok": True, "orders": orders})
+    conn = get_request_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.execute(f"""
+        SELECT {fields}
+        FROM app.orders o
+        LEFT JOIN app.users c ON o.customer_id = c.user_id
+        LEFT JOIN app.users m ON o.merchant_id = m.user_id
+        WHERE {where}
+        ORDER BY o.created_at DESC, o.order_id DESC
+        LIMIT %s;
+    """, params + [limit + 1])
+    orders, next_cursor = page(cur.fetchall(), limit, key=("created_at", "order_id"))
+    cur.close()
+
+    return jsonify({"ok": True, "orders": orders, "next_cursor": next_cursor})
@@ -1,32 +1,12 @@
 from flask import Blueprint, request, jsonify
-from db import get_db_connection
+from db import get_db_connection, get_request_connection
 import psycopg2.extras
-from utils.auth import decode_jwt
+from utils.auth import current_session
+from utils.roles import role_name
 from routes.notifications import push_notification  
 
 payments_bp = Blueprint("payments", __name__, url_prefix="/payments")
 
-# ---------------- Helpers ----------------
-def current_session(req):
-   auth = req.headers.get("Authorization", "")
-   if not auth.startswith("Bearer "):
-       return None, "Missing Bearer token"  
-   token = auth.split(" ", 1)[1]
-   try:
-       payload = decode_jwt(token)
-       return {"user_id": int(payload["sub"]), "role_id": int(payload["role_id"])}, None
-   except Exception as e:
-       return None, f"Invalid token: {e}"
-   
-def role_name(role_id:int):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT role_name FROM app.roles WHERE role_id = %s;", (role_id,))
-    r = cur.fetchone()
-    cur.close(); conn.close()
-    return r[0] if r else None
-
-
 # ---------------- Endpoints ----------------
 #create a payment for an order
 @payments_bp.post("/<int:order_id>")
@@ -41,7 +21,7 @@ def create_payment(order_id:int):
 
     if method not in ["CASH", "BANK", "WALLET"]:
        return jsonify({"ok": False, "error": "Invalid method"}), 400
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     # ensure order exists & belongs to this customer
     cur.execute("SELECT * FROM app.orders WHERE order_id = %s;", (order_id,))
@@ -59,22 +39,17 @@ def create_payment(order_id:int):
         RETURNING *;
     """, (order_id, amount, method, status, transaction_ref, status))
     payment = cur.fetchone()
-
-    conn.commit()
-    cur.close(); conn.close()
-
-    try:
-        if payment["status"] == "SUCCESS":
-            push_notification(order["customer_id"],
-                            "Payment Successful",
-                            f"Payment for order #{order_id} confirmed via {payment['method']}.")
-        else:
-            push_notification(order["customer_id"],
-                            "Payment Pending",
-                            f"Your order #{order_id} will be paid on delivery (CASH).")
-    except Exception as e:
-        print("Notification error:", e)
-
+    cur.close()
+
+    # queued in the same transaction as the payment
+    if payment["status"] == "SUCCESS":
+        push_notification(order["customer_id"],
+                        "Payment Successful",
+                        f"Payment for order #{order_id} confirmed via {payment['method']}.")
+    else:
+        push_notification(order["customer_id"],
+                        "Payment Pending",
+                        f"Your order #{order_id} will be paid on delivery (CASH).")
 
     return jsonify({"ok": True, "payment": payment}), 201
 
@@ -105,7 +80,7 @@ def refund_payment(order_id):
     if role_name(session["role_id"]) != "admin":
         return jsonify({"ok": False, "error": "Only admin can refund"}), 403
 
-    conn = get_db_connection()
+    conn = get_request_connection()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
     cur.execute("""
@@ -115,18 +90,12 @@ def refund_payment(order_id):
      RETURNING *;
     """, (order_id,))
     payment = cur.fetchone()
-
-    conn.commit()
-
-    try:
-        push_notification(payment["order_id"], "Payment Refunded",
-                        f"Payment for order #{order_id} has been refunded.")
-    except Exception as e:
-        print("Notification error:", e)
-
-    cur.close(); conn.close()
+    cur.close()
 
     if not payment:
         return jsonify({"ok": False, "error": "Payment not found"}), 404
 
+    push_notification(payment["order_id"], "Payment Refunded",
+                    f"Payment for order #{order_id} has been refunded.")
+
     return jsonify({"ok": True, "payment": payment})
\ No newline at end of file
@@ -1,7 +1,7 @@
 from flask import Blueprint, jsonify, request
-from db import get_db_connection
-from utils.auth import token_required
-import bcrypt
+from db import get_db_connection, db_connection
+from utils.auth import token_required, hash_password, check_password
+from utils.hashing import HashingBusy
 
 user_bp = Blueprint('user', __name__)
 
@@ -112,45 +112,45 @@ def change_password(current_user):
         if len(new_password) < 6:
             return jsonify({'error': 'New password must be at least 6 characters'}), 400
         
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        # Get current password hash
-        cur.execute("""
-            SELECT password_hash
-            FROM app.users
-            WHERE user_id = %s
-        """, (current_user['user_id'],))
-        
-        result = cur.fetchone()
+        # bcrypt runs without a pooled connection held; one is borrowed for
+        # the read and another for the update
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT password_hash
+                FROM app.users
+                WHERE user_id = %s
+            """, (current_user['user_id'],))
+            result = cur.fetchone()
+            cur.close()
+
         if not result:
             return jsonify({'error': 'User not found'}), 404
-        
+
         stored_hash = result[0]
-        
+
         # Verify current password
-        if not bcrypt.checkpw(current_password.encode('utf-8'), stored_hash.encode('utf-8')):
+        if not check_password(current_password, stored_hash):
             return jsonify({'error': 'Current password is incorrect'}), 401
-        
+
         # Hash new password
-        new_hash = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        
+        new_hash = hash_password(new_password)
+
         # Update password
-        cur.execute("""
-            UPDATE app.users
-            SET password_hash = %s
-            WHERE user_id = %s
-        """, (new_hash, current_user['user_id']))
-        
-        conn.commit()
-        
+        with db_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE app.users
+                SET password_hash = %s
+                WHERE user_id = %s
+            """, (new_hash, current_user['user_id']))
+            conn.commit()
+            cur.close()
+
         return jsonify({'message': 'Password changed successfully'}), 200
-        
+
+    except HashingBusy:
+        raise
     except Exception as e:
         print(f"Error changing password: {e}")
         return jsonify({'error': str(e)}), 500
-    finally:
-        if cur:
-            cur.close()
-        if conn:
-            conn.close()
@@ -1,31 +1,11 @@
 from flask import Blueprint, request, jsonify
 from db import get_db_connection
 import psycopg2.extras
-from utils.auth import decode_jwt
+from utils.auth import current_session
+from utils.roles import role_name
 
 wallets_bp = Blueprint("wallets", __name__, url_prefix="/wallet")
 
-# ---- helpers ----
-def current_session(req):
-    auth = req.headers.get("Authorization", "")
-    if not auth.startswith("Bearer "):
-        return None, "Missing Bearer token"
-    token = auth.split(" ", 1)[1]
-    try:
-        payload = decode_jwt(token)
-        return {"user_id": int(payload["sub"]), "role_id": int(payload["role_id"])}, None
-    except Exception as e:
-        return None, f"Invalid token: {e}"
-
-def role_name(role_id:int):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT role_name FROM app.roles WHERE role_id = %s;", (role_id,))
-    r = cur.fetchone()
-    cur.close(); conn.close()
-    return r[0] if r else None
-
-
 # ---- endpoints ----
 
 # get current wallet balance
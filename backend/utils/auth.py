@@ -1,17 +1,18 @@
-import os, jwt, datetime, bcrypt
+import os, jwt, datetime, threading, time
+from collections import OrderedDict
 from functools import wraps
-from flask import request, jsonify
+from flask import request, jsonify, g
 from dotenv import load_dotenv
+from utils import roles, revocation
+from utils.revocation import token_key
+# bcrypt runs in a worker process pool, see utils/hashing.py
+from utils.hashing import hash_password, check_password, needs_rehash
 load_dotenv()
 
 JWT_SECRET = os.getenv("JWT_SECRET", "change_me")
 JWT_EXPIRES_MIN = int(os.getenv("JWT_EXPIRES_MIN", "1440")) # Default to 1 day
-
-def hash_password(password: str) -> str:
-   return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def check_password(password: str, hashed: str) -> bool:
-   return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "10000"))
+STREAM_TOKEN_SECONDS = int(os.getenv("STREAM_TOKEN_SECONDS", "60"))
 
 def create_jwt(payload: dict) -> str:
     exp = datetime.datetime.utcnow() + datetime.timedelta(minutes=JWT_EXPIRES_MIN)
@@ -25,30 +26,154 @@ def decode_jwt(token: str) -> dict:
    decoded = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
    return decoded
 
+# ---- stream tokens ----
+# EventSource cannot set headers, so event streams take a token in the URL.
+# That token only opens the one stream it was issued for and expires after
+# STREAM_TOKEN_SECONDS; it is refused as a Bearer token.
+def create_stream_token(session: dict, scope: str) -> str:
+    exp = datetime.datetime.utcnow() + datetime.timedelta(seconds=STREAM_TOKEN_SECONDS)
+    return jwt.encode({"sub": str(session["user_id"]), "role_id": session["role_id"], "scope": scope, "exp": exp},
+                      JWT_SECRET, algorithm="HS256")
+
+def stream_session(token: str, scope: str):
+    """(session, error) for a stream token issued for scope."""
+    try:
+        claims = decode_jwt(token)
+    except jwt.InvalidTokenError as e:
+        return None, f"Invalid stream token: {e}"
+    if claims.get("scope") != scope:
+        return None, "Stream token is not valid for this stream"
+    role_id = int(claims["role_id"])
+    return {"user_id": int(claims["sub"]), "role_id": role_id, "role_name": roles.role_name(role_id)}, None
+
+# ---- verified-claims cache ----
+# Maps sha256(token) -> verified claims until the token's exp, so the HS256
+# signature is checked once per token instead of once per request.
+_claims_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_auth_stats = {"requests": 0, "cache_hits": 0, "cache_misses": 0, "failures": 0, "revoked": 0,
+               "time_total": 0.0, "time_max": 0.0}
+
+def verify_token(token: str, key: bytes = None) -> dict:
+    """Return the verified claims of a token; raises jwt.InvalidTokenError like decode_jwt."""
+    key = key or token_key(token)
+    now = time.time()
+    with _cache_lock:
+        cached = _claims_cache.get(key)
+        if cached is not None:
+            if cached["exp"] > now:
+                _claims_cache.move_to_end(key)
+                _auth_stats["cache_hits"] += 1
+                return cached
+            del _claims_cache[key]
+    _auth_stats["cache_misses"] += 1
+    claims = decode_jwt(token)   # raises ExpiredSignatureError / InvalidTokenError
+    if "exp" not in claims:
+        # never cache forever; fall back to the configured lifetime
+        claims["exp"] = now + JWT_EXPIRES_MIN * 60
+    with _cache_lock:
+        _claims_cache[key] = claims
+        if len(_claims_cache) > JWT_CACHE_SIZE:
+            _claims_cache.popitem(last=False)
+    return claims
+
+def forget_token(token: str):
+    with _cache_lock:
+        _claims_cache.pop(token_key(token), None)
+
+def bearer_token(req):
+    auth = req.headers.get("Authorization", "")
+    if not auth.startswith("Bearer "):
+        return None
+    return auth.split(" ", 1)[1]
+
+# ---- request authentication ----
+def authenticate():
+    """before_request hook: resolve g.session once for every route."""
+    started = time.perf_counter()
+    g.session, g.auth_error, g.auth_exception = None, None, None
+    token = bearer_token(request)
+    g.token = token
+    if token is None:
+        g.auth_error = "Missing Bearer token"
+        return
+    try:
+        key = token_key(token)
+        claims = verify_token(token, key)
+        if "scope" in claims:
+            raise jwt.InvalidTokenError("Stream tokens cannot be used as Bearer tokens")
+        if revocation.is_revoked(key):
+            g.auth_error = "Token revoked"
+            g.auth_exception = jwt.InvalidTokenError("Token revoked")
+            _auth_stats["revoked"] += 1
+            return
+        role_id = int(claims["role_id"])
+        g.session = {
+            "user_id": int(claims["sub"]),
+            "role_id": role_id,
+            "role_name": roles.role_name(role_id),
+        }
+    except Exception as e:
+        g.auth_exception = e
+        g.auth_error = f"Invalid token: {e}"
+        _auth_stats["failures"] += 1
+    finally:
+        elapsed = time.perf_counter() - started
+        g.auth_time = elapsed
+        _auth_stats["requests"] += 1
+        _auth_stats["time_total"] += elapsed
+        if elapsed > _auth_stats["time_max"]:
+            _auth_stats["time_max"] = elapsed
+
+def current_session(req=None):
+    """(session, error) for the current request, resolved by authenticate()."""
+    if "auth_error" not in g:
+        authenticate()
+    return g.session, g.auth_error
+
+def auth_stats():
+    requests_seen = _auth_stats["requests"]
+    return {
+        "requests": requests_seen,
+        "cache_size": len(_claims_cache),
+        "cache_hits": _auth_stats["cache_hits"],
+        "cache_misses": _auth_stats["cache_misses"],
+        "failures": _auth_stats["failures"],
+        "revoked": _auth_stats["revoked"],
+        "avg_us": round(_auth_stats["time_total"] * 1e6 / requests_seen, 1) if requests_seen else 0.0,
+        "max_us": round(_auth_stats["time_max"] * 1e6, 1),
+    }
+
+def init_app(app):
+    app.before_request(authenticate)
+
+    @app.after_request
+    def _auth_timing_header(response):
+        auth_time = g.get("auth_time")
+        if auth_time is not None:
+            response.headers.add("Server-Timing", f"auth;dur={auth_time * 1000:.3f}")
+        return response
+
 def token_required(f):
     """Decorator to require JWT token authentication"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization', '')
-        
-        if not auth_header.startswith('Bearer '):
+        session, err = current_session(request)
+        if g.token is None:
             return jsonify({'error': 'Missing or invalid authorization header'}), 401
-        
-        token = auth_header.split(' ', 1)[1]
-        
-        try:
-            payload = decode_jwt(token)
-            current_user = {
-                'user_id': int(payload['sub']),
-                'role_id': int(payload['role_id'])
-            }
-            return f(current_user, *args, **kwargs)
-        except jwt.ExpiredSignatureError:
+
+        exc = g.auth_exception
+        if isinstance(exc, jwt.ExpiredSignatureError):
             return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError as e:
-            return jsonify({'error': f'Invalid token: {str(e)}'}), 401
-        except Exception as e:
-            return jsonify({'error': f'Authentication failed: {str(e)}'}), 401
-    
+        if isinstance(exc, jwt.InvalidTokenError):
+            return jsonify({'error': f'Invalid token: {str(exc)}'}), 401
+        if exc is not None:
+            return jsonify({'error': f'Authentication failed: {str(exc)}'}), 401
+
+        current_user = {
+            'user_id': session['user_id'],
+            'role_id': session['role_id']
+        }
+        return f(current_user, *args, **kwargs)
+
     return decorated_function
-   
\ No newline at end of file
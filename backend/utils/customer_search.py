@@ -0,0 +1,155 @@
+"""
+Customer typeahead search for merchants.
+
+Each query takes indexed paths (migrations/025_users_search.py) instead of
+the LIKE '%q%' scans over app.users it replaces. Every path reads a btree
+in an order that puts the best rows first and stops after a few dozen, so
+the cost does not grow with the number of customers sharing a common name:
+
+- phone numbers (digits, spaces, + - . ( )): numbers starting with the
+  digits ("+84 912" and "0912" find the same customers), then numbers
+  ending with them;
+- anything with an @: prefix of lower(email);
+- names, compared as search_name (lowercase, accents removed, so "nguyen"
+  finds "Nguyễn"): names with a word starting with the query ("thao" finds
+  "Nguyễn Văn Thảo", "van th" finds it too), through one prefix index per
+  word position up to NAME_WORDS; a one-word query also matches the start
+  of an email address. Results are ranked by word similarity, then
+  whole-name similarity.
+
+When that finds fewer than the limit, each query word of three characters
+or more that no name word starts with is replaced by the closest word of
+app.search_words, the distinct words of all names: one containing it
+("uye" -> "uyen"), else the most similar (pg_trgm, "tuann" -> "tuan"). The
+corrected query then takes the same prefix indexes. The trigram index only
+covers that small table, so a typo or a query matching nothing costs a few
+lookups, not a scan of millions of names.
+
+Within a common prefix ("nguyen") rows come in index order, so the first
+page is the alphabetically first of many equally good matches; the next
+keystrokes narrow it down. Digits in the middle of a phone number, text in
+the middle of an email address and a fragment inside a word that is not
+the closest word containing it are not matched.
+"""
+import os
+import re
+from utils.roles import role_id_by_name
+
+CUSTOMER_SEARCH_LIMIT = int(os.getenv("CUSTOMER_SEARCH_LIMIT", "20"))
+MIN_QUERY_LENGTH = 2
+NAME_WORDS = 4   # word positions with a prefix index in migrations/025
+_PHONE_RE = re.compile(r"^[\d\s+().-]+$")
+
+COLUMNS = "user_id, full_name, email, phone, created_at"
+
+
+def _like_prefix(value):
+    """LIKE pattern matching values starting with value, wildcards in it escaped."""
+    return re.sub(r"([\\%_])", r"\\\1", value) + "%"
+
+
+def phone_digits(value):
+    """Same normalization as app.phone_digits()."""
+    digits = re.sub(r"\D", "", value)
+    return "0" + digits[2:] if digits.startswith("84") else digits
+
+
+def _prefix_scans(matches, customer, limit):
+    """
+    One subquery per (expression, prefix) in matches, each reading the
+    expression's text_pattern_ops index in order (USING ~<~) up to limit rows.
+    Rows carry the number of their subquery (stream) and the matched value.
+    """
+    parts, params = [], []
+    for stream, (expr, prefix) in enumerate(matches):
+        parts.append(f"""
+            (SELECT {COLUMNS}, search_name, {stream} AS stream, {expr} AS matched FROM app.users
+              WHERE {expr} LIKE %s AND role_id = %s AND is_active = TRUE
+              ORDER BY {expr} USING ~<~
+              LIMIT %s)""")
+        params += [_like_prefix(prefix), customer, limit]
+    return parts, params
+
+
+def _unique(rows, limit, seen=()):
+    """First occurrence of each customer not in seen, at most limit."""
+    seen, unique = set(seen), []
+    for row in rows:
+        if row["user_id"] not in seen:
+            seen.add(row["user_id"])
+            unique.append(row)
+    return unique[:limit]
+
+
+def _by_name(cur, name, email, customer, limit):
+    """Customers with a name word starting with name (or an email starting with email), best first."""
+    matches = [("search_name", name)]
+    # from the 2nd word on: "nguyen van thao" minus its first 1, 2, 3 words
+    matches += [(f"app.search_tail(search_name, {n})", name) for n in range(1, NAME_WORDS)]
+    if email:
+        matches.append(("lower(email)", email))
+    parts, params = _prefix_scans(matches, customer, limit)
+    cur.execute(f"""
+        SELECT {COLUMNS}
+          FROM ({" UNION ALL ".join(parts)}) c
+         ORDER BY word_similarity(%s, search_name) DESC, similarity(%s, search_name) DESC, full_name, user_id;
+    """, params + [name, name])
+    return cur.fetchall()
+
+
+def _correct(cur, name):
+    """name with each word no name word starts with replaced by the closest known word, if any."""
+    words = []
+    for word in name.split(" "):
+        if len(word) >= 3:
+            cur.execute("""
+                SELECT COALESCE(
+                    (SELECT %(word)s WHERE EXISTS (SELECT 1 FROM app.search_words WHERE word LIKE %(prefix)s)),
+                    (SELECT word FROM app.search_words WHERE word LIKE %(contains)s
+                      ORDER BY word <-> %(word)s LIMIT 1),
+                    (SELECT word FROM app.search_words WHERE word %% %(word)s
+                      ORDER BY word <-> %(word)s LIMIT 1),
+                    %(word)s) AS word;
+            """, {"word": word, "prefix": _like_prefix(word), "contains": "%" + _like_prefix(word)})
+            word = cur.fetchone()["word"]
+        words.append(word)
+    return " ".join(words)
+
+
+def search(cur, query, limit=CUSTOMER_SEARCH_LIMIT):
+    """Active customers matching query, best first (RealDictCursor)."""
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return []
+    customer = role_id_by_name("customer")
+
+    if _PHONE_RE.match(query) and sum(c.isdigit() for c in query) >= MIN_QUERY_LENGTH:
+        parts, params = _prefix_scans([("phone_digits", phone_digits(query)),
+                                       ("reverse(phone_digits)", re.sub(r"\D", "", query)[::-1])],
+                                      customer, limit)
+        # numbers starting with the digits first
+        cur.execute(f"""
+            SELECT {COLUMNS} FROM ({" UNION ALL ".join(parts)}) c
+             ORDER BY stream, matched USING ~<~;
+        """, params)
+        return _unique(cur.fetchall(), limit)
+
+    if "@" in query:
+        parts, params = _prefix_scans([("lower(email)", query.lower())], customer, limit)
+        cur.execute(f"SELECT {COLUMNS} FROM {parts[0]} c ORDER BY matched USING ~<~;", params)
+        return cur.fetchall()
+
+    # normalized by the same function as the indexed column, then passed as a
+    # constant so the planner can use the indexes
+    cur.execute("SELECT app.search_normalize(%s) AS name;", (query,))
+    name = cur.fetchone()["name"]
+    if len(name) < MIN_QUERY_LENGTH:
+        return []
+
+    rows = _unique(_by_name(cur, name, None if " " in query else query.lower(), customer, limit), limit)
+    if len(rows) < limit:
+        corrected = _correct(cur, name)
+        if corrected != name:
+            rows += _unique(_by_name(cur, corrected, None, customer, limit), limit - len(rows),
+                            seen=[r["user_id"] for r in rows])
+    return rows
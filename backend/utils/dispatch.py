@@ -0,0 +1,309 @@
+"""
+Automatic dispatch of pending orders to idle shippers.
+
+A dispatch round loads up to DISPATCH_BATCH_SIZE pending, unassigned orders
+and the idle shippers (no ASSIGNED/ONGOING delivery) whose last tracked
+position is recent, then matches them one to one:
+
+1. candidate edges: for every order, the DISPATCH_CANDIDATES nearest shippers
+   within DISPATCH_RADIUS_KM whose vehicle can carry the service type, found
+   on a grid of radius-sized cells and costed with one NumPy distance block
+   per cell;
+2. assignment: the edges are split into connected components; components
+   small enough are solved optimally (Hungarian, scipy's
+   linear_sum_assignment, when scipy is installed), the rest greedily,
+   cheapest edge first.
+
+Every match becomes a delivery through routes.deliveries.assign_orders, the
+same code path as POST /deliveries. Rounds run on demand (POST
+/admin/dispatch/run), every DISPATCH_INTERVAL seconds when set, and shortly
+after new orders (trigger()); a pg advisory lock keeps concurrent rounds from
+different workers apart.
+"""
+import os
+import threading
+import time
+import numpy as np
+import psycopg2.extras
+from db import get_db_connection
+from utils.pricing import haversine_many
+from utils import outbox
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # optional: fall back to greedy matching
+    linear_sum_assignment = None
+
+DISPATCH_INTERVAL = float(os.getenv("DISPATCH_INTERVAL", "0"))        # seconds, 0 = no periodic rounds
+DISPATCH_TRIGGER_DELAY = float(os.getenv("DISPATCH_TRIGGER_DELAY", "2"))   # batch orders arriving together
+DISPATCH_RADIUS_KM = float(os.getenv("DISPATCH_RADIUS_KM", "5"))
+DISPATCH_CANDIDATES = int(os.getenv("DISPATCH_CANDIDATES", "10"))
+DISPATCH_BATCH_SIZE = int(os.getenv("DISPATCH_BATCH_SIZE", "10000"))
+DISPATCH_POSITION_MAX_AGE_MIN = int(os.getenv("DISPATCH_POSITION_MAX_AGE_MIN", "30"))
+DISPATCH_METHOD = os.getenv("DISPATCH_METHOD", "auto")                 # auto | hungarian | greedy
+DISPATCH_HUNGARIAN_MAX_CELLS = int(os.getenv("DISPATCH_HUNGARIAN_MAX_CELLS", "2000000"))   # dense matrix size limit
+DISPATCH_OVERSIZE_PENALTY_KM = float(os.getenv("DISPATCH_OVERSIZE_PENALTY_KM", "1"))
+DISPATCH_LOCK_ID = 812002   # pg advisory lock: one dispatch round at a time
+
+# service types by size; a vehicle serves every service up to its own rank
+SERVICE_RANK = {"bike": 0, "car": 1, "truck": 2}
+VEHICLE_RANK = {"bike": 0, "motorbike": 0, "car": 1, "van": 1, "truck": 2}
+_NO_EDGE = 1e9
+
+
+# ---- matching (pure, used by the benchmark too) ----
+def candidate_edges(o_lat, o_lng, o_rank, s_lat, s_lng, s_rank,
+                    radius_km=DISPATCH_RADIUS_KM, k=DISPATCH_CANDIDATES):
+    """
+    (order_idx, shipper_idx, distance_km, cost) arrays of candidate pairs.
+    cost = pickup distance + DISPATCH_OVERSIZE_PENALTY_KM per size class the
+    vehicle is larger than the order needs.
+    """
+    o_lat, o_lng, o_rank = (np.asarray(a) for a in (o_lat, o_lng, o_rank))
+    s_lat, s_lng, s_rank = (np.asarray(a) for a in (s_lat, s_lng, s_rank))
+    empty = (np.empty(0, dtype=np.intp),) * 2 + (np.empty(0),) * 2
+    if not len(o_lat) or not len(s_lat):
+        return empty
+    # grid of radius-sized cells: every shipper within radius is in the 3x3 block around an order
+    cell_lat = radius_km / 111.0
+    cell_lng = radius_km / (111.0 * max(np.cos(np.radians(np.abs(np.concatenate([o_lat, s_lat])).max())), 0.01))
+
+    def cells(lat, lng):
+        return np.floor(lat / cell_lat).astype(np.int64), np.floor(lng / cell_lng).astype(np.int64)
+
+    s_cy, s_cx = cells(s_lat, s_lng)
+    shippers_by_cell = {}
+    for i, key in enumerate(zip(s_cy.tolist(), s_cx.tolist())):
+        shippers_by_cell.setdefault(key, []).append(i)
+    o_cy, o_cx = cells(o_lat, o_lng)
+    orders_by_cell = {}
+    for i, key in enumerate(zip(o_cy.tolist(), o_cx.tolist())):
+        orders_by_cell.setdefault(key, []).append(i)
+
+    parts = []
+    for cell, order_idx in orders_by_cell.items():
+        cy, cx = cell
+        ship_idx = [i for dy in (-1, 0, 1) for dx in (-1, 0, 1) for i in shippers_by_cell.get((cy + dy, cx + dx), ())]
+        if not ship_idx:
+            continue
+        oi = np.array(order_idx, dtype=np.intp)
+        si = np.array(ship_idx, dtype=np.intp)
+        dist = haversine_many(o_lat[oi][:, None], o_lng[oi][:, None], s_lat[si][None, :], s_lng[si][None, :])
+        oversize = s_rank[si][None, :] - o_rank[oi][:, None]
+        cost = np.where((dist <= radius_km) & (oversize >= 0), dist + oversize * DISPATCH_OVERSIZE_PENALTY_KM, np.inf)
+        kk = min(k, len(si))
+        top = np.argpartition(cost, kk - 1, axis=1)[:, :kk] if kk < len(si) else np.tile(np.arange(len(si)), (len(oi), 1))
+        rows = np.repeat(np.arange(len(oi)), top.shape[1])
+        cols = top.ravel()
+        c = cost[rows, cols]
+        keep = np.isfinite(c)
+        parts.append((oi[rows[keep]], si[cols[keep]], dist[rows[keep], cols[keep]], c[keep]))
+    if not parts:
+        return empty
+    return tuple(np.concatenate(x) for x in zip(*parts))
+
+
+def _greedy(o, s, cost, taken_o, taken_s):
+    pairs = []
+    for e in np.argsort(cost, kind="stable").tolist():
+        a, b = int(o[e]), int(s[e])
+        if a in taken_o or b in taken_s:
+            continue
+        taken_o.add(a)
+        taken_s.add(b)
+        pairs.append(e)
+    return pairs
+
+
+def _components(o, s):
+    """Connected components of the bipartite candidate graph, as lists of edge indexes."""
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in zip(o.tolist(), s.tolist()):
+        ra, rb = find(("o", a)), find(("s", b))
+        if ra != rb:
+            parent[ra] = rb
+    groups = {}
+    for e, a in enumerate(o.tolist()):
+        groups.setdefault(find(("o", a)), []).append(e)
+    return list(groups.values())
+
+
+def match(o, s, dist, cost, method=DISPATCH_METHOD):
+    """
+    One-to-one assignment over candidate edges.
+    Returns (order_idx, shipper_idx, distance_km) triples and solver counts.
+    """
+    use_hungarian = method != "greedy" and linear_sum_assignment is not None
+    chosen = []
+    info = {"edges": int(len(o)), "components": 0, "hungarian": 0, "greedy": 0}
+    if method == "greedy" or not use_hungarian:
+        chosen = _greedy(o, s, cost, set(), set())
+        info["greedy"] = 1
+    else:
+        for edges in _components(o, s):
+            info["components"] += 1
+            edges = np.array(edges)
+            rows, row_of = np.unique(o[edges], return_inverse=True)
+            cols, col_of = np.unique(s[edges], return_inverse=True)
+            if len(rows) * len(cols) > DISPATCH_HUNGARIAN_MAX_CELLS and method != "hungarian":
+                chosen += [int(edges[i]) for i in _greedy(o[edges], s[edges], cost[edges], set(), set())]
+                info["greedy"] += 1
+                continue
+            m = np.full((len(rows), len(cols)), _NO_EDGE)
+            m[row_of, col_of] = cost[edges]
+            edge_at = np.full(m.shape, -1, dtype=np.intp)
+            edge_at[row_of, col_of] = edges
+            r, c = linear_sum_assignment(m)
+            keep = m[r, c] < _NO_EDGE
+            chosen += edge_at[r[keep], c[keep]].tolist()
+            info["hungarian"] += 1
+    return [(int(o[e]), int(s[e]), float(dist[e])) for e in chosen], info
+
+
+# ---- dispatch rounds ----
+_stats = {"rounds": 0, "assigned": 0, "conflicts": 0, "skipped_locked": 0, "last_round": None}
+_wake = threading.Event()
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def _load(cur):
+    cur.execute("""
+        SELECT order_id, customer_id, pickup_lat, pickup_lng, service_type
+          FROM app.orders
+         WHERE status = 'PENDING' AND delivery_id IS NULL
+           AND pickup_lat IS NOT NULL AND pickup_lng IS NOT NULL
+         ORDER BY created_at
+         LIMIT %s;
+    """, (DISPATCH_BATCH_SIZE,))
+    orders = cur.fetchall()
+    # idle shippers at their most recent tracked position
+    cur.execute("""
+        SELECT u.user_id AS shipper_id, COALESCE(sp.vehicle_type, 'motorbike') AS vehicle_type,
+               pos.lat, pos.lng
+          FROM app.users u
+          JOIN app.roles r ON r.role_id = u.role_id AND r.role_name = 'shipper'
+          LEFT JOIN app.shipper_profiles sp ON sp.shipper_id = u.user_id
+          JOIN LATERAL (
+                SELECT te.lat, te.lng
+                  FROM app.deliveries d
+                  JOIN app.tracking_events te ON te.delivery_id = d.delivery_id
+                 WHERE d.shipper_id = u.user_id
+                   AND te.lat IS NOT NULL AND te.lng IS NOT NULL
+                   AND te.created_at > NOW() - %s * INTERVAL '1 minute'
+                 ORDER BY te.created_at DESC
+                 LIMIT 1
+          ) pos ON TRUE
+         WHERE u.is_active
+           AND NOT EXISTS (SELECT 1 FROM app.deliveries d
+                            WHERE d.shipper_id = u.user_id AND d.status IN ('ASSIGNED', 'ONGOING'));
+    """, (DISPATCH_POSITION_MAX_AGE_MIN,))
+    return orders, cur.fetchall()
+
+
+def run_once(method=DISPATCH_METHOD):
+    """Run one dispatch round and return its report."""
+    from routes.deliveries import assign_orders   # routes import utils, not the other way round at load time
+
+    conn = get_db_connection()
+    conn.autocommit = False
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked;", (DISPATCH_LOCK_ID,))
+        if not cur.fetchone()["locked"]:
+            _stats["skipped_locked"] += 1
+            return {"skipped": "another dispatch round is running"}
+
+        orders, shippers = _load(cur)
+        started = time.perf_counter()
+        o, s, dist, cost = candidate_edges(
+            [x["pickup_lat"] for x in orders], [x["pickup_lng"] for x in orders],
+            [SERVICE_RANK.get(x["service_type"], 0) for x in orders],
+            [float(x["lat"]) for x in shippers], [float(x["lng"]) for x in shippers],
+            [VEHICLE_RANK.get((x["vehicle_type"] or "").lower(), 0) for x in shippers],
+        )
+        pairs, info = match(o, s, dist, cost, method)
+        match_ms = (time.perf_counter() - started) * 1000
+
+        assigned, conflicts = 0, 0
+        for oi, si, _ in pairs:
+            order, shipper = orders[oi], shippers[si]
+            cur.execute("SAVEPOINT dispatch_pair;")
+            delivery = assign_orders(cur, shipper["shipper_id"], [order["order_id"]], 1,
+                                     (float(shipper["lat"]), float(shipper["lng"])), "Delivery assigned by dispatcher")
+            if delivery is None:
+                # taken by a shipper in the meantime
+                cur.execute("ROLLBACK TO SAVEPOINT dispatch_pair;")
+                conflicts += 1
+                continue
+            outbox.enqueue(cur, [(shipper["shipper_id"], "New delivery",
+                                  f"Order #{order['order_id']} was assigned to you (delivery #{delivery['delivery_id']}).")])
+            assigned += 1
+        conn.commit()
+
+        report = {
+            "orders": len(orders),
+            "shippers": len(shippers),
+            "assigned": assigned,
+            "conflicts": conflicts,
+            "avg_pickup_km": round(sum(d for _, _, d in pairs) / len(pairs), 3) if pairs else None,
+            "match_ms": round(match_ms, 2),
+            **info,
+        }
+        _stats["rounds"] += 1
+        _stats["assigned"] += assigned
+        _stats["conflicts"] += conflicts
+        _stats["last_round"] = report
+        return report
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+# ---- background rounds ----
+def trigger():
+    """Ask for a round soon (after DISPATCH_TRIGGER_DELAY), e.g. when an order is created."""
+    if DISPATCH_INTERVAL > 0:
+        _wake.set()
+
+
+def start():
+    """Start the dispatch thread for this process when DISPATCH_INTERVAL is set."""
+    global _started_pid
+    if DISPATCH_INTERVAL <= 0 or _started_pid == os.getpid():
+        return
+    with _start_lock:
+        # threads do not survive a gunicorn fork, hence the pid check
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    threading.Thread(target=_run, name="dispatcher", daemon=True).start()
+
+
+def _run():
+    while True:
+        if _wake.wait(DISPATCH_INTERVAL):
+            time.sleep(DISPATCH_TRIGGER_DELAY)
+        _wake.clear()
+        try:
+            run_once()
+        except Exception as e:
+            print(f"[Dispatch] Round failed: {e}")
+
+
+def init_app(app):
+    app.before_request(start)
+
+
+def stats():
+    return {"interval": DISPATCH_INTERVAL, "method": DISPATCH_METHOD,
+            "hungarian_available": linear_sum_assignment is not None, **_stats}
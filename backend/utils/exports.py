@@ -0,0 +1,386 @@
+"""
+Background data exports for admins: gzip CSV or Parquet files.
+
+POST /admin/exports queues a job in app.export_jobs (migrations/
+024_export_jobs.py). EXPORT_WORKERS threads per process claim queued jobs
+with FOR UPDATE SKIP LOCKED, so each job runs once whichever worker created
+it, and write the file under EXPORT_DIR:
+
+- csv: COPY (query) TO STDOUT streamed straight into a gzip file; the rows
+  never become Python objects.
+- parquet (needs pyarrow): a server-side cursor read EXPORT_CHUNK_ROWS at a
+  time, each chunk written as one row group.
+
+Either way memory stays bounded by one chunk, whatever the table size. The
+file is written as <name>.part and renamed when complete, so a download
+never sees a partial file. Progress (rows and bytes written) and a heartbeat
+are saved every EXPORT_PROGRESS_SECONDS; a RUNNING job whose heartbeat is
+older than EXPORT_STALE_SECONDS (its worker died or stalled) is claimed
+again, up to EXPORT_MAX_ATTEMPTS. Each attempt writes its own file, and its
+progress and result are only saved while it is still the job's current
+attempt, so a slow worker that was overtaken stops and removes its file
+instead of racing the new one. Finished jobs and their files are removed after
+EXPORT_RETENTION_HOURS.
+
+Exports read on a dedicated connection, not the pool: they can run for
+minutes.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+import psycopg2.extras
+from db import get_db_connection, get_dedicated_connection
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: csv exports only
+    pa = pq = None
+
+EXPORT_DIR = os.getenv("EXPORT_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "exports")
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "1"))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "10000"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "6"))
+EXPORT_POLL_SECONDS = float(os.getenv("EXPORT_POLL_SECONDS", "10"))
+EXPORT_PROGRESS_SECONDS = float(os.getenv("EXPORT_PROGRESS_SECONDS", "2"))
+EXPORT_STALE_SECONDS = float(os.getenv("EXPORT_STALE_SECONDS", "120"))
+EXPORT_MAX_ATTEMPTS = int(os.getenv("EXPORT_MAX_ATTEMPTS", "3"))
+EXPORT_RETENTION_HOURS = float(os.getenv("EXPORT_RETENTION_HOURS", "24"))
+
+# dataset -> (table, query); no ORDER BY, so the table is read with one sequential scan
+DATASETS = {
+    "orders": ("app.orders", "SELECT * FROM app.orders"),
+    "users": ("app.users", """
+        SELECT user_id, username, email, phone, full_name, role_id, current_role_id, is_active, avatar, created_at
+          FROM app.users
+    """),
+    "deliveries": ("app.deliveries", "SELECT * FROM app.deliveries"),
+    "payments": ("app.payments", "SELECT * FROM app.payments"),
+}
+FORMATS = {
+    "csv": (".csv.gz", "application/gzip"),
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+_start_lock = threading.Lock()
+_started_pid = None
+_wake = threading.Event()
+_stats = {"jobs": 0, "failed": 0, "rows": 0, "bytes": 0, "expired": 0, "errors": 0}
+
+
+def parquet_available():
+    return pa is not None
+
+
+def create(dataset, fmt, user_id):
+    """Queue an export; returns the job row."""
+    table, _ = DATASETS[dataset]
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        # planner statistics: a free row estimate to show progress against
+        cur.execute(f"""
+            INSERT INTO app.export_jobs (dataset, format, requested_by, rows_estimated)
+            VALUES (%s, %s, %s, (SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = '{table}'::regclass))
+            RETURNING *;
+        """, (dataset, fmt, user_id))
+        job = cur.fetchone()
+        cur.close()
+    finally:
+        conn.close()
+    if _started_pid == os.getpid():
+        _wake.set()
+    return describe(job)
+
+
+def describe(job):
+    """API view of a job row: adds progress (0..1) and drops the server file path."""
+    job = dict(job)
+    job.pop("file_path", None)
+    if job["status"] == "DONE":
+        job["progress"] = 1.0
+    elif job["rows_estimated"]:
+        job["progress"] = round(min(job["rows_written"] / job["rows_estimated"], 0.99), 4)
+    else:
+        job["progress"] = 0.0
+    return job
+
+
+def get(cur, job_id):
+    """The job row (RealDictCursor), or None."""
+    cur.execute("SELECT * FROM app.export_jobs WHERE job_id = %s;", (job_id,))
+    return cur.fetchone()
+
+
+def recent(cur, limit=50):
+    cur.execute("SELECT * FROM app.export_jobs ORDER BY job_id DESC LIMIT %s;", (limit,))
+    return [describe(job) for job in cur.fetchall()]
+
+
+def download_name(job):
+    return f"{job['dataset']}-{job['job_id']}{FORMATS[job['format']][0]}"
+
+
+def mimetype(job):
+    return FORMATS[job["format"]][1]
+
+
+class _Superseded(Exception):
+    """The job was claimed again (or expired) while this attempt was running."""
+
+
+class _Progress:
+    """Saves rows/bytes written and the heartbeat, at most every EXPORT_PROGRESS_SECONDS."""
+
+    def __init__(self, job_id, attempt):
+        self.job_id = job_id
+        self.attempt = attempt
+        self.saved_at = time.monotonic()
+
+    def update(self, rows, nbytes, force=False):
+        if not force and time.monotonic() - self.saved_at < EXPORT_PROGRESS_SECONDS:
+            return
+        self.saved_at = time.monotonic()
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                UPDATE app.export_jobs SET rows_written = %s, bytes_written = %s, heartbeat_at = NOW()
+                 WHERE job_id = %s AND attempts = %s AND status = 'RUNNING';
+            """, (rows, nbytes, self.job_id, self.attempt))
+            current = cur.rowcount == 1
+            cur.close()
+        finally:
+            conn.close()
+        if not current:
+            raise _Superseded()
+
+
+class _CsvSink:
+    """File object COPY writes into: compresses, and counts lines for progress."""
+
+    def __init__(self, raw, progress):
+        self.raw = raw
+        self.gz = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=EXPORT_GZIP_LEVEL)
+        self.progress = progress
+        self.lines = 0
+
+    def write(self, data):
+        self.gz.write(data)
+        # approximate while running (a quoted field may hold a newline); exact rowcount at the end
+        self.lines += data.count(b"\n")
+        self.progress.update(max(self.lines - 1, 0), self.raw.tell())
+
+    def close(self):
+        self.gz.close()
+
+
+def _write_csv(conn, sql, path, progress):
+    cur = conn.cursor()
+    with open(path, "wb") as raw:
+        sink = _CsvSink(raw, progress)
+        cur.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, HEADER true)", sink)
+        sink.close()
+    rows = cur.rowcount
+    cur.close()
+    return rows
+
+
+# pg type oid -> (arrow type, value conversion)
+def _arrow_column(col):
+    oid = col.type_code
+    if oid in (20, 21, 23):                                          # int8, int2, int4
+        return pa.int64(), None
+    if oid in (700, 701):                                            # float4, float8
+        return pa.float64(), None
+    if oid == 16:                                                    # bool
+        return pa.bool_(), None
+    if oid == 1700 and col.precision and col.precision <= 38:       # numeric(p, s)
+        return pa.decimal128(col.precision, col.scale or 0), None
+    if oid == 1114:                                                  # timestamp
+        return pa.timestamp("us"), None
+    if oid == 1184:                                                  # timestamptz
+        return pa.timestamp("us", tz="UTC"), None
+    if oid == 1082:                                                  # date
+        return pa.date32(), None
+    if oid in (114, 3802):                                           # json, jsonb: as text
+        return pa.string(), lambda v: json.dumps(v, default=str)
+    # text, varchar, unconstrained numeric (kept exact), anything else
+    return pa.string(), lambda v: v if isinstance(v, str) else str(v)
+
+
+def _write_parquet(conn, sql, path, progress):
+    conn.autocommit = False   # named cursors live inside a transaction
+    cur = conn.cursor(name="export")
+    cur.itersize = EXPORT_CHUNK_ROWS
+    cur.execute(sql)
+    batch = cur.fetchmany(EXPORT_CHUNK_ROWS)
+    columns = [(col.name, *_arrow_column(col)) for col in cur.description]
+    schema = pa.schema([(name, arrow_type) for name, arrow_type, _ in columns])
+    rows = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        while batch:
+            arrays = []
+            for i, (_, arrow_type, convert) in enumerate(columns):
+                values = [row[i] for row in batch]
+                if convert:
+                    values = [None if v is None else convert(v) for v in values]
+                arrays.append(pa.array(values, type=arrow_type))
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            rows += len(batch)
+            progress.update(rows, os.path.getsize(path))
+            batch = cur.fetchmany(EXPORT_CHUNK_ROWS)
+    cur.close()
+    conn.rollback()
+    return rows
+
+
+def run(job):
+    """Write the file for a claimed job and mark it DONE or FAILED."""
+    _, sql = DATASETS[job["dataset"]]
+    attempt = job["attempts"]
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    # per attempt: a stalled earlier attempt of the same job never shares its files
+    path = os.path.join(EXPORT_DIR, f"{job['dataset']}-{job['job_id']}.{attempt}{FORMATS[job['format']][0]}")
+    part = path + ".part"
+    progress = _Progress(job["job_id"], attempt)
+    conn = None
+    try:
+        if job["format"] == "parquet" and pa is None:
+            raise RuntimeError("Parquet export needs pyarrow installed")
+        conn = get_dedicated_connection()
+        write = _write_parquet if job["format"] == "parquet" else _write_csv
+        rows = write(conn, sql, part, progress)
+        os.replace(part, path)
+    except Exception as e:
+        if os.path.exists(part):
+            os.remove(part)
+        if isinstance(e, _Superseded):
+            print(f"[Exports] Job {job['job_id']} attempt {attempt} superseded, stopped")
+            return
+        _stats["failed"] += 1
+        print(f"[Exports] Job {job['job_id']} failed: {e}")
+        _finish(job["job_id"], attempt, "FAILED", error=str(e)[:1000])
+        return
+    finally:
+        if conn is not None:
+            conn.close()
+
+    nbytes = os.path.getsize(path)
+    if not _finish(job["job_id"], attempt, "DONE", rows=rows, nbytes=nbytes, path=path):
+        os.remove(path)
+        print(f"[Exports] Job {job['job_id']} attempt {attempt} superseded, file discarded")
+        return
+    _stats["jobs"] += 1
+    _stats["rows"] += rows
+    _stats["bytes"] += nbytes
+
+
+def _finish(job_id, attempt, status, rows=None, nbytes=None, path=None, error=None):
+    """Record the result if attempt is still the job's current one; returns whether it was."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE app.export_jobs
+               SET status = %s, rows_written = COALESCE(%s, rows_written), bytes_written = COALESCE(%s, bytes_written),
+                   file_path = %s, error = %s, finished_at = NOW(), heartbeat_at = NOW()
+             WHERE job_id = %s AND attempts = %s AND status = 'RUNNING';
+        """, (status, rows, nbytes, path, error, job_id, attempt))
+        current = cur.rowcount == 1
+        cur.close()
+    finally:
+        conn.close()
+    return current
+
+
+def claim():
+    """Take the oldest queued (or abandoned) job; returns its row or None."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("""
+            UPDATE app.export_jobs
+               SET status = 'RUNNING', attempts = attempts + 1, started_at = NOW(), heartbeat_at = NOW(),
+                   rows_written = 0, bytes_written = 0
+             WHERE job_id = (
+                    SELECT job_id FROM app.export_jobs
+                     WHERE status = 'QUEUED'
+                        OR (status = 'RUNNING' AND heartbeat_at < NOW() - make_interval(secs => %s)
+                            AND attempts < %s)
+                     ORDER BY created_at
+                     LIMIT 1
+                       FOR UPDATE SKIP LOCKED)
+            RETURNING *;
+        """, (EXPORT_STALE_SECONDS, EXPORT_MAX_ATTEMPTS))
+        job = cur.fetchone()
+        cur.close()
+        return job
+    finally:
+        conn.close()
+
+
+def expire():
+    """Fail abandoned jobs out of attempts, remove jobs (and files) past retention; returns how many removed."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE app.export_jobs SET status = 'FAILED', error = 'Export worker stopped', finished_at = NOW()
+             WHERE status = 'RUNNING' AND heartbeat_at < NOW() - make_interval(secs => %s) AND attempts >= %s;
+        """, (EXPORT_STALE_SECONDS, EXPORT_MAX_ATTEMPTS))
+        cur.execute("""
+            DELETE FROM app.export_jobs
+             WHERE status IN ('DONE', 'FAILED') AND finished_at < NOW() - make_interval(secs => %s)
+            RETURNING file_path;
+        """, (EXPORT_RETENTION_HOURS * 3600,))
+        paths = [path for (path,) in cur.fetchall() if path]
+        cur.close()
+    finally:
+        conn.close()
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    _stats["expired"] += len(paths)
+    return len(paths)
+
+
+def start():
+    """Start the export worker threads for this process (threads do not survive a fork)."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    for i in range(EXPORT_WORKERS):
+        threading.Thread(target=_run, name=f"export-worker-{i}", daemon=True).start()
+
+
+def _run():
+    while True:
+        try:
+            job = claim()
+            if job:
+                run(job)
+                continue
+            expire()
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"[Exports] Worker error: {e}")
+        # woken by create() in this process; the timeout picks up jobs queued by other workers
+        _wake.wait(EXPORT_POLL_SECONDS)
+        _wake.clear()
+
+
+def init_app(app):
+    app.before_request(start)
+
+
+def stats():
+    return {"workers": EXPORT_WORKERS, "parquet": parquet_available(), **_stats}
@@ -0,0 +1,172 @@
+"""
+Geospatial helpers: geohash cells and great-circle distance.
+
+A geohash of precision 5 is a cell of roughly 4.9 km x 4.9 km, precision 6
+about 1.2 km x 0.6 km. Points that share a prefix are close to each other,
+so the hash works as a cache key and as a coarse spatial index.
+"""
+import math
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+
+def encode(lat: float, lng: float, precision: int = 5) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits, ch, even = 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def bounds(cell: str):
+    """(lat_lo, lat_hi, lng_lo, lng_hi) of a geohash cell."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for c in cell:
+        value = _DECODE[c]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if bit:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return lat_lo, lat_hi, lng_lo, lng_hi
+
+
+def decode(cell: str):
+    """Center (lat, lng) of a geohash cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = bounds(cell)
+    return (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+
+
+def neighbors(cell: str):
+    """The cell itself and its 8 neighbours (fewer at the poles)."""
+    lat_lo, lat_hi, lng_lo, lng_hi = bounds(cell)
+    d_lat, d_lng = lat_hi - lat_lo, lng_hi - lng_lo
+    lat, lng = (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+    cells = []
+    for dy in (-1, 0, 1):
+        y = lat + dy * d_lat
+        if y < -90 or y > 90:
+            continue
+        for dx in (-1, 0, 1):
+            x = (lng + dx * d_lng + 180) % 360 - 180
+            neighbour = encode(y, x, len(cell))
+            if neighbour not in cells:
+                cells.append(neighbour)
+    return cells
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Return distance (km) between two points (lat, lon)."""
+    R = 6371  # Earth radius (km)
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(d_lambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+# ---- radius search ----
+# cell height in km per precision (width is the same or double, times cos(lat))
+_CELL_HEIGHT_KM = {1: 5009.4, 2: 625.1, 3: 156.5, 4: 19.5, 5: 4.89, 6: 0.61, 7: 0.153, 8: 0.0191}
+_CELL_WIDTH_KM = {1: 5009.4, 2: 1252.3, 3: 156.5, 4: 39.1, 5: 4.89, 6: 1.22, 7: 0.153, 8: 0.0382}
+
+
+def precision_for_radius(lat: float, radius_km: float, max_precision: int = 7) -> int:
+    """Finest precision whose cells are at least radius_km across at this latitude."""
+    shrink = max(math.cos(math.radians(lat)), 0.01)
+    for precision in range(max_precision, 0, -1):
+        if min(_CELL_HEIGHT_KM[precision], _CELL_WIDTH_KM[precision] * shrink) >= radius_km:
+            return precision
+    return 1
+
+
+def covering_cells(lat: float, lng: float, radius_km: float, max_precision: int = 7):
+    """Geohash prefixes whose union contains the circle (the center cell and its neighbours)."""
+    return neighbors(encode(lat, lng, precision_for_radius(lat, radius_km, max_precision)))
+
+
+class GridIndex:
+    """
+    In-process geohash grid: points bucketed by cell, radius / nearest-k
+    queries only look at the buckets around the query point.
+    """
+
+    def __init__(self, precision: int = 6):
+        self.precision = precision
+        self._cells = {}     # cell -> {key: (lat, lng)}
+        self._where = {}     # key -> cell
+
+    def __len__(self):
+        return len(self._where)
+
+    def insert(self, key, lat: float, lng: float):
+        self.remove(key)
+        cell = encode(lat, lng, self.precision)
+        self._cells.setdefault(cell, {})[key] = (lat, lng)
+        self._where[key] = cell
+
+    def remove(self, key):
+        cell = self._where.pop(key, None)
+        if cell is not None:
+            bucket = self._cells[cell]
+            del bucket[key]
+            if not bucket:
+                del self._cells[cell]
+
+    def nearest(self, lat: float, lng: float, radius_km: float, k: int = None):
+        """[(distance_km, key)] within radius_km, nearest first, at most k."""
+        prefixes = covering_cells(lat, lng, radius_km, self.precision)
+        depth = self.precision - len(prefixes[0])
+        if len(prefixes) * 32 ** depth <= len(self._cells):
+            # enumerate the child cells of the covering prefixes
+            cells = prefixes
+            for _ in range(depth):
+                cells = [c + ch for c in cells for ch in _BASE32]
+            buckets = [self._cells[c] for c in cells if c in self._cells]
+        else:
+            plen = len(prefixes[0])
+            buckets = [b for c, b in self._cells.items() if c[:plen] in prefixes]
+        found = []
+        for bucket in buckets:
+            for key, (p_lat, p_lng) in bucket.items():
+                d = haversine(lat, lng, p_lat, p_lng)
+                if d <= radius_km:
+                    found.append((d, key))
+        found.sort()
+        return found[:k] if k else found
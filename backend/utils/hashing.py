@@ -0,0 +1,106 @@
+"""
+Password hashing off the request thread.
+
+bcrypt is CPU bound and holds the worker thread for the whole hash, so hashing
+and verification run in a per-process ProcessPoolExecutor. At most
+HASH_MAX_PENDING jobs may be queued or running; beyond that HashingBusy is
+raised and app.py answers 503 with Retry-After instead of piling up requests.
+BCRYPT_ROUNDS sets the cost of new hashes; needs_rehash() reports stored
+hashes made with a different cost so login can upgrade them.
+"""
+import os
+import threading
+import bcrypt
+from concurrent.futures import ProcessPoolExecutor
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))  # 0 = hash inline
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", str(max(HASH_WORKERS, 1) * 4)))
+HASH_QUEUE_WAIT = float(os.getenv("HASH_QUEUE_WAIT", "0.2"))   # seconds to wait for a queue slot
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", "10"))
+RETRY_AFTER_SECONDS = 1
+
+
+class HashingBusy(Exception):
+    """All hashing slots are taken; the client should retry later."""
+
+    def __init__(self, retry_after=RETRY_AFTER_SECONDS):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+# ---- functions executed in the worker processes ----
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+# ---- per-process executor ----
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(HASH_MAX_PENDING, 1))
+_stats = {"submitted": 0, "rejected": 0}
+
+
+def _get_executor():
+    global _executor, _executor_pid, _slots
+    if _executor is not None and _executor_pid == os.getpid():
+        return _executor
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # an executor inherited through fork belongs to the parent; start our own
+            _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+            _executor_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(max(HASH_MAX_PENDING, 1))
+        return _executor
+
+
+def _run(fn, *args):
+    if HASH_WORKERS <= 0:
+        return fn(*args)
+    executor = _get_executor()
+    slots = _slots
+    if not slots.acquire(timeout=HASH_QUEUE_WAIT):
+        _stats["rejected"] += 1
+        raise HashingBusy()
+    try:
+        future = executor.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    _stats["submitted"] += 1
+    future.add_done_callback(lambda _: slots.release())
+    return future.result(timeout=HASH_TIMEOUT)
+
+
+def hash_password(password: str) -> str:
+    return _run(_hashpw, password.encode("utf-8"), BCRYPT_ROUNDS).decode("utf-8")
+
+
+def check_password(password: str, hashed: str) -> bool:
+    return _run(_checkpw, password.encode("utf-8"), hashed.encode("utf-8"))
+
+
+def hash_cost(hashed: str):
+    # $2b$12$<salt+hash>
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
+def needs_rehash(hashed: str) -> bool:
+    return hash_cost(hashed) != BCRYPT_ROUNDS
+
+
+def stats():
+    return {
+        "workers": HASH_WORKERS,
+        "rounds": BCRYPT_ROUNDS,
+        "max_pending": HASH_MAX_PENDING,
+        **_stats,
+    }
@@ -0,0 +1,170 @@
+"""
+Buffered GPS ingestion into app.tracking_events.
+
+POST /deliveries/<id>/locations only appends points to a per-process buffer;
+a background thread writes them with one multi-row INSERT (execute_values)
+every LOCATION_FLUSH_MS milliseconds, or as soon as LOCATION_FLUSH_ROWS
+points are waiting. The buffer holds at most LOCATION_BUFFER_MAX points:
+beyond that new points are dropped and counted, so a slow database cannot
+grow worker memory without bound. Points the database rejects (a deleted
+delivery, an out-of-range value) are dropped one by one; the rest of the
+batch is still written. Points not yet flushed when a worker dies
+are lost; location updates are frequent enough for that to be acceptable.
+"""
+import atexit
+import os
+import threading
+import time
+import psycopg2
+import psycopg2.extras
+from db import get_db_connection
+
+LOCATION_FLUSH_MS = int(os.getenv("LOCATION_FLUSH_MS", "500"))
+LOCATION_FLUSH_ROWS = int(os.getenv("LOCATION_FLUSH_ROWS", "2000"))
+LOCATION_BUFFER_MAX = int(os.getenv("LOCATION_BUFFER_MAX", "100000"))
+
+_lock = threading.Lock()
+_buffer = []             # (delivery_id, lat, lng, recorded_at epoch seconds)
+_wake = threading.Event()
+_flush_lock = threading.Lock()
+_started_pid = None
+_stats = {"accepted": 0, "dropped": 0, "rejected": 0, "flushed": 0, "flushes": 0, "flush_errors": 0,
+          "last_batch": 0, "max_batch": 0, "flush_ms_total": 0.0, "flush_ms_max": 0.0}
+
+
+def enqueue(points):
+    """Buffer [(delivery_id, lat, lng, recorded_at epoch)]; returns how many were accepted."""
+    if _started_pid != os.getpid():
+        start()
+    with _lock:
+        room = max(LOCATION_BUFFER_MAX - len(_buffer), 0)
+        accepted = points[:room]
+        _buffer.extend(accepted)
+        size = len(_buffer)
+    _stats["accepted"] += len(accepted)
+    _stats["dropped"] += len(points) - len(accepted)
+    if size >= LOCATION_FLUSH_ROWS:
+        _wake.set()
+    return len(accepted)
+
+
+def flush():
+    """Write everything buffered so far; returns the number of rows written."""
+    global _buffer
+    with _flush_lock:
+        with _lock:
+            batch, _buffer = _buffer, []
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        conn = get_db_connection()
+        try:
+            conn.autocommit = False   # all pages of the batch or none
+            cur = conn.cursor()
+            rejected = _insert_valid(cur, batch)
+            cur.close()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            _stats["flush_errors"] += 1
+            # put the batch back in front of newer points, within the buffer limit
+            with _lock:
+                keep = batch[:max(LOCATION_BUFFER_MAX - len(_buffer), 0)]
+                _buffer = keep + _buffer
+            _stats["dropped"] += len(batch) - len(keep)
+            raise
+        finally:
+            conn.close()
+        elapsed = (time.perf_counter() - started) * 1000
+        written = len(batch) - rejected
+        _stats["flushes"] += 1
+        _stats["flushed"] += written
+        _stats["rejected"] += rejected
+        _stats["dropped"] += rejected
+        _stats["last_batch"] = len(batch)
+        _stats["max_batch"] = max(_stats["max_batch"], len(batch))
+        _stats["flush_ms_total"] += elapsed
+        _stats["flush_ms_max"] = max(_stats["flush_ms_max"], elapsed)
+        return written
+
+
+def _insert(cur, rows):
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO app.tracking_events (delivery_id, event_type, lat, lng, created_at)
+        VALUES %s;
+    """, rows, template="(%s, 'LOCATION', %s, %s, TO_TIMESTAMP(%s))", page_size=1000)
+
+
+def _insert_valid(cur, rows):
+    """
+    Insert rows, leaving out the ones the database rejects (a point for a
+    delivery deleted meanwhile, a value out of range); returns how many.
+    A failing batch is split in halves under savepoints, so one bad row
+    costs about 2*log2(len(rows)) extra INSERTs and the other points of
+    the interval are still written.
+    """
+    cur.execute("SAVEPOINT location_rows;")
+    try:
+        _insert(cur, rows)
+        cur.execute("RELEASE SAVEPOINT location_rows;")
+        return 0
+    except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+        cur.execute("ROLLBACK TO SAVEPOINT location_rows;")
+        cur.execute("RELEASE SAVEPOINT location_rows;")
+        if len(rows) == 1:
+            print(f"[Locations] Dropped point {rows[0]}: {str(e).splitlines()[0]}")
+            return 1
+    half = len(rows) // 2
+    return _insert_valid(cur, rows[:half]) + _insert_valid(cur, rows[half:])
+
+
+def start():
+    """Start the flusher thread for this process (threads do not survive a fork)."""
+    global _started_pid, _buffer
+    with _lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+        _buffer = []   # points inherited from the parent are flushed by the parent
+    threading.Thread(target=_run, name="location-flusher", daemon=True).start()
+
+
+def _run():
+    backoff = 1
+    while True:
+        _wake.wait(LOCATION_FLUSH_MS / 1000)
+        _wake.clear()
+        try:
+            flush()
+            backoff = 1
+        except Exception as e:
+            print(f"[Locations] Flush error: {e}, retrying in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+
+
+@atexit.register
+def _flush_at_exit():
+    if _started_pid == os.getpid() and _buffer:
+        try:
+            flush()
+        except Exception as e:
+            print(f"[Locations] Final flush failed, {len(_buffer)} points lost: {e}")
+
+
+def stats():
+    flushes = _stats["flushes"]
+    return {
+        "buffered": len(_buffer),
+        "accepted": _stats["accepted"],
+        "dropped": _stats["dropped"],
+        "rejected": _stats["rejected"],
+        "flushed": _stats["flushed"],
+        "flushes": flushes,
+        "flush_errors": _stats["flush_errors"],
+        "last_batch": _stats["last_batch"],
+        "max_batch": _stats["max_batch"],
+        "avg_batch": round(_stats["flushed"] / flushes, 1) if flushes else 0,
+        "flush_ms_avg": round(_stats["flush_ms_total"] / flushes, 2) if flushes else 0.0,
+        "flush_ms_max": round(_stats["flush_ms_max"], 2),
+    }
@@ -0,0 +1,254 @@
+"""
+Monthly partitions and retention for app.notifications.
+
+app.notifications is range partitioned by created_at into one table per
+month, app.notifications_pYYYYMM (migrations/021_partition_notifications.py).
+A maintenance thread per worker (only one runs at a time, behind a pg
+advisory lock) keeps NOTIFICATION_PARTITIONS_AHEAD months of partitions
+ready and removes months older than NOTIFICATION_RETENTION_MONTHS whole:
+DROP TABLE, or with NOTIFICATION_ARCHIVE=1 a DETACH into the app_archive
+schema. Either way no rows are deleted one by one. Unread counters
+(migrations/020) are adjusted for the unread rows of a removed month first,
+since dropping a partition fires no DELETE triggers.
+
+A DEFAULT partition, app.notifications_default, takes rows whose month
+has no partition (an outbox retry of a month already removed, a clock past
+the prepared months) instead of failing the insert. When a month's
+partition is created its rows are moved out of it, and rows older than the
+retention window are removed from it with the expired months.
+
+Notifications older than the retention window are hidden from listings
+before their partition is removed (visible_since), which also lets the
+planner prune the old partitions.
+"""
+import datetime
+import os
+import re
+import threading
+import time
+from db import get_db_connection
+
+NOTIFICATION_RETENTION_MONTHS = int(os.getenv("NOTIFICATION_RETENTION_MONTHS", "6"))
+NOTIFICATION_PARTITIONS_AHEAD = int(os.getenv("NOTIFICATION_PARTITIONS_AHEAD", "3"))
+NOTIFICATION_ARCHIVE = os.getenv("NOTIFICATION_ARCHIVE", "0") == "1"
+NOTIFICATION_MAINTENANCE_SECONDS = float(os.getenv("NOTIFICATION_MAINTENANCE_SECONDS", "3600"))
+MAINTENANCE_LOCK_ID = 812003   # pg advisory lock so only one worker maintains partitions
+ARCHIVE_SCHEMA = "app_archive"
+DEFAULT_PARTITION = "notifications_default"
+VISIBLE_SINCE_TTL = 60   # seconds the database month is reused by visible_since()
+_PARTITION_RE = re.compile(r"^notifications_p(\d{4})(\d{2})$")
+
+
+_start_lock = threading.Lock()
+_started_pid = None
+_stats = {"runs": 0, "skipped": 0, "created": 0, "dropped": 0, "archived": 0, "default_rows_expired": 0,
+          "errors": 0, "last_run": None}
+_db_month = (None, 0.0)   # (current_month(), expires_at monotonic)
+
+
+def add_months(month: datetime.date, n: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def visible_since(cur) -> datetime.date:
+    """First day of the oldest month still listed. Passed as a query parameter
+    (not computed in SQL) so the planner prunes older partitions up front.
+    Counted on the database clock like the partitions; the month is looked up
+    at most every VISIBLE_SINCE_TTL seconds."""
+    global _db_month
+    month, expires_at = _db_month
+    if month is None or time.monotonic() >= expires_at:
+        month = current_month(cur)
+        _db_month = (month, time.monotonic() + VISIBLE_SINCE_TTL)
+    return add_months(month, -NOTIFICATION_RETENTION_MONTHS)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"notifications_p{month:%Y%m}"
+
+
+def current_month(cur) -> datetime.date:
+    # the database clock stamps created_at, so months are counted on it
+    cur.execute("SELECT date_trunc('month', LOCALTIMESTAMP)::date;")
+    return cur.fetchone()[0]
+
+
+def partitions(cur, parent="notifications"):
+    """[(name, first day of month)] of the monthly partitions of app.<parent>, oldest first."""
+    cur.execute("""
+        SELECT c.relname
+          FROM pg_inherits i
+          JOIN pg_class c ON c.oid = i.inhrelid
+          JOIN pg_class p ON p.oid = i.inhparent
+          JOIN pg_namespace n ON n.oid = p.relnamespace
+         WHERE n.nspname = 'app' AND p.relname = %s;
+    """, (parent,))
+    found = []
+    for (name,) in cur.fetchall():
+        m = _PARTITION_RE.match(name)
+        if m:
+            found.append((name, datetime.date(int(m.group(1)), int(m.group(2)), 1)))
+    return sorted(found, key=lambda p: p[1])
+
+
+def ensure_partitions(cur, since=None, ahead=NOTIFICATION_PARTITIONS_AHEAD, parent="notifications"):
+    """Create the default partition and the missing monthly partitions from since
+    (default: this month) to ahead months out."""
+    cur.execute(f"CREATE TABLE IF NOT EXISTS app.{DEFAULT_PARTITION} PARTITION OF app.{parent} DEFAULT;")
+    this_month = current_month(cur)
+    month = min(since or this_month, this_month)
+    existing = {m for _, m in partitions(cur, parent)}
+    created = []
+    while month <= add_months(this_month, ahead):
+        if month not in existing:
+            bounds = (month, add_months(month, 1))
+            name = partition_name(month)
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM app.{DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s);",
+                        bounds)
+            if cur.fetchone()[0]:
+                # a new partition may not overlap rows left in the default one:
+                # move them into a plain table and attach that. Partition to
+                # partition, so the counter triggers of the parent do not fire.
+                cur.execute(f"CREATE TABLE app.{name} (LIKE app.{parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+                cur.execute(f"""
+                    WITH moved AS (
+                        DELETE FROM app.{DEFAULT_PARTITION} WHERE created_at >= %s AND created_at < %s RETURNING *
+                    )
+                    INSERT INTO app.{name} SELECT * FROM moved;
+                """, bounds)
+                cur.execute(f"ALTER TABLE app.{parent} ATTACH PARTITION app.{name} FOR VALUES FROM (%s) TO (%s);",
+                            bounds)
+            else:
+                cur.execute(f"""
+                    CREATE TABLE IF NOT EXISTS app.{name}
+                    PARTITION OF app.{parent} FOR VALUES FROM (%s) TO (%s);
+                """, bounds)
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+
+def expire_partitions(cur, retention=NOTIFICATION_RETENTION_MONTHS, archive=NOTIFICATION_ARCHIVE):
+    """Drop (or archive) the partitions entirely before the retention window; returns their names."""
+    cutoff = add_months(current_month(cur), -retention)
+    expired = [name for name, month in partitions(cur) if add_months(month, 1) <= cutoff]
+    if not expired:
+        return []
+    # parent first, as queries do, so we cannot deadlock with a reader
+    cur.execute("SET LOCAL lock_timeout = '5s';")
+    cur.execute("LOCK TABLE app.notifications IN ACCESS EXCLUSIVE MODE;")
+    if archive:
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA};")
+    for name in expired:
+        _uncount_unread(cur, name)
+        if archive:
+            cur.execute(f"ALTER TABLE app.notifications DETACH PARTITION app.{name};")
+            cur.execute(f"ALTER TABLE app.{name} SET SCHEMA {ARCHIVE_SCHEMA};")
+        else:
+            cur.execute(f"DROP TABLE app.{name};")
+    return expired
+
+
+def expire_default(cur, retention=NOTIFICATION_RETENTION_MONTHS, archive=NOTIFICATION_ARCHIVE):
+    """Remove (or archive) the rows of the default partition before the retention window; returns how many."""
+    cutoff = add_months(current_month(cur), -retention)
+    cur.execute(f"SELECT EXISTS (SELECT 1 FROM app.{DEFAULT_PARTITION} WHERE created_at < %s);", (cutoff,))
+    if not cur.fetchone()[0]:
+        return 0
+    _uncount_unread(cur, DEFAULT_PARTITION, "created_at < %s", (cutoff,))
+    if archive:
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA};")
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {ARCHIVE_SCHEMA}.{DEFAULT_PARTITION}
+            (LIKE app.notifications INCLUDING DEFAULTS);
+        """)
+        cur.execute(f"""
+            WITH moved AS (DELETE FROM app.{DEFAULT_PARTITION} WHERE created_at < %s RETURNING *)
+            INSERT INTO {ARCHIVE_SCHEMA}.{DEFAULT_PARTITION} SELECT * FROM moved;
+        """, (cutoff,))
+    else:
+        cur.execute(f"DELETE FROM app.{DEFAULT_PARTITION} WHERE created_at < %s;", (cutoff,))
+    return cur.rowcount
+
+
+def _uncount_unread(cur, table, where="TRUE", params=()):
+    # removing rows from a partition directly fires no trigger of the parent
+    cur.execute(f"""
+        UPDATE app.notification_counters c
+           SET unread = GREATEST(c.unread - d.n, 0)
+          FROM (SELECT user_id, COUNT(*) AS n FROM app.{table}
+                 WHERE NOT COALESCE(is_read, FALSE) AND {where} GROUP BY user_id) d
+         WHERE c.user_id = d.user_id;
+    """, params)
+
+
+def run_once():
+    """One maintenance pass; skipped if another worker holds the lock."""
+    conn = get_db_connection()
+    try:
+        conn.autocommit = False
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s);", (MAINTENANCE_LOCK_ID,))
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            _stats["skipped"] += 1
+            return {"skipped": True}
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'app.notifications'::regclass;")
+        if cur.fetchone()[0] != "p":
+            # migrations/021 not applied yet: nothing to maintain
+            conn.rollback()
+            _stats["skipped"] += 1
+            return {"skipped": True}
+        created = ensure_partitions(cur)
+        expired = expire_partitions(cur)
+        default_expired = expire_default(cur)
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        _stats["errors"] += 1
+        raise
+    finally:
+        conn.close()
+
+    _stats["runs"] += 1
+    _stats["created"] += len(created)
+    _stats["archived" if NOTIFICATION_ARCHIVE else "dropped"] += len(expired)
+    _stats["default_rows_expired"] += default_expired
+    _stats["last_run"] = time.time()
+    if created or expired or default_expired:
+        print(f"[Notifications] partitions created={created} {'archived' if NOTIFICATION_ARCHIVE else 'dropped'}={expired}"
+              f" default rows expired={default_expired}")
+    return {"skipped": False, "created": created, "archived" if NOTIFICATION_ARCHIVE else "dropped": expired,
+            "default_rows_expired": default_expired}
+
+
+def start():
+    """Start the maintenance thread for this process (threads do not survive a fork)."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    threading.Thread(target=_run, name="notification-retention", daemon=True).start()
+
+
+def _run():
+    while True:
+        try:
+            run_once()
+        except Exception as e:
+            print(f"[Notifications] Partition maintenance failed: {e}")
+        time.sleep(NOTIFICATION_MAINTENANCE_SECONDS)
+
+
+def init_app(app):
+    app.before_request(start)
+
+
+def stats():
+    return {"retention_months": NOTIFICATION_RETENTION_MONTHS, "partitions_ahead": NOTIFICATION_PARTITIONS_AHEAD,
+            "archive": NOTIFICATION_ARCHIVE, **_stats}
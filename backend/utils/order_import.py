@@ -0,0 +1,175 @@
+"""
+Bulk order import for merchants (POST /merchant/orders/import).
+
+Takes a JSON array of orders (or {"orders": [...]}) or a CSV file with a
+header line, up to IMPORT_MAX_ROWS. Every row is checked, then all valid
+rows are priced in one pricing.quote_many() call (distance from the
+coordinates, weather of each pickup cell), the same way POST /orders prices
+a single order; distance_km and price_estimate sent by the client are
+ignored. Valid rows are written with one COPY in the request transaction.
+Order ids are drawn from the sequence first, so each line of the report
+names the order its row became.
+
+The report has one entry per input row, in input order, with "row" counting
+data rows from 1 (a CSV header line is not a row).
+"""
+import csv
+import io
+import os
+import numpy as np
+from utils import pricing, weather as weather_service
+from utils.roles import role_id_by_name
+
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "50000"))
+
+REQUIRED = ("customer_id", "pickup_address", "delivery_address",
+            "pickup_lat", "pickup_lng", "delivery_lat", "delivery_lng")
+COORDINATES = ("pickup_lat", "pickup_lng", "delivery_lat", "delivery_lng")
+# optional text fields -> column length (None: unlimited)
+OPTIONAL = {
+    "pickup_contact_name": 255, "pickup_contact_phone": 20,
+    "delivery_contact_name": 255, "delivery_contact_phone": 20,
+    "notes": None,
+}
+COLUMNS = ("order_id", "customer_id", "merchant_id", "pickup_address", "delivery_address",
+           "pickup_lat", "pickup_lng", "delivery_lat", "delivery_lng",
+           "distance_km", "price_estimate", "service_type", "package_size",
+           "pickup_contact_name", "pickup_contact_phone", "delivery_contact_name", "delivery_contact_phone",
+           "notes")
+
+
+class ImportRejected(ValueError):
+    """The payload as a whole cannot be imported (not a per-row problem)."""
+
+
+def parse_csv(text):
+    """Rows of a CSV document with a header line, as dicts; empty cells are None."""
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or not set(REQUIRED) <= {f.strip() for f in reader.fieldnames}:
+        raise ImportRejected(f"CSV header must include {', '.join(REQUIRED)}")
+    rows = []
+    for line in reader:
+        rows.append({(k or "").strip(): (v.strip() or None) if isinstance(v, str) else v for k, v in line.items()})
+        if len(rows) > IMPORT_MAX_ROWS:
+            break
+    return rows
+
+
+def parse_json(payload):
+    rows = payload.get("orders") if isinstance(payload, dict) else payload
+    if not isinstance(rows, list):
+        raise ImportRejected("Body must be a JSON array of orders or {\"orders\": [...]}")
+    return rows
+
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _check(row, tariffs):
+    """(fields, errors) for one row; coordinates come back as floats (NaN if unusable)."""
+    if not isinstance(row, dict):
+        return None, ["not an object"]
+    errors = []
+    fields = {}
+    for name in ("pickup_address", "delivery_address"):
+        fields[name] = _text(row.get(name))
+        if fields[name] is None:
+            errors.append(f"{name} is required")
+
+    try:
+        fields["customer_id"] = int(row.get("customer_id"))
+    except (TypeError, ValueError):
+        fields["customer_id"] = None
+        errors.append("customer_id must be an integer")
+
+    for name in COORDINATES:
+        try:
+            fields[name] = float(row.get(name))
+        except (TypeError, ValueError):
+            fields[name] = float("nan")
+            errors.append(f"{name} must be a number")
+
+    fields["service_type"] = _text(row.get("service_type")) or "bike"
+    if fields["service_type"] not in tariffs.base_fare:
+        errors.append(f"service_type must be one of {', '.join(tariffs.base_fare)}")
+    fields["package_size"] = _text(row.get("package_size")) or "small"
+    if fields["package_size"] not in tariffs.package_surcharge:
+        errors.append(f"package_size must be one of {', '.join(tariffs.package_surcharge)}")
+
+    for name, limit in OPTIONAL.items():
+        fields[name] = _text(row.get(name))
+        if limit and fields[name] and len(fields[name]) > limit:
+            errors.append(f"{name} is longer than {limit} characters")
+    return fields, errors
+
+
+def prepare(cur, rows):
+    """Validate and price rows; returns (orders, report) with report entries for every row.
+
+    orders are the valid rows with distance_km and price_estimate filled in;
+    report entries are {"row", "ok", ...} dicts, errors listed for invalid rows.
+    """
+    tariffs = pricing.tariffs()
+    checked = [_check(row, tariffs) for row in rows]
+    errors = [errs for _, errs in checked]
+
+    # coordinate ranges, as arrays
+    coords = np.array([[f[name] if f else np.nan for name in COORDINATES] for f, _ in checked], dtype=float)
+    coords = coords.reshape(len(rows), len(COORDINATES))
+    lat_ok = (np.abs(coords[:, [0, 2]]) <= 90).all(axis=1)
+    lng_ok = (np.abs(coords[:, [1, 3]]) <= 180).all(axis=1)
+    for i in np.flatnonzero(~(lat_ok & lng_ok)):
+        if checked[i][0] is not None and not any("must be a number" in e for e in errors[i]):
+            errors[i].append("coordinates out of range")
+
+    # customers, in one query
+    customer_ids = list({f["customer_id"] for f, _ in checked if f and f["customer_id"] is not None})
+    cur.execute("SELECT user_id FROM app.users WHERE user_id = ANY(%s) AND role_id = %s AND is_active = TRUE;",
+                (customer_ids, role_id_by_name("customer")))
+    customers = {r["user_id"] for r in cur.fetchall()}
+    for i, (f, _) in enumerate(checked):
+        if f and f["customer_id"] is not None and f["customer_id"] not in customers:
+            errors[i].append("customer_id is not an active customer")
+
+    valid = [i for i in range(len(rows)) if not errors[i]]
+    orders = [checked[i][0] for i in valid]
+    if orders:
+        weather = [w or "clear" for w, _ in weather_service.get_weather_many(
+            [(o["pickup_lat"], o["pickup_lng"]) for o in orders])]
+        q = pricing.quote_many(coords[valid, 0], coords[valid, 1], coords[valid, 2], coords[valid, 3],
+                               service_type=[o["service_type"] for o in orders],
+                               package_size=[o["package_size"] for o in orders],
+                               weather=weather)
+        for k, order in enumerate(orders):
+            order["distance_km"] = float(q["distance_km"][k])
+            order["price_estimate"] = int(q["total"][k])
+
+    report = [{"row": i + 1, "ok": False, "errors": errors[i]} for i in range(len(rows))]
+    for i, order in zip(valid, orders):
+        report[i] = {"row": i + 1, "ok": True, "distance_km": order["distance_km"],
+                     "price_estimate": order["price_estimate"]}
+        order["_report"] = report[i]
+    return orders, report
+
+
+def insert(cur, merchant_id, orders):
+    """Insert prepared orders as PENDING orders of merchant_id; fills order_id into their report entries."""
+    if not orders:
+        return
+    cur.execute("""
+        SELECT nextval(pg_get_serial_sequence('app.orders', 'order_id')) AS id FROM generate_series(1, %s);
+    """, (len(orders),))
+    ids = [r["id"] for r in cur.fetchall()]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for order_id, order in zip(ids, orders):
+        order["order_id"] = order["_report"]["order_id"] = order_id
+        order["merchant_id"] = merchant_id
+        # None is written as an unquoted empty field, which COPY reads as NULL
+        writer.writerow([order[c] for c in COLUMNS] + ["PENDING"])
+    buf.seek(0)
+    cur.copy_expert(f"COPY app.orders ({', '.join(COLUMNS)}, status) FROM STDIN WITH (FORMAT csv);", buf)
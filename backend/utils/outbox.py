@@ -0,0 +1,222 @@
+"""
+Transactional outbox for user notifications.
+
+Handlers call enqueue() (through routes.notifications.push_notification) on
+their own cursor, so a notification intent commits or rolls back with the
+change it announces and costs one INSERT whatever the number of recipients.
+A background thread per worker process drains app.notification_outbox
+(migrations/019_notification_outbox.py) in batches of OUTBOX_BATCH_SIZE:
+claimed with FOR UPDATE SKIP LOCKED so workers never deliver the same row,
+handed to every sender (the in-app app.notifications insert, plus any
+registered with add_sender, e.g. push or email), then deleted in the same
+transaction.
+
+If a batch fails, its rows are retried one by one so a single bad row cannot
+hold the others back. Failing rows are retried with exponential backoff and
+kept as dead letters (dead_at set) after OUTBOX_MAX_ATTEMPTS. In-app
+delivery is exactly once; external senders may see a row again if a later
+step of its batch fails.
+"""
+import os
+import select
+import threading
+import time
+import psycopg2.extras
+from db import get_db_connection, get_dedicated_connection
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "5"))
+OUTBOX_RETRY_MAX_SECONDS = 3600
+CHANNEL = "notification_outbox"
+
+_start_lock = threading.Lock()
+_started_pid = None
+_stats = {"batches": 0, "delivered": 0, "failed": 0, "dead": 0, "last_batch": 0, "errors": 0}
+
+
+def enqueue(cur, rows):
+    """Queue [(user_id, title, body), ...] in the transaction of cur."""
+    if not rows:
+        return
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO app.notification_outbox (user_id, title, body) VALUES %s;
+    """, rows, page_size=1000)
+
+
+def _deliver_in_app(cur, rows):
+    psycopg2.extras.execute_values(cur, """
+        INSERT INTO app.notifications (user_id, title, body, is_read, created_at) VALUES %s;
+    """, [(r["user_id"], r["title"], r["body"], r["created_at"]) for r in rows],
+        template="(%s, %s, %s, false, %s)", page_size=1000)
+
+
+_senders = [_deliver_in_app]
+
+
+def add_sender(sender):
+    """Also deliver through sender(cur, rows); rows are outbox dicts, raising fails them."""
+    _senders.append(sender)
+
+
+def _send(cur, rows):
+    for sender in _senders:
+        sender(cur, rows)
+
+
+def _retry_delay(attempts):
+    return min(OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1), OUTBOX_RETRY_MAX_SECONDS)
+
+
+def drain_once():
+    """Deliver one batch of due intents; returns how many rows were claimed."""
+    conn = get_db_connection()
+    try:
+        conn.autocommit = False
+        cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cur.execute("""
+            SELECT id, user_id, title, body, created_at, attempts
+              FROM app.notification_outbox
+             WHERE dead_at IS NULL AND next_attempt_at <= NOW()
+             ORDER BY next_attempt_at, id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED;
+        """, (OUTBOX_BATCH_SIZE,))
+        rows = cur.fetchall()
+        if not rows:
+            conn.commit()
+            return 0
+
+        delivered, failed = rows, []
+        cur.execute("SAVEPOINT outbox_batch;")
+        try:
+            _send(cur, rows)
+        except Exception:
+            cur.execute("ROLLBACK TO SAVEPOINT outbox_batch;")
+            delivered = []
+            for row in rows:
+                cur.execute("SAVEPOINT outbox_row;")
+                try:
+                    _send(cur, [row])
+                    cur.execute("RELEASE SAVEPOINT outbox_row;")
+                    delivered.append(row)
+                except Exception as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT outbox_row;")
+                    failed.append(row)
+                    row["error"] = str(e)[:1000]
+
+        if delivered:
+            cur.execute("DELETE FROM app.notification_outbox WHERE id = ANY(%s);", ([r["id"] for r in delivered],))
+        if failed:
+            dead = 0
+            updates = []
+            for row in failed:
+                attempts = row["attempts"] + 1
+                is_dead = attempts >= OUTBOX_MAX_ATTEMPTS
+                dead += is_dead
+                updates.append((row["id"], attempts, _retry_delay(attempts), row["error"], is_dead))
+            psycopg2.extras.execute_values(cur, """
+                UPDATE app.notification_outbox o
+                   SET attempts = v.attempts,
+                       next_attempt_at = NOW() + make_interval(secs => v.delay),
+                       last_error = v.error,
+                       dead_at = CASE WHEN v.dead THEN NOW() END
+                  FROM (VALUES %s) AS v (id, attempts, delay, error, dead)
+                 WHERE o.id = v.id;
+            """, updates, template="(%s::bigint, %s::int, %s::float8, %s::text, %s::boolean)")
+            _stats["dead"] += dead
+            print(f"[Outbox] {len(failed)} notifications failed ({dead} dead), e.g. {failed[0]['error']}")
+        conn.commit()
+        cur.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    _stats["batches"] += 1
+    _stats["delivered"] += len(delivered)
+    _stats["failed"] += len(failed)
+    _stats["last_batch"] = len(rows)
+    return len(rows)
+
+
+def retry_dead(ids=None):
+    """Put dead letters (all, or the given ids) back in the queue; returns how many."""
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE app.notification_outbox
+               SET dead_at = NULL, attempts = 0, next_attempt_at = NOW(), last_error = NULL
+             WHERE dead_at IS NOT NULL AND (%s::bigint[] IS NULL OR id = ANY(%s::bigint[]));
+        """, (ids, ids))
+        count = cur.rowcount
+        cur.close()
+        conn.commit()
+        return count
+    finally:
+        conn.close()
+
+
+def backlog(cur):
+    """Queue depth (RealDictCursor): pending, due now, dead, oldest pending age in seconds."""
+    cur.execute("""
+        SELECT COUNT(*) FILTER (WHERE dead_at IS NULL) AS pending,
+               COUNT(*) FILTER (WHERE dead_at IS NULL AND next_attempt_at <= NOW()) AS due,
+               COUNT(*) FILTER (WHERE dead_at IS NOT NULL) AS dead,
+               EXTRACT(EPOCH FROM NOW() - MIN(created_at) FILTER (WHERE dead_at IS NULL))::float8 AS oldest_pending_s
+          FROM app.notification_outbox;
+    """)
+    return dict(cur.fetchone())
+
+
+def start():
+    """Start the outbox worker thread for this process (threads do not survive a fork)."""
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    threading.Thread(target=_run, name="notification-outbox", daemon=True).start()
+
+
+def _run():
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = get_dedicated_connection()
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL};")
+            backoff = 1
+            while True:
+                # a full batch means more may be waiting
+                while drain_once() >= OUTBOX_BATCH_SIZE:
+                    pass
+                # woken by new intents; the timeout picks up retries coming due
+                if select.select([conn], [], [], OUTBOX_POLL_SECONDS) != ([], [], []):
+                    conn.poll()
+                    conn.notifies.clear()
+        except Exception as e:
+            _stats["errors"] += 1
+            print(f"[Outbox] Worker error: {e}, retrying in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def init_app(app):
+    app.before_request(start)
+
+
+def stats():
+    return {"batch_size": OUTBOX_BATCH_SIZE, "max_attempts": OUTBOX_MAX_ATTEMPTS, **_stats}
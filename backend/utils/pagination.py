@@ -0,0 +1,69 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Lists are ordered newest first by (created_at, id) and a page continues
+strictly after the last row of the previous one:
+
+    WHERE (created_at, id) < (%s, %s) ORDER BY created_at DESC, id DESC LIMIT n + 1
+
+so every page costs one index range scan regardless of how deep it is. The
+cursor handed to clients is an opaque urlsafe-base64 string of that key.
+"""
+import base64
+import datetime
+import json
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def encode_cursor(created_at, row_id) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """(created_at, id) from a cursor; raises PaginationError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except Exception:
+        raise PaginationError("Invalid cursor")
+
+
+def page_size(args, default=50, maximum=200) -> int:
+    try:
+        limit = int(args.get("limit", default))
+    except (TypeError, ValueError):
+        raise PaginationError("limit must be an integer")
+    if limit < 1:
+        raise PaginationError("limit must be positive")
+    return min(limit, maximum)
+
+
+def select_fields(args, allowed: dict, default, required=()):
+    """
+    SQL select list for the comma separated ?fields= parameter.
+    allowed maps field name -> SQL expression; required fields are always
+    included (the cursor needs them).
+    """
+    raw = args.get("fields")
+    names = [f.strip() for f in raw.split(",") if f.strip()] if raw else list(default)
+    unknown = [f for f in names if f not in allowed]
+    if unknown:
+        raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+    for name in required:
+        if name not in names:
+            names.append(name)
+    return ", ".join(f"{allowed[name]} AS {name}" for name in dict.fromkeys(names))
+
+
+def page(rows, limit, key=("created_at", "id")):
+    """(rows, next_cursor) from a query that fetched limit + 1 rows."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last[key[0]], last[key[1]])
@@ -0,0 +1,146 @@
+"""
+Delivery pricing engine.
+
+Tariffs are loaded once per process, from DEFAULT_TARIFFS or from the JSON file
+named by PRICING_TARIFFS_FILE (same shape, keys may be partial), and compiled
+into lookup arrays. quote() prices one order and returns the total together
+with the breakdown shown to the customer, so the two can never disagree.
+quote_many() prices whole batches of pickup/drop pairs in one vectorized call.
+
+    total = base_fare[service] + distance_km * km_rate[service]
+            + package_surcharge[size] + weather_surcharge[condition]
+"""
+import json
+import os
+import threading
+import numpy as np
+
+PRICING_TARIFFS_FILE = os.getenv("PRICING_TARIFFS_FILE")
+EARTH_RADIUS_KM = 6371
+
+DEFAULT_TARIFFS = {
+    # Base fare by service type
+    "base_fare": {"bike": 10000, "car": 20000, "truck": 50000},
+    # Rate per km by service type
+    "km_rate": {"bike": 5000, "car": 8000, "truck": 15000},
+    # Package size surcharge
+    "package_surcharge": {"small": 0, "medium": 5000, "large": 10000},
+    # Weather surcharge by main condition, anything else is free
+    "weather_surcharge": {"rain": 5000, "drizzle": 5000, "thunderstorm": 10000, "snow": 8000},
+    "default_service": "bike",
+}
+
+
+class Tariffs:
+    """Tariff tables compiled for scalar and array lookups."""
+
+    def __init__(self, tables):
+        self.base_fare = dict(tables["base_fare"])
+        self.km_rate = dict(tables["km_rate"])
+        self.package_surcharge = dict(tables["package_surcharge"])
+        self.weather_surcharge = dict(tables["weather_surcharge"])
+        self.default_service = tables.get("default_service", "bike")
+        if self.default_service not in self.base_fare or set(self.base_fare) != set(self.km_rate):
+            raise ValueError("base_fare and km_rate must price the same services, including the default")
+
+        # unknown service types are priced as the default service, unknown sizes are free
+        self.services = list(self.base_fare)
+        self.service_index = {name: i for i, name in enumerate(self.services)}
+        self.default_service_index = self.service_index[self.default_service]
+        self.base_fare_arr = np.array([self.base_fare[s] for s in self.services], dtype=float)
+        self.km_rate_arr = np.array([self.km_rate[s] for s in self.services], dtype=float)
+        self.sizes = list(self.package_surcharge) + [None]
+        self.size_index = {name: i for i, name in enumerate(self.sizes)}
+        self.package_arr = np.array([self.package_surcharge.get(s, 0) for s in self.sizes], dtype=float)
+
+    def service(self, service_type):
+        return service_type if service_type in self.base_fare else self.default_service
+
+
+_tariffs = None
+_lock = threading.Lock()
+
+
+def load(path=PRICING_TARIFFS_FILE):
+    """(Re)load the tariff tables."""
+    global _tariffs
+    tables = {**DEFAULT_TARIFFS}
+    if path:
+        with open(path, encoding="utf-8") as f:
+            tables.update(json.load(f))
+    with _lock:
+        _tariffs = Tariffs(tables)
+    return _tariffs
+
+
+def tariffs():
+    return _tariffs or load()
+
+
+def quote(distance_km, weather, service_type="bike", package_size="small"):
+    """(total, breakdown) for one order."""
+    t = tariffs()
+    service = t.service(service_type)
+    base_fare = t.base_fare[service]
+    distance_cost = distance_km * t.km_rate[service]
+    package_surcharge = t.package_surcharge.get(package_size, 0)
+    weather_surcharge = t.weather_surcharge.get(weather, 0)
+    total = round(base_fare + distance_cost + weather_surcharge + package_surcharge)
+    return total, {
+        "base_fare": base_fare,
+        "distance_cost": distance_cost,
+        "package_surcharge": package_surcharge,
+        "weather_surcharge": weather_surcharge,
+        "total": total,
+    }
+
+
+def haversine_many(lat1, lng1, lat2, lng2):
+    """Great-circle distances (km) between arrays of points."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(np.asarray(lng2, dtype=float) - np.asarray(lng1, dtype=float))
+    a = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def _per_item(values, n):
+    if isinstance(values, (str, type(None))):
+        return [values] * n
+    return list(values)
+
+
+def quote_many(pickup_lat, pickup_lng, delivery_lat, delivery_lng,
+               service_type="bike", package_size="small", weather=None):
+    """
+    Price n orders at once. Coordinates are sequences of length n; service_type,
+    package_size and weather are either one value for all orders or sequences.
+    Returns a dict of numpy arrays: distance_km, base_fare, distance_cost,
+    package_surcharge, weather_surcharge and total.
+    """
+    t = tariffs()
+    pickup_lat = np.asarray(pickup_lat, dtype=float)
+    n = len(pickup_lat)
+    # same rounding as create_order, so a quote matches the order it becomes
+    distance_km = np.round(haversine_many(pickup_lat, pickup_lng, delivery_lat, delivery_lng), 2)
+
+    service_idx = np.fromiter((t.service_index.get(s, t.default_service_index) for s in _per_item(service_type, n)),
+                              dtype=np.intp, count=n)
+    none_idx = t.size_index[None]
+    size_idx = np.fromiter((t.size_index.get(s, none_idx) for s in _per_item(package_size, n)),
+                           dtype=np.intp, count=n)
+    weather_surcharge = np.fromiter((t.weather_surcharge.get(w, 0) for w in _per_item(weather, n)),
+                                    dtype=float, count=n)
+
+    base_fare = t.base_fare_arr[service_idx]
+    distance_cost = distance_km * t.km_rate_arr[service_idx]
+    package_surcharge = t.package_arr[size_idx]
+    total = np.round(base_fare + distance_cost + weather_surcharge + package_surcharge)
+    return {
+        "distance_km": distance_km,
+        "base_fare": base_fare,
+        "distance_cost": distance_cost,
+        "package_surcharge": package_surcharge,
+        "weather_surcharge": weather_surcharge,
+        "total": total,
+    }
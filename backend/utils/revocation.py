@@ -0,0 +1,177 @@
+"""
+In-memory set of revoked API tokens.
+
+Every worker keeps sha256(token) -> expiry for tokens revoked in app.api_tokens,
+so protected routes can reject logged-out tokens without a database query.
+The set is loaded once per process and then kept current by a background
+thread that LISTENs on 'tokens_revoked' (migrations/012_token_revocation.py)
+and falls back to a delta poll on revoked_at every REVOCATION_POLL_SECONDS.
+The same thread periodically deletes expired rows from app.api_tokens and
+prunes expired entries from memory.
+"""
+import hashlib
+import os
+import select
+import threading
+import time
+from db import get_db_connection, get_dedicated_connection
+
+REVOCATION_POLL_SECONDS = float(os.getenv("REVOCATION_POLL_SECONDS", "5"))
+REVOCATION_SWEEP_SECONDS = float(os.getenv("REVOCATION_SWEEP_SECONDS", "3600"))
+SWEEP_BATCH_SIZE = 5000
+# re-read revocations this far behind the watermark, to catch transactions
+# that stamped revoked_at before a newer one but committed after it
+WATERMARK_OVERLAP_SECONDS = 60
+CHANNEL = "tokens_revoked"
+SWEEP_LOCK_ID = 812001   # pg advisory lock so only one worker sweeps at a time
+
+_lock = threading.Lock()
+_start_lock = threading.Lock()
+_revoked = {}            # token key -> expires_at (epoch seconds)
+_watermark = None        # latest revoked_at seen (database clock)
+_started_pid = None
+_stats = {"loads": 0, "polls": 0, "notifications": 0, "swept_rows": 0, "pruned": 0}
+
+
+def token_key(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+def is_revoked(key: bytes) -> bool:
+    if _started_pid != os.getpid():
+        start()
+    return key in _revoked
+
+
+def revoke(token: str, expires_at: float):
+    """Record a revocation made by this process right away (the poll picks up other workers')."""
+    with _lock:
+        _revoked[token_key(token)] = expires_at
+
+
+def _apply(rows):
+    global _watermark
+    with _lock:
+        for token, expires_at, revoked_at in rows:
+            _revoked[token_key(token)] = expires_at
+            if revoked_at is not None and (_watermark is None or revoked_at > _watermark):
+                _watermark = revoked_at
+
+
+def _apply_watermark(value):
+    global _watermark
+    with _lock:
+        if _watermark is None or value > _watermark:
+            _watermark = value
+
+
+def _load(cur):
+    cur.execute("""
+        SELECT token, EXTRACT(EPOCH FROM expires_at)::float8, revoked_at
+          FROM app.api_tokens
+         WHERE revoked = TRUE AND expires_at > NOW() AT TIME ZONE 'UTC';
+    """)
+    _apply(cur.fetchall())
+    if _watermark is None:
+        cur.execute("SELECT NOW();")
+        _apply_watermark(cur.fetchone()[0])
+    _stats["loads"] += 1
+
+
+def _poll(cur):
+    cur.execute("""
+        SELECT token, EXTRACT(EPOCH FROM expires_at)::float8, revoked_at
+          FROM app.api_tokens
+         WHERE revoked = TRUE AND revoked_at >= %s - %s * INTERVAL '1 second';
+    """, (_watermark, WATERMARK_OVERLAP_SECONDS))
+    _apply(cur.fetchall())
+    _stats["polls"] += 1
+
+
+def _prune():
+    now = time.time()
+    with _lock:
+        expired = [key for key, expires_at in _revoked.items() if expires_at <= now]
+        for key in expired:
+            del _revoked[key]
+    _stats["pruned"] += len(expired)
+
+
+def _sweep(cur):
+    """Delete expired tokens in batches; skipped if another worker holds the sweep lock."""
+    cur.execute("SELECT pg_try_advisory_lock(%s);", (SWEEP_LOCK_ID,))
+    if not cur.fetchone()[0]:
+        return
+    try:
+        while True:
+            cur.execute("""
+                DELETE FROM app.api_tokens
+                 WHERE token_id IN (
+                     SELECT token_id FROM app.api_tokens
+                      WHERE expires_at < NOW() AT TIME ZONE 'UTC'
+                      LIMIT %s
+                 );
+            """, (SWEEP_BATCH_SIZE,))
+            _stats["swept_rows"] += cur.rowcount
+            if cur.rowcount < SWEEP_BATCH_SIZE:
+                break
+    finally:
+        cur.execute("SELECT pg_advisory_unlock(%s);", (SWEEP_LOCK_ID,))
+
+
+def start():
+    """Load the revoked set for this process and start the refresh thread (once per pid)."""
+    global _started_pid, _watermark
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        with _lock:
+            _revoked.clear()
+            _watermark = None
+        # initial load happens before any request is answered from the set
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            _load(cur)
+            cur.close()
+        finally:
+            conn.close()
+        _started_pid = os.getpid()
+    threading.Thread(target=_run, name="token-revocation", daemon=True).start()
+
+
+def _run():
+    backoff = 1
+    next_sweep = time.monotonic() + 60
+    while True:
+        conn = None
+        try:
+            conn = get_dedicated_connection()
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL};")
+            backoff = 1
+            while True:
+                if select.select([conn], [], [], REVOCATION_POLL_SECONDS) != ([], [], []):
+                    conn.poll()
+                    if conn.notifies:
+                        _stats["notifications"] += len(conn.notifies)
+                        conn.notifies.clear()
+                _poll(cur)
+                if time.monotonic() >= next_sweep:
+                    _sweep(cur)
+                    _prune()
+                    next_sweep = time.monotonic() + REVOCATION_SWEEP_SECONDS
+        except Exception as e:
+            print(f"[Revocation] Refresh error: {e}, retrying in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def stats():
+    return {"revoked_in_memory": len(_revoked), "watermark": _watermark, **_stats}
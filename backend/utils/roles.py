@@ -0,0 +1,115 @@
+"""
+In-process role catalog.
+
+app.roles has a handful of rows that practically never change, so each worker
+loads it once and answers role lookups from memory. The cache expires after
+ROLES_CACHE_TTL seconds and is dropped as soon as a 'roles_changed'
+notification arrives (trigger added by migrations/011_notify_roles_changed.py).
+"""
+import os
+import select
+import threading
+import time
+from db import get_db_connection, get_dedicated_connection
+
+ROLES_CACHE_TTL = float(os.getenv("ROLES_CACHE_TTL", "300"))
+ROLES_LISTEN = os.getenv("ROLES_LISTEN", "1") == "1"
+CHANNEL = "roles_changed"
+
+_lock = threading.Lock()
+_by_id = {}
+_by_name = {}
+_loaded_at = None        # monotonic time of the last load, None = stale
+_listener_pid = None
+
+
+def load():
+    """(Re)load the catalog from app.roles."""
+    global _by_id, _by_name, _loaded_at
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT role_id, role_name FROM app.roles;")
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        conn.close()
+    with _lock:
+        _by_id = {role_id: name for role_id, name in rows}
+        _by_name = {name: role_id for role_id, name in rows}
+        _loaded_at = time.monotonic()
+
+
+def invalidate():
+    """Force the next lookup to reload app.roles."""
+    global _loaded_at
+    _loaded_at = None
+
+
+def _ensure_loaded():
+    if ROLES_LISTEN and _listener_pid != os.getpid():
+        _start_listener()
+    loaded_at = _loaded_at
+    if loaded_at is None or time.monotonic() - loaded_at > ROLES_CACHE_TTL:
+        load()
+
+
+def role_name(role_id: int):
+    _ensure_loaded()
+    return _by_id.get(role_id)
+
+
+def role_id_by_name(name: str):
+    _ensure_loaded()
+    return _by_name.get(name)
+
+
+def is_admin(session):
+    return role_name(session["role_id"]) == "admin"
+
+
+def all_roles():
+    _ensure_loaded()
+    return [{"role_id": role_id, "role_name": name} for role_id, name in sorted(_by_id.items())]
+
+
+# ---- LISTEN/NOTIFY invalidation ----
+def _start_listener():
+    # one thread per process; threads do not survive a gunicorn fork, hence the pid check
+    global _listener_pid
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener_pid = os.getpid()
+    threading.Thread(target=_listen, name="roles-listener", daemon=True).start()
+
+
+def _listen():
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = get_dedicated_connection()
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL};")
+            cur.close()
+            # anything may have changed while we were not listening
+            invalidate()
+            backoff = 1
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    conn.notifies.clear()
+                    invalidate()
+        except Exception as e:
+            print(f"[Roles] Listener error: {e}, retrying in {backoff}s")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
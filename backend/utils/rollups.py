@@ -0,0 +1,261 @@
+"""
+Time-bucketed order rollups for the admin and merchant analytics dashboards.
+
+app.order_rollups_hourly and app.order_rollups_daily (migrations/
+023_analytics_rollups.py) hold orders, completed/canceled counts, revenue
+(successful payments) and the sums behind average distance and price per
+created_at bucket, merchant_id, service_type and package_size. The dashboards
+read only these tables, never app.orders or app.payments.
+
+refresh() is incremental: it recomputes the hourly buckets from the
+watermark minus ROLLUP_LOOKBACK_HOURS up to now with one indexed range scan
+of app.orders, replaces them, and rebuilds the days those hours fall in from
+the hourly rows. The lookback picks up status changes and payments on
+recently created orders; anything older is only seen by refresh(full=True).
+Large ranges (the first run) are processed ROLLUP_CHUNK_HOURS at a time,
+each chunk in its own transaction that also advances the watermark. Buckets
+follow the database clock, like created_at.
+"""
+import datetime
+import os
+import threading
+import time
+from db import get_db_connection
+
+ROLLUP_REFRESH_SECONDS = float(os.getenv("ROLLUP_REFRESH_SECONDS", "300"))   # 0: on demand only
+ROLLUP_LOOKBACK_HOURS = int(os.getenv("ROLLUP_LOOKBACK_HOURS", "48"))
+ROLLUP_CHUNK_HOURS = int(os.getenv("ROLLUP_CHUNK_HOURS", "168"))
+ROLLUP_LOCK_ID = 812005   # pg advisory lock so only one worker refreshes at a time
+WATERMARK = "orders"
+
+GRANULARITIES = {"hour": "order_rollups_hourly", "day": "order_rollups_daily"}
+# dimension -> how a missing value is stored in the rollups
+DIMENSIONS = {"merchant_id": "0", "service_type": "''", "package_size": "''"}
+MAX_RANGE = {"hour": datetime.timedelta(days=31), "day": datetime.timedelta(days=731)}
+DEFAULT_RANGE = {"hour": datetime.timedelta(hours=24), "day": datetime.timedelta(days=30)}
+
+_start_lock = threading.Lock()
+_started_pid = None
+_stats = {"refreshes": 0, "skipped": 0, "chunks": 0, "errors": 0, "last_refresh": None, "last_ms": None}
+
+
+def _refresh_hours(cur, start, end):
+    cur.execute("DELETE FROM app.order_rollups_hourly WHERE bucket >= %s AND bucket < %s;", (start, end))
+    cur.execute("""
+        INSERT INTO app.order_rollups_hourly
+               (bucket, merchant_id, service_type, package_size, orders, completed, canceled,
+                revenue, distance_sum, distance_n, price_sum, price_n)
+        SELECT date_trunc('hour', o.created_at),
+               COALESCE(o.merchant_id, 0), COALESCE(o.service_type, ''), COALESCE(o.package_size, ''),
+               COUNT(*),
+               COUNT(*) FILTER (WHERE o.status = 'COMPLETED'),
+               COUNT(*) FILTER (WHERE o.status = 'CANCELED'),
+               COALESCE(SUM(p.amount), 0),
+               COALESCE(SUM(o.distance_km), 0), COUNT(o.distance_km),
+               COALESCE(SUM(o.price_estimate), 0), COUNT(o.price_estimate)
+          FROM app.orders o
+          LEFT JOIN LATERAL (
+                SELECT SUM(amount) AS amount FROM app.payments
+                 WHERE order_id = o.order_id AND status = 'SUCCESS'
+          ) p ON TRUE
+         WHERE o.created_at >= %s AND o.created_at < %s
+         GROUP BY 1, 2, 3, 4;
+    """, (start, end))
+
+
+def _refresh_days(cur, start, end):
+    # whole days, summed from the hourly rows (earlier hours of the first day are already there)
+    first, last = start.date(), (end - datetime.timedelta(microseconds=1)).date() + datetime.timedelta(days=1)
+    cur.execute("DELETE FROM app.order_rollups_daily WHERE bucket >= %s AND bucket < %s;", (first, last))
+    cur.execute("""
+        INSERT INTO app.order_rollups_daily
+               (bucket, merchant_id, service_type, package_size, orders, completed, canceled,
+                revenue, distance_sum, distance_n, price_sum, price_n)
+        SELECT bucket::date, merchant_id, service_type, package_size,
+               SUM(orders), SUM(completed), SUM(canceled), SUM(revenue),
+               SUM(distance_sum), SUM(distance_n), SUM(price_sum), SUM(price_n)
+          FROM app.order_rollups_hourly
+         WHERE bucket >= %s AND bucket < %s
+         GROUP BY 1, 2, 3, 4;
+    """, (first, last))
+
+
+def refresh(full=False):
+    """Bring the rollups up to now; returns {"from", "to", "chunks"} or {"skipped": True}."""
+    started = time.perf_counter()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    # session lock: held across the chunk transactions
+    cur.execute("SELECT pg_try_advisory_lock(%s);", (ROLLUP_LOCK_ID,))
+    if not cur.fetchone()[0]:
+        cur.close()
+        conn.close()
+        _stats["skipped"] += 1
+        return {"skipped": True}
+    try:
+        conn.autocommit = False
+        cur.execute("""
+            SELECT LOCALTIMESTAMP,
+                   (SELECT watermark FROM app.rollup_watermarks WHERE name = %s),
+                   (SELECT MIN(created_at) FROM app.orders);
+        """, (WATERMARK,))
+        now, watermark, oldest = cur.fetchone()
+        if watermark is not None and not full:
+            start = watermark - datetime.timedelta(hours=ROLLUP_LOOKBACK_HOURS)
+        else:
+            start = oldest or now
+        start = start.replace(minute=0, second=0, microsecond=0)
+        conn.commit()
+
+        # the current hour is partial: it is rebuilt next time, being within the lookback
+        chunks = 0
+        chunk_start = start
+        while chunk_start <= now:
+            chunk_end = min(chunk_start + datetime.timedelta(hours=ROLLUP_CHUNK_HOURS),
+                            now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1))
+            _refresh_hours(cur, chunk_start, chunk_end)
+            _refresh_days(cur, chunk_start, chunk_end)
+            cur.execute("""
+                INSERT INTO app.rollup_watermarks (name, watermark, refreshed_at) VALUES (%s, %s, NOW())
+                ON CONFLICT (name) DO UPDATE SET watermark = EXCLUDED.watermark, refreshed_at = NOW();
+            """, (WATERMARK, min(chunk_end, now)))
+            conn.commit()
+            chunks += 1
+            chunk_start = chunk_end
+    except Exception:
+        conn.rollback()
+        _stats["errors"] += 1
+        raise
+    finally:
+        conn.autocommit = True
+        cur.execute("SELECT pg_advisory_unlock(%s);", (ROLLUP_LOCK_ID,))
+        cur.close()
+        conn.close()
+
+    _stats["refreshes"] += 1
+    _stats["chunks"] += chunks
+    _stats["last_refresh"] = time.time()
+    _stats["last_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return {"skipped": False, "from": start.isoformat(), "to": now.isoformat(), "chunks": chunks}
+
+
+def _parse_time(value):
+    """Naive UTC datetime from an ISO 8601 date or datetime, or None."""
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_query(args):
+    """Read granularity, from, to and group_by from request args; returns (query, error)."""
+    granularity = args.get("granularity", "day")
+    if granularity not in GRANULARITIES:
+        return None, "granularity must be hour or day"
+
+    group_by = [d for d in args.get("group_by", "").split(",") if d]
+    if any(d not in DIMENSIONS for d in group_by):
+        return None, f"group_by must be a comma separated list of {', '.join(DIMENSIONS)}"
+
+    end = start = None
+    if args.get("to"):
+        end = _parse_time(args["to"])
+        if end is None:
+            return None, "to must be an ISO 8601 date or datetime"
+    if args.get("from"):
+        start = _parse_time(args["from"])
+        if start is None:
+            return None, "from must be an ISO 8601 date or datetime"
+    if end is None:
+        end = datetime.datetime.utcnow()
+    if start is None:
+        start = end - DEFAULT_RANGE[granularity]
+    if start >= end:
+        return None, "from must be before to"
+    if end - start > MAX_RANGE[granularity]:
+        return None, f"range too long for granularity={granularity} (max {MAX_RANGE[granularity].days} days)"
+
+    return {"granularity": granularity, "start": start, "end": end, "group_by": list(dict.fromkeys(group_by))}, None
+
+
+def series(cur, granularity, start, end, group_by=(), merchant_id=None):
+    """Rollup rows per bucket (and group_by dimensions) in [start, end), oldest first (RealDictCursor)."""
+    table = GRANULARITIES[granularity]
+    if granularity == "day":
+        # days the range touches
+        start, end = start.date(), (end - datetime.timedelta(microseconds=1)).date() + datetime.timedelta(days=1)
+    dims = "".join(f", NULLIF({d}, {DIMENSIONS[d]}) AS {d}" for d in group_by)
+    where = "bucket >= %s AND bucket < %s"
+    params = [start, end]
+    if merchant_id is not None:
+        where += " AND merchant_id = %s"
+        params.append(merchant_id)
+    group = "".join(f", {d}" for d in group_by)
+    cur.execute(f"""
+        SELECT bucket{dims},
+               SUM(orders)::int AS orders,
+               SUM(completed)::int AS completed,
+               SUM(canceled)::int AS canceled,
+               ROUND(SUM(completed)::numeric / NULLIF(SUM(orders), 0), 4) AS completion_rate,
+               SUM(revenue) AS revenue,
+               ROUND(SUM(distance_sum) / NULLIF(SUM(distance_n), 0), 2) AS avg_distance_km,
+               ROUND(SUM(price_sum) / NULLIF(SUM(price_n), 0), 2) AS avg_price
+          FROM app.{table}
+         WHERE {where}
+         GROUP BY bucket{group}
+         ORDER BY bucket{group};
+    """, params)
+    return cur.fetchall()
+
+
+def watermark(cur):
+    """Time the rollups were last refreshed up to (RealDictCursor), or None."""
+    cur.execute("SELECT watermark FROM app.rollup_watermarks WHERE name = %s;", (WATERMARK,))
+    row = cur.fetchone()
+    return row["watermark"] if row else None
+
+
+def analytics(cur, query, merchant_id=None):
+    """Body of GET /admin/analytics and /merchant/analytics for a parse_query() result."""
+    rows = series(cur, query["granularity"], query["start"], query["end"], query["group_by"], merchant_id)
+    return {
+        "granularity": query["granularity"],
+        "from": query["start"],
+        "to": query["end"],
+        "group_by": query["group_by"],
+        "refreshed_through": watermark(cur),
+        "series": rows,
+    }
+
+
+def start():
+    """Start the refresh thread for this process when ROLLUP_REFRESH_SECONDS is set."""
+    global _started_pid
+    if ROLLUP_REFRESH_SECONDS <= 0 or _started_pid == os.getpid():
+        return
+    with _start_lock:
+        # threads do not survive a gunicorn fork, hence the pid check
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    threading.Thread(target=_run, name="analytics-rollups", daemon=True).start()
+
+
+def _run():
+    while True:
+        try:
+            refresh()
+        except Exception as e:
+            print(f"[Rollups] Refresh failed: {e}")
+        time.sleep(ROLLUP_REFRESH_SECONDS)
+
+
+def init_app(app):
+    app.before_request(start)
+
+
+def stats():
+    return {"refresh_interval": ROLLUP_REFRESH_SECONDS, "lookback_hours": ROLLUP_LOOKBACK_HOURS, **_stats}
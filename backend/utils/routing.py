@@ -0,0 +1,188 @@
+"""
+Stop sequencing for multi-order deliveries.
+
+Every order contributes a pickup and a drop stop; a route visits all stops
+once, never dropping an order before picking it up. The route is built
+nearest-neighbour first (from the shipper's position when known, otherwise
+from the best pickup), then improved with 2-opt segment reversals and or-opt
+moves of 1-3 consecutive stops until no move helps or ROUTE_TIME_BUDGET runs
+out. Distances come from one haversine matrix computed with NumPy.
+
+Routes are open paths: they end at the last drop.
+"""
+import os
+import time
+import numpy as np
+from utils.pricing import haversine_many
+
+ROUTE_TIME_BUDGET = float(os.getenv("ROUTE_TIME_BUDGET", "0.04"))   # seconds
+EPS = 1e-9
+
+
+def distance_matrix(lats, lngs):
+    """Pairwise great-circle distances (km) as an n x n array."""
+    lats = np.asarray(lats, dtype=float)
+    lngs = np.asarray(lngs, dtype=float)
+    return haversine_many(lats[:, None], lngs[:, None], lats[None, :], lngs[None, :])
+
+
+class _Problem:
+    # node 2i is the pickup of order i, node 2i + 1 its drop, node 2n the start (if any)
+
+    def __init__(self, orders, start=None):
+        self.orders = orders
+        n = len(orders)
+        lats = [c for o in orders for c in (o["pickup_lat"], o["delivery_lat"])]
+        lngs = [c for o in orders for c in (o["pickup_lng"], o["delivery_lng"])]
+        if start is not None:
+            lats.append(start[0])
+            lngs.append(start[1])
+        self.start = 2 * n if start is not None else None
+        self.lats, self.lngs = lats, lngs
+        # plain lists: scalar indexing is much faster than on an ndarray
+        self.D = distance_matrix(lats, lngs).tolist()
+        self.size = 2 * n
+
+    def d(self, u, v):
+        if u is None or v is None:
+            return 0.0
+        return self.D[u][v]
+
+    def cost(self, route):
+        total = self.d(self.start, route[0]) if route else 0.0
+        D = self.D
+        for a, b in zip(route, route[1:]):
+            total += D[a][b]
+        return total
+
+    @staticmethod
+    def feasible(route):
+        seen = set()
+        for node in route:
+            if node % 2 and node - 1 not in seen:
+                return False
+            seen.add(node)
+        return True
+
+
+def _nearest_neighbour(p, first=None):
+    route = []
+    visited = set()
+    current = p.start
+    if first is not None:
+        route.append(first)
+        visited.add(first)
+        current = first
+    D = p.D
+    while len(route) < p.size:
+        best, best_d = None, None
+        for node in range(p.size):
+            if node in visited or (node % 2 and node - 1 not in visited):
+                continue
+            dist = D[current][node] if current is not None else 0.0
+            if best is None or dist < best_d:
+                best, best_d = node, dist
+        route.append(best)
+        visited.add(best)
+        current = best
+    return route
+
+
+def _two_opt(p, route, deadline):
+    """One pass of improving segment reversals; True if the route changed."""
+    n = len(route)
+    d = p.d
+    improved = False
+    for i in range(n - 1):
+        prev = route[i - 1] if i > 0 else p.start
+        for j in range(i + 1, n):
+            nxt = route[j + 1] if j + 1 < n else None
+            delta = d(prev, route[j]) + d(route[i], nxt) - d(prev, route[i]) - d(route[j], nxt)
+            if delta < -EPS:
+                # reversing puts a drop before its pickup if both are inside the segment
+                inside = set(route[i:j + 1])
+                if any(node % 2 and node - 1 in inside for node in inside):
+                    continue
+                route[i:j + 1] = route[i:j + 1][::-1]
+                improved = True
+        if time.perf_counter() > deadline:
+            break
+    return improved
+
+
+def _or_opt(p, route, deadline):
+    """Move segments of 1-3 stops elsewhere; True if the route changed."""
+    d = p.d
+    improved = False
+    for length in (1, 2, 3):
+        i = 0
+        while i + length <= len(route):
+            seg = route[i:i + length]
+            prev = route[i - 1] if i > 0 else p.start
+            nxt = route[i + length] if i + length < len(route) else None
+            gain = d(prev, seg[0]) + d(seg[-1], nxt) - d(prev, nxt)
+            rest = route[:i] + route[i + length:]
+            best_k, best_delta = None, -EPS
+            for k in range(len(rest) + 1):
+                if k == i:
+                    continue
+                x = rest[k - 1] if k > 0 else p.start
+                y = rest[k] if k < len(rest) else None
+                delta = d(x, seg[0]) + d(seg[-1], y) - d(x, y) - gain
+                if delta < best_delta and p.feasible(rest[:k] + seg + rest[k:]):
+                    best_k, best_delta = k, delta
+            if best_k is not None:
+                route[:] = rest[:best_k] + seg + rest[best_k:]
+                improved = True
+            i += 1
+            if time.perf_counter() > deadline:
+                return improved
+    return improved
+
+
+def plan_route(orders, start=None, time_budget=ROUTE_TIME_BUDGET):
+    """
+    orders: dicts with order_id, pickup_lat, pickup_lng, delivery_lat, delivery_lng.
+    start: optional (lat, lng) of the shipper.
+    Returns {"stops": [...], "total_km", "naive_km", "algorithm"} ready to store as JSON.
+    """
+    if not orders:
+        return {"stops": [], "total_km": 0.0, "naive_km": 0.0, "algorithm": "nn+2opt+oropt"}
+    started = time.perf_counter()
+    deadline = started + time_budget
+    p = _Problem(orders, start)
+
+    if p.start is not None:
+        route = _nearest_neighbour(p)
+    else:
+        # no known start: keep the best nearest-neighbour tour over all first pickups
+        route = min((_nearest_neighbour(p, first) for first in range(0, p.size, 2)), key=p.cost)
+    while time.perf_counter() < deadline:
+        changed = _two_opt(p, route, deadline)
+        changed = _or_opt(p, route, deadline) or changed
+        if not changed:
+            break
+
+    naive = [node for i in range(len(orders)) for node in (2 * i, 2 * i + 1)]
+    stops, cum, prev = [], 0.0, p.start
+    for seq, node in enumerate(route, start=1):
+        leg = p.d(prev, node)
+        cum += leg
+        order = orders[node // 2]
+        stops.append({
+            "seq": seq,
+            "order_id": order["order_id"],
+            "type": "drop" if node % 2 else "pickup",
+            "lat": p.lats[node],
+            "lng": p.lngs[node],
+            "leg_km": round(leg, 3),
+            "cum_km": round(cum, 3),
+        })
+        prev = node
+    return {
+        "stops": stops,
+        "total_km": round(p.cost(route), 3),
+        "naive_km": round(p.cost(naive), 3),
+        "algorithm": "nn+2opt+oropt",
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,126 @@
+"""
+Admin summary totals from maintained counters.
+
+Triggers keep app.stats_counters (migrations/022_stats_counters.py) in step
+with users, orders, deliveries and successful payments inside the writing
+transaction, so summary() reads a handful of rows however large the tables
+are. reconcile() recomputes the real aggregates and corrects any drift
+(TRUNCATE, rows changed with triggers disabled, ...): the aggregates and the
+counters are read in one REPEATABLE READ snapshot, and their difference is
+then added as a delta, so it takes no table locks and cannot race with writers.
+It runs every STATS_RECONCILE_SECONDS when set (one worker at a time) and
+from POST /admin/summary/reconcile.
+"""
+import os
+import threading
+import time
+import psycopg2.extras
+from db import get_db_connection
+
+STATS_RECONCILE_SECONDS = float(os.getenv("STATS_RECONCILE_SECONDS", "0"))   # 0: on demand only
+RECONCILE_LOCK_ID = 812004   # pg advisory lock so only one worker reconciles at a time
+
+# counter -> the aggregate it maintains
+COUNTERS = {
+    "users": "SELECT COUNT(*) FROM app.users",
+    "orders": "SELECT COUNT(*) FROM app.orders",
+    "deliveries": "SELECT COUNT(*) FROM app.deliveries",
+    "payments_success": "SELECT COUNT(*) FROM app.payments WHERE status = 'SUCCESS'",
+    "revenue": "SELECT COALESCE(SUM(amount), 0) FROM app.payments WHERE status = 'SUCCESS'",
+}
+
+_start_lock = threading.Lock()
+_started_pid = None
+_stats = {"reconciles": 0, "corrections": 0, "last_reconcile": None, "last_drift": None}
+
+
+def counters(cur):
+    """{counter: total} summed over shards (RealDictCursor); counters never bumped are 0."""
+    cur.execute("SELECT name, SUM(value) AS value FROM app.stats_counters GROUP BY name;")
+    totals = {name: 0 for name in COUNTERS}
+    for row in cur.fetchall():
+        totals[row["name"]] = row["value"]
+    return totals
+
+
+def summary(cur):
+    """GET /admin/summary body, same keys as the aggregates it replaces."""
+    c = counters(cur)
+    return {
+        "total_users": int(c["users"]),
+        "total_orders": int(c["orders"]),
+        "total_deliveries": int(c["deliveries"]),
+        "total_payments": int(c["payments_success"]),
+        "revenue": c["revenue"],
+    }
+
+
+def reconcile():
+    """Correct counter drift from full aggregates; returns {counter: drift} (empty if skipped)."""
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    # session lock: held across the snapshot and the correction
+    cur.execute("SELECT pg_try_advisory_lock(%s) AS locked;", (RECONCILE_LOCK_ID,))
+    if not cur.fetchone()["locked"]:
+        cur.close()
+        conn.close()
+        return {}
+    try:
+        conn.autocommit = False
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ;")
+        totals = counters(cur)
+        cur.execute("SELECT " + ", ".join(f"({sql}) AS {name}" for name, sql in COUNTERS.items()) + ";")
+        actual = cur.fetchone()
+        conn.commit()
+
+        # deltas commute with whatever writers did since the snapshot
+        drift = {name: actual[name] - totals[name] for name in COUNTERS if actual[name] != totals[name]}
+        for name, delta in drift.items():
+            cur.execute("SELECT app.bump_stat(%s, %s);", (name, delta))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+        cur.execute("SELECT pg_advisory_unlock(%s);", (RECONCILE_LOCK_ID,))
+        cur.close()
+        conn.close()
+
+    _stats["reconciles"] += 1
+    _stats["corrections"] += len(drift)
+    _stats["last_reconcile"] = time.time()
+    _stats["last_drift"] = {name: str(delta) for name, delta in drift.items()}
+    if drift:
+        print(f"[Stats] Corrected counter drift: {_stats['last_drift']}")
+    return drift
+
+
+def start():
+    """Start the reconcile thread for this process when STATS_RECONCILE_SECONDS is set."""
+    global _started_pid
+    if STATS_RECONCILE_SECONDS <= 0 or _started_pid == os.getpid():
+        return
+    with _start_lock:
+        # threads do not survive a gunicorn fork, hence the pid check
+        if _started_pid == os.getpid():
+            return
+        _started_pid = os.getpid()
+    threading.Thread(target=_run, name="stats-reconcile", daemon=True).start()
+
+
+def _run():
+    while True:
+        time.sleep(STATS_RECONCILE_SECONDS)
+        try:
+            reconcile()
+        except Exception as e:
+            print(f"[Stats] Reconcile failed: {e}")
+
+
+def init_app(app):
+    app.before_request(start)
+
+
+def stats():
+    return {"reconcile_interval": STATS_RECONCILE_SECONDS, **_stats}
@@ -0,0 +1,69 @@
+"""
+Streaming JSON responses for large result sets.
+
+stream_rows() runs a query on a server-side (named) cursor and yields the
+response body one row at a time, so a worker holds at most STREAM_ITERSIZE
+rows in memory however large the result is. The body has the same shape and
+encoding as jsonify({"ok": True, key: rows}): datetimes as HTTP dates,
+Decimals as strings, row keys sorted.
+
+The query runs on its own pooled connection, not the request transaction:
+the response body is produced after the request has finished and committed.
+"""
+import datetime
+import decimal
+import json
+import os
+import uuid
+from flask import Response
+from werkzeug.http import http_date
+from db import get_db_connection
+
+STREAM_ITERSIZE = int(os.getenv("STREAM_ITERSIZE", "2000"))
+
+
+def _default(value):
+    # same conversions as Flask's default JSON provider
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return http_date(value)
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+to_json = json.JSONEncoder(default=_default, separators=(",", ":"), sort_keys=True, ensure_ascii=True).encode
+
+
+def stream_rows(sql, params=None, key="rows", itersize=STREAM_ITERSIZE):
+    """Response streaming {"ok": true, key: [...]} for the rows of a query."""
+    conn = get_db_connection()
+    try:
+        conn.autocommit = False   # named cursors live inside a transaction
+        cur = conn.cursor(name="stream_rows")
+        cur.itersize = itersize
+        # run the query now so SQL errors still become a normal error response
+        cur.execute(sql, params)
+        first = cur.fetchmany(itersize)
+        columns = [col.name for col in cur.description]
+    except Exception:
+        conn.close()
+        raise
+
+    def generate():
+        try:
+            yield '{"ok":true,"%s":[' % key
+            sep = ""
+            batch = first
+            while batch:
+                chunk = []
+                for row in batch:
+                    chunk.append(sep + to_json(dict(zip(columns, row))))
+                    sep = ","
+                yield "".join(chunk)
+                batch = cur.fetchmany(itersize)
+            yield "]}\n"
+        finally:
+            cur.close()
+            conn.close()   # back to the pool, transaction rolled back
+
+    return Response(generate(), mimetype="application/json")
@@ -0,0 +1,181 @@
+"""
+Fan-out of new tracking events to Server-Sent Events subscribers.
+
+Inserts into app.tracking_events fire pg_notify('tracking_events', <row json>)
+(migrations/016_notify_tracking_events.py). Each worker process holds ONE
+dedicated LISTEN connection; its thread hands every event to the in-memory
+queues of the clients streaming that delivery, so an open stream costs no
+queries after its initial history read.
+
+A subscriber whose queue overflows (a client reading too slowly), or any
+subscriber when the listener connection drops, is marked lost: its stream
+ends and the client reconnects with Last-Event-ID to catch up from the table.
+"""
+import datetime
+import json
+import os
+import queue
+import select
+import threading
+import time
+from db import get_dedicated_connection
+
+TRACKING_STREAM_MAX_SUBSCRIBERS = int(os.getenv("TRACKING_STREAM_MAX_SUBSCRIBERS", "2000"))
+TRACKING_STREAM_QUEUE_SIZE = int(os.getenv("TRACKING_STREAM_QUEUE_SIZE", "500"))
+CHANNEL = "tracking_events"
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscriber:
+    def __init__(self, delivery_id):
+        self.delivery_id = delivery_id
+        self.queue = queue.Queue(maxsize=TRACKING_STREAM_QUEUE_SIZE)
+        self.lost = False
+
+
+_lock = threading.Lock()
+_start_lock = threading.Lock()
+_subscribers = {}        # delivery_id -> set of Subscriber
+_count = 0
+_started_pid = None
+_stats = {"notifications": 0, "delivered": 0, "overflows": 0, "rejected": 0, "reconnects": 0}
+
+
+def subscribe(delivery_id: int) -> Subscriber:
+    """Register for the delivery's new events; raises TooManySubscribers at the per-process limit."""
+    global _count
+    if _started_pid != os.getpid():
+        start()
+    sub = Subscriber(delivery_id)
+    with _lock:
+        if _count >= TRACKING_STREAM_MAX_SUBSCRIBERS:
+            _stats["rejected"] += 1
+            raise TooManySubscribers()
+        _subscribers.setdefault(delivery_id, set()).add(sub)
+        _count += 1
+    return sub
+
+
+def unsubscribe(sub: Subscriber):
+    global _count
+    with _lock:
+        subs = _subscribers.get(sub.delivery_id)
+        if subs and sub in subs:
+            subs.discard(sub)
+            _count -= 1
+            if not subs:
+                del _subscribers[sub.delivery_id]
+
+
+def _event(payload):
+    # same types as a row read with RealDictCursor
+    if payload.get("created_at"):
+        payload["created_at"] = datetime.datetime.fromisoformat(payload["created_at"])
+    return payload
+
+
+def _fetch(cur, ids):
+    cur.execute("""
+        SELECT id, delivery_id, event_type, status, description, lat, lng, created_at
+        FROM app.tracking_events WHERE id = ANY(%s);
+    """, (ids,))
+    columns = [col.name for col in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def _dispatch(cur, notifies):
+    _stats["notifications"] += len(notifies)
+    events, truncated = [], []
+    for n in notifies:
+        try:
+            payload = json.loads(n.payload)
+        except ValueError:
+            continue
+        if payload.get("delivery_id") not in _subscribers:
+            continue
+        if payload.get("truncated"):
+            truncated.append(payload["id"])
+        else:
+            events.append(_event(payload))
+    if truncated:
+        # rows too large for a NOTIFY payload are read back in one query
+        events.extend(_fetch(cur, truncated))
+        events.sort(key=lambda e: e["id"])
+
+    for event in events:
+        with _lock:
+            subs = list(_subscribers.get(event["delivery_id"], ()))
+        for sub in subs:
+            if sub.lost:
+                continue
+            try:
+                sub.queue.put_nowait(event)
+                _stats["delivered"] += 1
+            except queue.Full:
+                sub.lost = True
+                _stats["overflows"] += 1
+
+
+def _lose_all():
+    with _lock:
+        for subs in _subscribers.values():
+            for sub in subs:
+                sub.lost = True
+
+
+def start():
+    """Start the listener thread for this process (threads do not survive a fork)."""
+    global _started_pid, _count
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        with _lock:
+            _subscribers.clear()   # the parent's clients are not ours
+            _count = 0
+        _started_pid = os.getpid()
+    threading.Thread(target=_run, name="tracking-listener", daemon=True).start()
+
+
+def _run():
+    backoff = 1
+    first = True
+    while True:
+        conn = None
+        try:
+            conn = get_dedicated_connection()
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANNEL};")
+            if not first:
+                # events sent while we were not listening are gone: make clients resync
+                _stats["reconnects"] += 1
+                _lose_all()
+            first = False
+            backoff = 1
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    notifies = list(conn.notifies)
+                    conn.notifies.clear()
+                    _dispatch(cur, notifies)
+        except Exception as e:
+            print(f"[TrackingStream] Listener error: {e}, reconnecting in {backoff}s")
+            _lose_all()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+        finally:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+
+def stats():
+    with _lock:
+        deliveries = len(_subscribers)
+    return {"subscribers": _count, "deliveries": deliveries, **_stats}
@@ -0,0 +1,224 @@
+"""
+Cached weather lookups for order pricing.
+
+Conditions are cached per geohash cell (WEATHER_GEOHASH_PRECISION, 5 = ~5 km)
+for WEATHER_TTL seconds. Concurrent lookups for the same cell share a single
+in-flight fetch, callers wait at most WEATHER_TIMEOUT seconds, and once an
+entry is older than the TTL it is still served (up to WEATHER_STALE_MAX
+seconds) while one background fetch refreshes it. The cache keeps at most
+WEATHER_CACHE_SIZE cells and forgets cells past WEATHER_STALE_MAX, oldest
+fetch first. get_weather_many() starts at most WEATHER_MAX_FETCHES_PER_CALL
+fetches; further cells of that call get no condition (priced as clear).
+
+The provider is pluggable: set_provider() accepts anything with a
+fetch(lat, lng) -> condition method, and OPENWEATHER_BASE_URL points the
+default provider at a local stub server.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import requests
+from utils import geo
+
+WEATHER_TTL = float(os.getenv("WEATHER_TTL", "600"))
+WEATHER_STALE_MAX = float(os.getenv("WEATHER_STALE_MAX", "3600"))
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "2"))
+WEATHER_ERROR_TTL = float(os.getenv("WEATHER_ERROR_TTL", "30"))   # don't retry a failing cell sooner
+WEATHER_GEOHASH_PRECISION = int(os.getenv("WEATHER_GEOHASH_PRECISION", "5"))
+WEATHER_FETCH_WORKERS = int(os.getenv("WEATHER_FETCH_WORKERS", "4"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "10000"))
+WEATHER_MAX_FETCHES_PER_CALL = int(os.getenv("WEATHER_MAX_FETCHES_PER_CALL", "10"))
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org/data/2.5")
+
+
+class WeatherError(Exception):
+    pass
+
+
+class WeatherProvider:
+    """Interface: return the main condition ('clear', 'rain', ...) at a point."""
+
+    def fetch(self, lat: float, lng: float) -> str:
+        raise NotImplementedError
+
+
+class OpenWeatherProvider(WeatherProvider):
+    def __init__(self, api_key, base_url=OPENWEATHER_BASE_URL, timeout=WEATHER_TIMEOUT):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def fetch(self, lat, lng):
+        res = requests.get(
+            f"{self.base_url}/weather",
+            params={"lat": lat, "lon": lng, "appid": self.api_key, "units": "metric"},
+            timeout=self.timeout,
+        )
+        data = res.json()
+        if res.status_code != 200:
+            raise WeatherError(data.get("message", "Weather API error"))
+        return data["weather"][0]["main"].lower()
+
+
+_provider = None
+_lock = threading.Lock()
+_cache = OrderedDict()    # cell -> (condition, fetched_at monotonic), oldest fetch first
+_failed = OrderedDict()   # cell -> (error message, failed_at monotonic), oldest failure first
+_inflight = {}     # cell -> Future
+_executor = None
+_executor_lock = threading.Lock()
+_stats = {"hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0, "fetches": 0,
+          "fetch_errors": 0, "timeouts": 0, "evicted": 0, "over_fetch_limit": 0}
+
+
+def set_provider(provider):
+    """Swap the provider (tests, other vendors) and drop cached conditions."""
+    global _provider
+    with _lock:
+        _provider = provider
+        _cache.clear()
+        _failed.clear()
+
+
+def _get_provider():
+    if _provider is not None:
+        return _provider
+    api_key = os.getenv("OPENWEATHER_API_KEY")
+    if not api_key:
+        return None
+    set_provider(OpenWeatherProvider(api_key))
+    return _provider
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=WEATHER_FETCH_WORKERS, thread_name_prefix="weather")
+    return _executor
+
+
+def _fetch(provider, cell):
+    # one fetch per cell, at its center, so every order in the cell sees the same answer
+    lat, lng = geo.decode(cell)
+    _stats["fetches"] += 1
+    try:
+        condition = provider.fetch(lat, lng)
+    except Exception as e:
+        _stats["fetch_errors"] += 1
+        with _lock:
+            _store(_failed, cell, str(e), WEATHER_ERROR_TTL)
+            _inflight.pop(cell, None)
+        raise
+    with _lock:
+        _store(_cache, cell, condition, WEATHER_STALE_MAX)
+        _failed.pop(cell, None)
+        _inflight.pop(cell, None)
+    return condition
+
+
+def _store(entries, cell, value, max_age):
+    """Add a (value, now) entry; drop entries older than max_age or over WEATHER_CACHE_SIZE. Caller holds _lock."""
+    now = time.monotonic()
+    entries[cell] = (value, now)
+    entries.move_to_end(cell)
+    while entries:
+        oldest = next(iter(entries.values()))
+        if len(entries) <= WEATHER_CACHE_SIZE and now - oldest[1] <= max_age:
+            break
+        entries.popitem(last=False)
+        if entries is _cache:
+            _stats["evicted"] += 1
+
+
+def _start_fetch(provider, cell):
+    """Future for the cell's fetch, joining one already in flight. Caller holds _lock."""
+    future = _inflight.get(cell)
+    if future is not None:
+        _stats["coalesced"] += 1
+        return future
+    future = _get_executor().submit(_fetch, provider, cell)
+    _inflight[cell] = future
+    return future
+
+
+def _lookup(provider, cell, fetch=True):
+    """(condition, error, future, fetching): an answer from the cache, or the fetch
+    to wait for; fetching tells whether a fetch was started or joined. With
+    fetch=False nothing is fetched and a cell without a usable entry gets an error."""
+    now = time.monotonic()
+    with _lock:
+        cached = _cache.get(cell)
+        age = now - cached[1] if cached else None
+        if cached and age <= WEATHER_TTL:
+            _stats["hits"] += 1
+            return cached[0], None, None, False
+        failed = _failed.get(cell)
+        recently_failed = failed is not None and now - failed[1] < WEATHER_ERROR_TTL
+        if cached and age <= WEATHER_STALE_MAX:
+            # stale-while-revalidate: answer now, refresh in the background
+            _stats["stale_hits"] += 1
+            refresh = fetch and not recently_failed
+            if refresh:
+                _start_fetch(provider, cell)
+            return cached[0], None, None, refresh
+        if recently_failed:
+            return None, failed[0], None, False
+        if not fetch:
+            _stats["over_fetch_limit"] += 1
+            return None, "Weather fetch limit reached", None, False
+        _stats["misses"] += 1
+        return None, None, _start_fetch(provider, cell), True
+
+
+def _wait(future, timeout):
+    try:
+        return future.result(timeout=max(timeout, 0)), None
+    except FutureTimeout:
+        # the fetch keeps running and fills the cache for the next order
+        _stats["timeouts"] += 1
+        return None, "Weather lookup timed out"
+    except Exception as e:
+        return None, str(e)
+
+
+def get_weather(lat: float, lng: float):
+    """(condition, error) for a point; condition is None when nothing usable is known."""
+    provider = _get_provider()
+    if provider is None:
+        return None, "Missing weather API key"
+    condition, err, future, _ = _lookup(provider, geo.encode(lat, lng, WEATHER_GEOHASH_PRECISION))
+    if future is None:
+        return condition, err
+    return _wait(future, WEATHER_TIMEOUT)
+
+
+def get_weather_many(points, max_fetches=None):
+    """[(condition, error)] for [(lat, lng)]: one lookup per cell, all fetches in parallel.
+
+    At most max_fetches (default WEATHER_MAX_FETCHES_PER_CALL) cells are
+    fetched; cells beyond that are answered from the cache or not at all.
+    """
+    provider = _get_provider()
+    if provider is None:
+        return [(None, "Missing weather API key")] * len(points)
+    budget = WEATHER_MAX_FETCHES_PER_CALL if max_fetches is None else max_fetches
+    cells = [geo.encode(lat, lng, WEATHER_GEOHASH_PRECISION) for lat, lng in points]
+    pending = {}
+    for cell in dict.fromkeys(cells):
+        condition, err, future, fetching = _lookup(provider, cell, fetch=budget > 0)
+        budget -= fetching
+        pending[cell] = (condition, err, future)
+    deadline = time.monotonic() + WEATHER_TIMEOUT
+    results = {}
+    for cell, (condition, err, future) in pending.items():
+        results[cell] = (condition, err) if future is None else _wait(future, deadline - time.monotonic())
+    return [results[cell] for cell in cells]
+
+
+def stats():
+    return {"cells": len(_cache), "max_cells": WEATHER_CACHE_SIZE, "inflight": len(_inflight), "ttl": WEATHER_TTL,
+            **_stats}
@@ -1,4 +1,4 @@
-import { useState, ReactNode } from 'react';
+import { useState, useEffect, ReactNode } from 'react';
 import { Link, useNavigate, useLocation } from 'react-router-dom';
 import { motion, AnimatePresence } from 'framer-motion';
 import {
@@ -75,19 +75,51 @@ export default function DashboardLayout({ children, role, menuItems }: Dashboard
   const [showNotifications, setShowNotifications] = useState(false);
   const [notifications, setNotifications] = useState<any[]>([]);
   const [notificationCount, setNotificationCount] = useState(0);
+  const [notificationsCursor, setNotificationsCursor] = useState<string | null>(null);
   
   const { user, logout } = useAuth();
   const navigate = useNavigate();
   const location = useLocation();
   const theme = themes[role];
 
-  // Load notifications
+  // Unread badge, from the server-side counter
+  const loadNotificationCount = async () => {
+    try {
+      const response = await notificationApi.getUnreadCount();
+      if (response.ok) {
+        setNotificationCount(response.unread);
+      }
+    } catch (error) {
+      console.error('Error loading notification count:', error);
+    }
+  };
+
+  useEffect(() => {
+    loadNotificationCount();
+  }, []);
+
+  // Load the first page of notifications
   const loadNotifications = async () => {
     try {
       const response = await notificationApi.getNotifications();
       if (response.ok) {
         setNotifications(response.notifications);
-        setNotificationCount(response.notifications.filter((n: any) => !n.is_read).length);
+        setNotificationsCursor(response.next_cursor);
+      }
+    } catch (error) {
+      console.error('Error loading notifications:', error);
+    }
+    loadNotificationCount();
+  };
+
+  // Append the next page
+  const loadMoreNotifications = async () => {
+    if (!notificationsCursor) return;
+    try {
+      const response = await notificationApi.getNotifications(notificationsCursor);
+      if (response.ok) {
+        setNotifications((current) => [...current, ...response.notifications]);
+        setNotificationsCursor(response.next_cursor);
       }
     } catch (error) {
       console.error('Error loading notifications:', error);
@@ -98,7 +130,10 @@ export default function DashboardLayout({ children, role, menuItems }: Dashboard
   const markAsRead = async (notificationId: number) => {
     try {
       await notificationApi.markAsRead(notificationId);
-      loadNotifications();
+      setNotifications((current) =>
+        current.map((n) => (n.notification_id === notificationId ? { ...n, is_read: true } : n))
+      );
+      loadNotificationCount();
     } catch (error) {
       console.error('Error marking notification as read:', error);
     }
@@ -246,6 +281,14 @@ export default function DashboardLayout({ children, role, menuItems }: Dashboard
                           </p>
                         </div>
                       ))}
+                      {notificationsCursor && (
+                        <button
+                          onClick={loadMoreNotifications}
+                          className={`w-full p-3 text-sm font-medium ${theme.text} hover:bg-gray-50`}
+                        >
+                          Load more
+                        </button>
+                      )}
                     </div>
                   )}
                 </div>
@@ -16,10 +16,19 @@ export interface Notification {
 }
 
 export const notificationApi = {
-  // Get all notifications for current user
-  getNotifications: async () => {
+  // Get one page of notifications, newest first (pass next_cursor back as cursor)
+  getNotifications: async (cursor?: string) => {
     const response = await axios.get(`${API_BASE_URL}/notifications`, {
       headers: getAuthHeader(),
+      params: { cursor },
+    });
+    return response.data;
+  },
+
+  // Number of unread notifications, for the badge
+  getUnreadCount: async () => {
+    const response = await axios.get(`${API_BASE_URL}/notifications/unread-count`, {
+      headers: getAuthHeader(),
     });
     return response.data;
   },
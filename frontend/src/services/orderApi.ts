@@ -2,6 +2,9 @@ import axios from 'axios';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:5000';
 
+// largest page GET /orders serves (ORDERS_MAX_PAGE_SIZE)
+const ORDERS_PAGE_LIMIT = 200;
+
 const getAuthHeader = () => {
   const token = sessionStorage.getItem('token');
   return token ? { Authorization: `Bearer ${token}` } : {};
@@ -51,6 +54,14 @@ export interface CreateOrderRequest {
   notes?: string;
 }
 
+const getOrdersPage = async (cursor?: string, limit?: number) => {
+  const response = await axios.get(`${API_BASE_URL}/orders`, {
+    headers: getAuthHeader(),
+    params: { cursor, limit },
+  });
+  return response.data;
+};
+
 export const orderApi = {
   // Create new order
   createOrder: async (data: CreateOrderRequest) => {
@@ -60,12 +71,20 @@ export const orderApi = {
     return response.data;
   },
 
-  // Get customer's orders
+  // Get one page of the user's orders, newest first (pass next_cursor back as cursor)
+  getOrdersPage,
+
+  // Get all of the user's orders, following the pages
   getMyOrders: async () => {
-    const response = await axios.get(`${API_BASE_URL}/orders`, {
-      headers: getAuthHeader(),
-    });
-    return response.data;
+    const orders: Order[] = [];
+    let cursor: string | undefined;
+    do {
+      const data = await getOrdersPage(cursor, ORDERS_PAGE_LIMIT);
+      if (!data.ok) return data;
+      orders.push(...data.orders);
+      cursor = data.next_cursor || undefined;
+    } while (cursor);
+    return { ok: true, orders };
   },
 
   // Cancel order